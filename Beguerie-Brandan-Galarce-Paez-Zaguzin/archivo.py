@@ -0,0 +1,134 @@
+from peewee import fn
+
+from carga_sombra import cargar_en_sombra
+from esquema import crear_tablas, subir_secuencia, tiene_autoincremento
+
+# Archivo de obras terminadas (particionado caliente / histórico).
+#
+# Las obras finalizadas o rescindidas no vuelven a cambiar, pero seguían en la misma
+# tabla que usan los métodos del ciclo de vida y la búsqueda de duplicados de la carga.
+# archivar() las mueve por lotes a '<tabla>_archivo' (por ejemplo 'obras_archivo'), con
+# las mismas columnas e ids, y mantiene una vista '<tabla>_historico' que las une:
+#
+#   CREATE VIEW obras_historico AS
+#       SELECT <columnas> FROM obras UNION ALL SELECT <columnas> FROM obras_archivo
+#
+# modelo_historico(Obra) es un modelo de solo lectura sobre esa vista, así las consultas
+# históricas (indicadores, listados, obra por id) se escriben igual que sobre Obra.
+# La vista nombra la tabla en uso y no su contenido, así que sigue funcionando después
+# de una carga en sombra (carga_sombra.py intercambia las tablas con legacy_alter_table).
+#
+# Como las obras conservan su id al archivarse, la tabla en uso tiene que ser AUTOINCREMENT:
+# sin eso SQLite le da a la próxima obra el mayor id que quedó en la tabla más uno, que puede
+# ser el de una obra recién archivada, y la vista mostraría dos obras con el mismo id.
+# Las bases creadas antes se adaptan con migrar_autoincremento().
+
+ETAPAS_TERMINADAS = ('Finalizada', 'Rescindida')
+
+_modelos = {}
+
+
+def _submodelo(modelo, sufijo):
+    clave = (modelo, sufijo)
+    if clave not in _modelos:
+        class Meta:
+            table_name = f'{modelo._meta.table_name}_{sufijo}'
+        nombre = f'{modelo.__name__}{sufijo.capitalize()}'
+        _modelos[clave] = type(nombre, (modelo,), {'Meta': Meta, '__module__': modelo.__module__})
+    return _modelos[clave]
+
+
+def modelo_archivo(modelo):
+    """Subclase del modelo ligada a la tabla de archivo ('<tabla>_archivo')."""
+    return _submodelo(modelo, 'archivo')
+
+
+def modelo_historico(modelo):
+    """Subclase del modelo ligada a la vista '<tabla>_historico' (tabla en uso + archivo). Solo lectura."""
+    return _submodelo(modelo, 'historico')
+
+
+def hay_archivo(modelo):
+    return modelo_archivo(modelo).table_exists()
+
+
+def modelo_de_lectura(modelo):
+    """El modelo de la vista histórica si ya se archivó alguna vez; si no, el modelo mismo."""
+    return modelo_historico(modelo) if hay_archivo(modelo) else modelo
+
+
+def _columnas(modelo):
+    return ', '.join(f'"{campo.column_name}"' for campo in modelo._meta.sorted_fields)
+
+
+def crear_vista_historico(modelo):
+    """(Re)crea la vista histórica con las columnas actuales del modelo."""
+    db = modelo._meta.database
+    vista = modelo_historico(modelo)._meta.table_name
+    columnas = _columnas(modelo)
+    with db.atomic():
+        db.execute_sql(f'DROP VIEW IF EXISTS "{vista}"')
+        db.execute_sql(f'CREATE VIEW "{vista}" AS '
+                       f'SELECT {columnas} FROM "{modelo._meta.table_name}" UNION ALL '
+                       f'SELECT {columnas} FROM "{modelo_archivo(modelo)._meta.table_name}"')
+
+
+def reservar_ids_archivados(modelo):
+    """Deja el contador de ids de la tabla en uso por encima del mayor id que está en el archivo."""
+    archivo = modelo_archivo(modelo)
+    if archivo.table_exists():
+        maximo = archivo.select(fn.MAX(archivo.id)).scalar()
+        if maximo:
+            subir_secuencia(modelo._meta.database, modelo._meta.table_name, maximo)
+
+
+def migrar_autoincremento(modelo, despues_de_intercambio=None):
+    """
+    Recrea como AUTOINCREMENT la tabla de una base creada cuando Obra.id era un AutoField común:
+    una carga en sombra que solo copia las filas existentes (con sus ids). Después reserva
+    los ids ya archivados. Es idempotente. Deja la conexión abierta.
+    """
+    db = modelo._meta.database
+    if tiene_autoincremento(db, modelo._meta.table_name):
+        return False
+    print(f"Recreando la tabla '{modelo._meta.table_name}' con ids AUTOINCREMENT...")
+    cargar_en_sombra(modelo, lambda sombra: None, despues_de_intercambio=despues_de_intercambio)
+    db.connect(reuse_if_open=True)
+    reservar_ids_archivados(modelo)
+    return True
+
+
+def archivar(modelo, etapas=ETAPAS_TERMINADAS, filas_por_lote=1000):
+    """
+    Mueve a la tabla de archivo las obras cuya etapa está en `etapas`, de a `filas_por_lote`.
+    Cada lote (INSERT ... SELECT + DELETE) va en su propia transacción corta, así los
+    demás procesos pueden escribir entre lote y lote. Retorna la cantidad de obras movidas.
+    La tabla tiene que ser AUTOINCREMENT (ver migrar_autoincremento()); si no, se lanza ValueError.
+    """
+    db = modelo._meta.database
+    if not tiene_autoincremento(db, modelo._meta.table_name):
+        raise ValueError(f"La tabla '{modelo._meta.table_name}' no es AUTOINCREMENT: archivar haría que se "
+                         f"reusen ids archivados. Corré mapear_orm() para migrarla.")
+    archivo = modelo_archivo(modelo)
+    crear_tablas(db, [archivo])
+    crear_vista_historico(modelo)
+
+    tabla, tabla_archivo, columnas = modelo._meta.table_name, archivo._meta.table_name, _columnas(modelo)
+    movidas = ultimo_id = 0
+    while True:
+        with db.atomic():
+            ids = [obra_id for (obra_id,) in (modelo
+                                              .select(modelo.id)
+                                              .where((modelo.id > ultimo_id) & modelo.etapa.in_(etapas))
+                                              .order_by(modelo.id)
+                                              .limit(filas_por_lote)
+                                              .tuples())]
+            if not ids:
+                break
+            marcas = ', '.join('?' * len(ids))
+            db.execute_sql(f'INSERT INTO "{tabla_archivo}" ({columnas}) '
+                           f'SELECT {columnas} FROM "{tabla}" WHERE id IN ({marcas})', ids)
+            db.execute_sql(f'DELETE FROM "{tabla}" WHERE id IN ({marcas})', ids)
+        movidas += len(ids)
+        ultimo_id = ids[-1]
+    return movidas
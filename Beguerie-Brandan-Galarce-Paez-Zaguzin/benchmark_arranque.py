@@ -0,0 +1,75 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Benchmark de arranque en frío del comando 'indicadores'.
+#
+# Lanza `python cli.py --db <temporal> indicadores` varias veces en procesos nuevos
+# y mide el tiempo total de cada uno. Además verifica que el comando no haya
+# importado pandas. Termina con código 1 si la mediana supera el límite o si pandas
+# se importó, así se puede usar como chequeo antes de publicar cambios.
+#
+#   python benchmark_arranque.py [--repeticiones 10] [--limite 0.5]
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+CLI = os.path.join(DIRECTORIO, 'cli.py')
+
+# Corre el comando dentro del mismo intérprete y reporta si pandas quedó importado
+VERIFICAR_PANDAS = (
+    "import sys, contextlib, io; sys.path.insert(0, {directorio!r}); import cli\n"
+    "with contextlib.redirect_stdout(io.StringIO()): cli.main(['--db', {db!r}, 'indicadores'])\n"
+    "print('pandas' in sys.modules)"
+)
+
+
+def medir_arranque(ruta_db, repeticiones):
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        subprocess.run([sys.executable, CLI, '--db', ruta_db, 'indicadores'],
+                       check=True, stdout=subprocess.DEVNULL)
+        tiempos.append(time.perf_counter() - inicio)
+    return tiempos
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide el arranque en frío de 'cli.py indicadores'.")
+    parser.add_argument('--repeticiones', type=int, default=10)
+    parser.add_argument('--limite', type=float, default=0.5, help="Mediana máxima aceptada, en segundos.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta_db = os.path.join(directorio, 'obras_benchmark.db')
+        # Creamos las tablas vacías antes de medir (esto sí importa pandas, pero fuera de la medición)
+        subprocess.run([sys.executable, '-c',
+                        f"import sys; sys.path.insert(0, {DIRECTORIO!r}); import cli; "
+                        f"from gestionar_obras2 import GestionarObra; cli._preparar_db({ruta_db!r}); "
+                        f"GestionarObra.mapear_orm()"],
+                       check=True, stdout=subprocess.DEVNULL)
+
+        tiempos = medir_arranque(ruta_db, args.repeticiones)
+        salida = subprocess.run([sys.executable, '-c', VERIFICAR_PANDAS.format(directorio=DIRECTORIO, db=ruta_db)],
+                                check=True, capture_output=True, text=True).stdout.strip()
+
+    mediana = statistics.median(tiempos)
+    importa_pandas = salida.endswith('True')
+    print(f"Arranque de 'indicadores' ({args.repeticiones} repeticiones): "
+          f"mediana {mediana * 1000:.0f} ms, mínimo {min(tiempos) * 1000:.0f} ms, máximo {max(tiempos) * 1000:.0f} ms")
+    print(f"pandas importado por el comando: {'sí' if importa_pandas else 'no'}")
+
+    if importa_pandas:
+        print("ERROR: 'indicadores' no debería importar pandas.")
+        return 1
+    if mediana > args.limite:
+        print(f"ERROR: la mediana supera el límite de {args.limite * 1000:.0f} ms.")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
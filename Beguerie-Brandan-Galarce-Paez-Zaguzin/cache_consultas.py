@@ -0,0 +1,100 @@
+import inspect
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+# Caché de resultados de consultas de lectura (indicadores, listados, obra por id).
+#
+# Cada resultado se guarda junto con la versión de los datos con la que se calculó
+# (ver modelo_orm2.version_datos(), que mantienen los triggers de la tabla de obras).
+# Antes de devolver un resultado guardado se lee la versión actual, que es una lectura por
+# clave primaria: si los datos cambiaron (ciclo de vida, cargas, nueva_obra, intercambio de
+# tablas en sombra) se descarta todo lo guardado, así nunca se devuelve un resultado viejo.
+#
+# Uso:
+#   cache = CacheConsultas(version=version_datos, max_entradas=256)
+#
+#   @cache.cacheada()
+#   def contar_por_barrio(barrio): ...
+#
+# Los resultados se comparten entre quienes llaman: hay que tratarlos como de solo lectura.
+# Las funciones cacheadas tienen que llamarse con una conexión abierta (la usa la versión).
+
+
+class CacheConsultas:
+    def __init__(self, version, max_entradas=256):
+        """
+        - version: función sin argumentos que retorna la versión actual de los datos.
+        - max_entradas: cantidad máxima de resultados guardados; al pasarla se descarta
+          el usado hace más tiempo (LRU).
+        """
+        self.version = version
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict() # clave -> resultado, del menos al más usado
+        self._version_entradas = None # Versión de los datos de todo lo guardado
+        self._lock = threading.Lock()
+        self.aciertos = self.fallos = self.desalojos = self.invalidaciones = 0
+
+    def obtener(self, clave, calcular):
+        """Retorna el resultado guardado para `clave` o lo calcula con calcular() y lo guarda."""
+        version = self.version()
+        with self._lock:
+            if version != self._version_entradas:
+                if self._entradas:
+                    self.invalidaciones += 1
+                self._entradas.clear()
+                self._version_entradas = version
+            if clave in self._entradas:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return self._entradas[clave]
+            self.fallos += 1
+
+        # Se calcula fuera del lock para no frenar a los demás hilos durante la consulta
+        resultado = calcular()
+        with self._lock:
+            if version == self._version_entradas:
+                self._entradas[clave] = resultado
+                self._entradas.move_to_end(clave)
+                while len(self._entradas) > self.max_entradas:
+                    self._entradas.popitem(last=False)
+                    self.desalojos += 1
+        return resultado
+
+    def cacheada(self, nombre=None):
+        """
+        Decorador: guarda el resultado de la función según su nombre y sus argumentos.
+        Los argumentos se normalizan con la firma de la función, así f(1), f(x=1) y
+        f() con x=1 por defecto comparten la misma entrada.
+        """
+        def decorador(funcion):
+            firma = inspect.signature(funcion)
+            nombre_consulta = nombre or funcion.__qualname__
+
+            @wraps(funcion)
+            def envoltura(*args, **kwargs):
+                argumentos = firma.bind(*args, **kwargs)
+                argumentos.apply_defaults()
+                clave = (nombre_consulta, tuple(argumentos.arguments.items()))
+                return self.obtener(clave, lambda: funcion(*args, **kwargs))
+            return envoltura
+        return decorador
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._version_entradas = None
+
+    def estadisticas(self):
+        """Retorna aciertos, fallos, desalojos, invalidaciones, entradas guardadas y tasa de aciertos."""
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                'aciertos': self.aciertos,
+                'fallos': self.fallos,
+                'desalojos': self.desalojos,
+                'invalidaciones': self.invalidaciones,
+                'entradas': len(self._entradas),
+                'max_entradas': self.max_entradas,
+                'tasa_aciertos': round(self.aciertos / consultas, 3) if consultas else 0.0,
+            }
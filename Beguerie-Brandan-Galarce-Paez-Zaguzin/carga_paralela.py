@@ -0,0 +1,186 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from peewee import SqliteDatabase
+from modelo_orm import db, TipoObra, AreaResponsable, Barrio, Obra
+from archivo import hay_archivo, modelo_archivo
+from empresas import ResolvedorEmpresas
+from mapeo_filas import FILAS_POR_INSERT, a_valores
+
+# Carga en paralelo del esquema con claves foráneas (modelo_orm).
+#
+# SQLite admite un solo escritor por archivo, así que la carga secuencial no puede usar
+# más de un núcleo. Acá el DataFrame limpio se parte en particiones (por comuna o por
+# hash de nombre/barrio), cada proceso escribe su partición en un archivo SQLite temporal
+# propio y al final se unen en la base principal con ATTACH + INSERT ... SELECT.
+# Cada fila lleva como id de la partición su posición en el CSV y la unión lee todas las
+# particiones a la vez ordenando por ese id, así las obras reciben los ids en el orden
+# del CSV, como en la carga secuencial, y entre obras repetidas queda la primera.
+#
+# Lo caro de la carga es armar e insertar las filas, que corre en los procesos; la unión
+# es un único INSERT ... SELECT dentro de SQLite (con 100.000 filas, más o menos un 5%
+# del total).
+#
+# Los ids de TipoObra, AreaResponsable, Barrio y Empresa se resuelven antes de repartir, en el
+# proceso principal y contra la base principal, así que todas las particiones usan los
+# mismos ids y la unión no tiene que traducir nada.
+
+# Tablas de referencia: campo de Obra -> (modelo, columna del DataFrame). Las demás columnas
+# salen de GestionarObra.MAPEO_FILAS (ver mapeo_filas.py), que comparte con la carga secuencial.
+REFERENCIAS = {
+    'tipo': (TipoObra, 'tipo_obra'),
+    'area': (AreaResponsable, 'area'),
+    'barrio': (Barrio, 'barrio'),
+}
+
+# SQLite adjunta hasta 10 bases por conexión (SQLITE_MAX_ATTACHED) y la unión las adjunta todas
+MAX_PARTICIONES = 10
+
+
+def resolver_referencias(df, empresas=None):
+    """
+    Crea en la base principal los tipos, áreas y barrios que falten y retorna, para cada
+    campo de referencia, un diccionario nombre -> id. Se hace una sola vez y en el proceso
+    principal, así los ids son los mismos en todas las particiones. Las empresas se resuelven
+    aparte (ver empresas.py), con el ResolvedorEmpresas indicado o uno nuevo, y quedan como la
+    lista de ids 'empresa', en el orden de las filas.
+    """
+    ids = {}
+    with db.atomic():
+        for campo, (modelo, columna) in REFERENCIAS.items():
+            nombres = df[columna].dropna().unique().tolist()
+            for lote in range(0, len(nombres), FILAS_POR_INSERT):
+                filas = [{'nombre': nombre} for nombre in nombres[lote:lote + FILAS_POR_INSERT]]
+                modelo.insert_many(filas).on_conflict_ignore().execute()
+            ids[campo] = dict(modelo.select(modelo.nombre, modelo.id).tuples())
+        ids['empresa'] = (empresas or ResolvedorEmpresas()).resolver_columnas(
+            df['empresa_licitacion'] if 'empresa_licitacion' in df.columns else [None] * len(df),
+            df['cuit_contratista'] if 'cuit_contratista' in df.columns else [None] * len(df))
+    return ids
+
+
+def preparar_registros(df, ids, mapeo):
+    """
+    Convierte el DataFrame en una lista de tuplas listas para Obra.insert_many(), en el
+    orden de mapeo.nombres. Los ids de referencia se pasan a cada columna entera con map().
+    """
+    calculados = {campo: a_valores(df[columna].map(ids[campo])) for campo, (_, columna) in REFERENCIAS.items()}
+    calculados['empresa'] = ids['empresa']
+    return list(mapeo.filas(Obra, df, **calculados))
+
+
+def particionar(df, procesos, particion='comuna'):
+    """
+    Reparte las filas en `procesos` grupos.
+    - 'comuna': cada comuna queda entera en un mismo grupo (las más grandes se reparten primero).
+    - 'hash': por hash de (nombre, barrio), que reparte parejo aunque las comunas sean desiguales.
+    Retorna una lista de arreglos de posiciones.
+    """
+    import pandas as pd
+
+    if particion == 'hash':
+        grupo = pd.util.hash_pandas_object(df[['nombre', 'barrio']], index=False) % procesos
+        return [(grupo.values == i).nonzero()[0] for i in range(procesos) if (grupo.values == i).any()]
+    if particion != 'comuna':
+        raise ValueError(f"Partición no admitida: '{particion}'. Opciones: comuna, hash")
+
+    comunas = df['comuna'] if 'comuna' in df.columns else pd.Series([None] * len(df))
+    por_comuna = pd.Series(range(len(df))).groupby(comunas.astype(object).values, dropna=False).indices
+    grupos = [[] for _ in range(procesos)]
+    tamanos = [0] * procesos
+    for posiciones in sorted(por_comuna.values(), key=len, reverse=True):
+        menor = tamanos.index(min(tamanos)) # La comuna va al grupo más liviano hasta ahora
+        grupos[menor].extend(posiciones)
+        tamanos[menor] += len(posiciones)
+    return [sorted(grupo) for grupo in grupos if grupo]
+
+
+def _cargar_particion(ruta, nombres, registros):
+    """
+    Proceso hijo: escribe una partición (tuplas con los campos `nombres`) en su propio archivo SQLite.
+    Retorna (ruta, filas_recibidas, filas_escritas).
+    """
+    # Archivo descartable: no hace falta diario ni sincronizar con el disco
+    db_particion = SqliteDatabase(ruta, pragmas={'journal_mode': 'off', 'synchronous': 0})
+    with db_particion.bind_ctx([Obra], bind_refs=False, bind_backrefs=False):
+        db_particion.connect()
+        db_particion.create_tables([Obra])
+        with db_particion.atomic():
+            for lote in range(0, len(registros), FILAS_POR_INSERT):
+                # OR IGNORE descarta las filas repetidas o que no cumplen las restricciones NOT NULL
+                Obra.insert_many(registros[lote:lote + FILAS_POR_INSERT],
+                                 fields=[getattr(Obra, nombre) for nombre in nombres]).on_conflict_ignore().execute()
+        escritas = Obra.select().count()
+        db_particion.close()
+    return ruta, len(registros), escritas
+
+
+def unir_particiones(rutas):
+    """
+    Copia los archivos de partición a la tabla de obras de la base principal con ATTACH,
+    en un solo INSERT ... SELECT ordenado por el id de las particiones (la posición en el CSV).
+    INSERT OR IGNORE descarta las obras que ya estaban (índice único nombre + barrio),
+    y las que ya están en el archivo de obras terminadas tampoco se vuelven a agregar.
+    Retorna la cantidad de filas agregadas.
+    """
+    tabla = Obra._meta.table_name
+    columnas = ', '.join(f'"{campo.column_name}"' for campo in Obra._meta.sorted_fields if campo.name != 'id')
+    filtro_archivo = ''
+    if hay_archivo(Obra):
+        filtro_archivo = (f'WHERE NOT EXISTS (SELECT 1 FROM "{modelo_archivo(Obra)._meta.table_name}" AS a '
+                          f'WHERE a.nombre = p.nombre AND a."{Obra.barrio.column_name}" = p."{Obra.barrio.column_name}") ')
+    if not rutas:
+        return 0
+    adjuntas = []
+    try:
+        for numero, ruta in enumerate(rutas):
+            alias = f'particion_{numero}'
+            db.execute_sql('ATTACH DATABASE ? AS ' + alias, (ruta,)) # ATTACH no puede ir dentro de una transacción
+            adjuntas.append(alias)
+        particiones = ' UNION ALL '.join(f'SELECT id, {columnas} FROM {alias}."{tabla}"' for alias in adjuntas)
+        with db.atomic():
+            cursor = db.execute_sql(f'INSERT OR IGNORE INTO "{tabla}" ({columnas}) '
+                                    f'SELECT {columnas} FROM ({particiones}) AS p {filtro_archivo}ORDER BY p.id')
+            return max(cursor.rowcount, 0)
+    finally:
+        for alias in adjuntas:
+            db.execute_sql('DETACH DATABASE ' + alias)
+
+
+def cargar_en_paralelo(df, mapeo, procesos=None, particion='comuna'):
+    """
+    Carga el DataFrame limpio en la tabla de obras usando varios procesos (hasta MAX_PARTICIONES).
+    mapeo es el MapeoFilas de las columnas a los campos de Obra (GestionarObra.MAPEO_FILAS).
+    Retorna un diccionario con las filas recibidas, las escritas en las particiones y las agregadas.
+    """
+    procesos = min(procesos or os.cpu_count() or 1, MAX_PARTICIONES)
+    db.connect(reuse_if_open=True)
+    ids = resolver_referencias(df)
+    registros = preparar_registros(df, ids, mapeo)
+    grupos = particionar(df, procesos, particion)
+    print(f"Carga en paralelo: {len(registros)} filas en {len(grupos)} particiones ({particion}).")
+
+    directorio = tempfile.mkdtemp(prefix='obras_particiones_')
+    try:
+        rutas = [os.path.join(directorio, f'particion_{numero}.db') for numero in range(len(grupos))]
+        # Los hijos heredarían la conexión abierta de SQLite al hacer fork: se cierra antes de crearlos
+        db.close()
+        with ProcessPoolExecutor(max_workers=min(procesos, len(grupos) or 1)) as executor:
+            # La posición en el CSV va como id de la partición, para unirlas en ese orden
+            resultados = list(executor.map(
+                _cargar_particion, rutas, [['id'] + mapeo.nombres] * len(rutas),
+                [[(posicion,) + registros[posicion] for posicion in grupo] for grupo in grupos]))
+        escritas = sum(resultado[2] for resultado in resultados)
+        db.connect()
+        agregadas = unir_particiones(rutas)
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+        db.close()
+
+    resumen = {'filas': len(registros), 'escritas_en_particiones': escritas, 'agregadas': agregadas}
+    print(f"Carga en paralelo completada. Filas: {resumen['filas']}. "
+          f"Descartadas en las particiones (datos inválidos o repetidos): {len(registros) - escritas}. "
+          f"Ya existentes en la base: {escritas - agregadas}. Agregadas: {agregadas}.")
+    return resumen
@@ -0,0 +1,126 @@
+import time
+
+from esquema import secuencia, subir_secuencia, tiene_autoincremento
+
+# Carga "azul/verde" sobre una tabla de sombra.
+#
+# En lugar de escribir directamente en la tabla de obras que leen los tableros,
+# los datos se cargan e indexan en una tabla aparte (<tabla>_azul o <tabla>_verde),
+# confirmando por lotes. Cuando la carga termina, las tablas se intercambian con dos
+# ALTER TABLE ... RENAME dentro de una transacción corta, así el bloqueo de escritura
+# sobre la tabla que se consulta dura milisegundos en lugar de toda la carga.
+#
+# Los nombres de índice de SQLite no se pueden renombrar, así que la tabla nueva queda
+# con los índices de la sombra ('obraazul_...'). Por eso se alternan dos colores: la
+# próxima carga usa el color que la tabla en uso no tiene, y los nombres nunca chocan.
+# Ver también esquema.crear_tablas(), que evita duplicar esos índices al mapear el ORM.
+#
+# La sombra arranca con el contador de ids (AUTOINCREMENT) de la tabla en uso, así después
+# del intercambio no se vuelven a dar ids que ya se usaron, como los de las obras archivadas.
+
+COLORES = ('azul', 'verde')
+
+_modelos_sombra = {}
+
+
+def modelo_sombra(modelo, color):
+    """Retorna (y recuerda) una subclase del modelo ligada a la tabla de sombra del color indicado."""
+    clave = (modelo, color)
+    if clave not in _modelos_sombra:
+        class Meta:
+            table_name = f'{modelo._meta.table_name}_{color}'
+        nombre = f'{modelo.__name__}{color.capitalize()}'
+        _modelos_sombra[clave] = type(nombre, (modelo,), {'Meta': Meta, '__module__': modelo.__module__})
+    return _modelos_sombra[clave]
+
+
+def _indices_de(db, tabla):
+    return [fila[1] for fila in db.execute_sql(f'PRAGMA index_list("{tabla}")').fetchall()]
+
+
+def elegir_color(modelo):
+    """Elige el color cuya sombra no comparte nombres de índice con la tabla en uso."""
+    db = modelo._meta.database
+    indices_en_uso = _indices_de(db, modelo._meta.table_name)
+    for color in COLORES:
+        prefijo = modelo_sombra(modelo, color)._meta.name + '_'
+        if not any(nombre.startswith(prefijo) for nombre in indices_en_uso):
+            return color
+    return COLORES[0]
+
+
+def _columnas(modelo):
+    return ', '.join(f'"{campo.column_name}"' for campo in modelo._meta.sorted_fields)
+
+
+def intercambiar_tablas(modelo, sombra, despues_de_intercambio=None):
+    """
+    Pone la tabla de sombra en lugar de la tabla en uso, dentro de una transacción IMMEDIATE.
+    La tabla anterior se borra después de confirmar, fuera del bloqueo.
+    Retorna los segundos que duró el bloqueo.
+    """
+    db = modelo._meta.database
+    tabla = modelo._meta.table_name
+    tabla_anterior = f'{tabla}_anterior'
+
+    db.execute_sql(f'DROP TABLE IF EXISTS "{tabla_anterior}"')
+    # Con legacy_alter_table SQLite no reescribe las vistas que nombran a la tabla:
+    # después del intercambio siguen apuntando a '<tabla>', que ahora es la tabla nueva.
+    db.execute_sql('PRAGMA legacy_alter_table = ON')
+    try:
+        inicio = time.perf_counter()
+        with db.atomic('IMMEDIATE'):
+            # Los triggers pertenecen a la tabla vieja; se borran para poder recrearlos sobre la nueva
+            triggers = db.execute_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ?", (tabla,)).fetchall()
+            for (nombre,) in triggers:
+                db.execute_sql(f'DROP TRIGGER "{nombre}"')
+            db.execute_sql(f'ALTER TABLE "{tabla}" RENAME TO "{tabla_anterior}"')
+            db.execute_sql(f'ALTER TABLE "{sombra._meta.table_name}" RENAME TO "{tabla}"')
+            if despues_de_intercambio is not None:
+                despues_de_intercambio()
+        bloqueo = time.perf_counter() - inicio
+    finally:
+        db.execute_sql('PRAGMA legacy_alter_table = OFF')
+
+    db.execute_sql(f'DROP TABLE IF EXISTS "{tabla_anterior}"')
+    return bloqueo
+
+
+def cargar_en_sombra(modelo, cargar, conservar_existentes=True, despues_de_intercambio=None):
+    """
+    Carga datos en una tabla de sombra del modelo y después la intercambia con la tabla en uso.
+
+    - cargar: función que recibe el modelo de sombra y lo llena (por ejemplo la carga de
+      GestionarObra con modelo=sombra). Debería confirmar por lotes para no retener el
+      bloqueo de escritura de la base durante toda la carga.
+    - conservar_existentes: copia primero las filas actuales a la sombra, de modo que la carga
+      se comporta como sobre la tabla en uso (las obras creadas a mano no se pierden).
+      Lo que se escriba en la tabla en uso mientras dura la carga no se copia: conviene no
+      correr actualizaciones del ciclo de vida durante una recarga.
+    - despues_de_intercambio: función opcional que se ejecuta dentro de la transacción del
+      intercambio (por ejemplo para recrear triggers sobre la tabla nueva).
+    """
+    db = modelo._meta.database
+    db.connect(reuse_if_open=True)
+    color = elegir_color(modelo)
+    sombra = modelo_sombra(modelo, color)
+
+    # Por si quedó una sombra a medio cargar de una ejecución anterior
+    db.drop_tables([sombra], safe=True)
+    db.create_tables([sombra])
+    if tiene_autoincremento(db, modelo._meta.table_name):
+        subir_secuencia(db, sombra._meta.table_name, secuencia(db, modelo._meta.table_name))
+    if conservar_existentes:
+        with db.atomic():
+            db.execute_sql(f'INSERT INTO "{sombra._meta.table_name}" ({_columnas(modelo)}) '
+                           f'SELECT {_columnas(modelo)} FROM "{modelo._meta.table_name}"')
+    print(f"Cargando en la tabla de sombra '{sombra._meta.table_name}'...")
+
+    cargar(sombra)
+
+    db.connect(reuse_if_open=True) # La función de carga puede haber cerrado la conexión
+    bloqueo = intercambiar_tablas(modelo, sombra, despues_de_intercambio)
+    print(f"Tabla '{modelo._meta.table_name}' reemplazada por la carga nueva "
+          f"(bloqueo de escritura: {bloqueo * 1000:.1f} ms).")
+    db.close()
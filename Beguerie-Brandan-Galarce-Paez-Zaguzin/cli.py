@@ -0,0 +1,186 @@
+import argparse
+import csv
+import json
+import sys
+
+# Punto de entrada de línea de comandos.
+#
+#   python cli.py load [--csv RUTA]          Crea las tablas y carga el CSV completo.
+#   python cli.py sync [--csv RUTA]          Carga solo las obras del CSV que todavía no están en la base.
+#                                            load y sync aceptan --sombra para cargar en una tabla aparte
+#                                            e intercambiarla al final (ver carga_sombra.py), y --nomenclador
+#                                            para ubicar las obras sin coordenadas (ver geocodificacion.py).
+#   python cli.py indicadores [--json]       Muestra los indicadores de obras.
+#   python cli.py export --salida RUTA       Exporta las obras a CSV (o JSONL si la ruta termina en .jsonl).
+#   python cli.py archivar [--lote N]        Mueve las obras finalizadas y rescindidas a la tabla de archivo.
+#   python cli.py snapshot [--fecha F]       Guarda la foto diaria de los indicadores (para correr una vez por día).
+#   python cli.py tendencia [--dimension D --valor V --metrica M --periodo P --desde F --hasta F] [--json]
+#                                            Serie de un indicador a partir de las fotos diarias.
+#
+# Este módulo solo importa lo mínimo al arrancar. GestionarObra (y con él el modelo)
+# se importa dentro de cada comando, y pandas solamente lo cargan extraer_datos() y
+# limpiar_datos(), así que 'indicadores' y 'export' arrancan sin pagar la importación de pandas.
+
+CSV_POR_DEFECTO = 'observatorio-de-obras-urbanas.csv'
+
+
+def _preparar_db(ruta_db):
+    """Apunta el modelo a la base indicada (por defecto la de modelo_orm2) y retorna la base."""
+    from modelo_orm2 import db
+    if ruta_db:
+        db.init(ruta_db)
+    return db
+
+
+def comando_load(args):
+    from gestionar_obras2 import GestionarObra
+    GestionarObra.mapear_orm()
+    df = GestionarObra.limpiar_datos(GestionarObra.extraer_datos(args.csv, args.motor))
+    if df is None:
+        return 1
+    df = GestionarObra.geocodificar_datos(df, args.nomenclador)
+    GestionarObra.cargar_datos(df, args.rechazos, en_sombra=args.sombra)
+    return 0
+
+
+def comando_sync(args):
+    from gestionar_obras2 import GestionarObra
+    GestionarObra.mapear_orm()
+    df = GestionarObra.limpiar_datos(GestionarObra.extraer_datos(args.csv, args.motor))
+    if df is None:
+        return 1
+    df = GestionarObra.geocodificar_datos(df, args.nomenclador)
+    GestionarObra.sincronizar_datos(df, args.rechazos, en_sombra=args.sombra)
+    return 0
+
+
+def comando_indicadores(args):
+    from gestionar_obras2 import GestionarObra
+    if args.json:
+        db = _preparar_db(None)
+        with db.connection_context():
+            indicadores = GestionarObra.calcular_indicadores()
+        print(json.dumps(indicadores, ensure_ascii=False, indent=2))
+        return 0
+    return 0 if GestionarObra.obtener_indicadores() is not None else 1
+
+
+def comando_export(args):
+    from gestionar_obras2 import GestionarObra
+    from modelo_orm2 import Obra
+    from archivo import modelo_de_lectura
+    db = _preparar_db(None)
+    campos = GestionarObra.CAMPOS_LECTURA
+
+    cantidad = 0
+    with db.connection_context(), open(args.salida, 'w', encoding='utf-8', newline='') as archivo:
+        # Filas livianas (namedtuples) leídas de a una, sin guardar en memoria las ya escritas
+        fuente = modelo_de_lectura(Obra) # Incluye las obras archivadas
+        filas = fuente.filas_livianas(campos, fuente.select().order_by(fuente.id))
+        if args.salida.endswith('.jsonl'):
+            for fila in filas:
+                archivo.write(json.dumps(fila._asdict(), ensure_ascii=False, default=str) + '\n')
+                cantidad += 1
+        else:
+            escritor = csv.writer(archivo)
+            escritor.writerow(campos)
+            for fila in filas:
+                escritor.writerow(fila)
+                cantidad += 1
+    print(f"Se exportaron {cantidad} obras a '{args.salida}'.")
+    return 0
+
+
+def comando_archivar(args):
+    from gestionar_obras2 import GestionarObra
+    GestionarObra.mapear_orm()
+    GestionarObra.archivar_obras(args.lote)
+    return 0
+
+
+def comando_snapshot(args):
+    from gestionar_obras2 import GestionarObra
+    GestionarObra.mapear_orm()
+    GestionarObra.tomar_snapshot_indicadores(args.fecha)
+    return 0
+
+
+def comando_tendencia(args):
+    from gestionar_obras2 import GestionarObra
+    db = _preparar_db(None)
+    try:
+        with db.connection_context():
+            serie = GestionarObra.tendencia_indicador(args.dimension, args.valor, args.metrica, args.periodo,
+                                                      args.desde, args.hasta)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+    if args.json:
+        print(json.dumps([[inicio.isoformat(), valor] for inicio, valor in serie], ensure_ascii=False))
+        return 0
+    if not serie:
+        print("No hay snapshots de indicadores en ese rango (ver 'python cli.py snapshot').")
+    for inicio, valor in serie:
+        print(f"{inicio.isoformat()}  {valor}")
+    return 0
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description="Gestión de obras urbanas.")
+    parser.add_argument('--db', default=None, help="Ruta de la base SQLite (por defecto obras_urbanas.db).")
+    subcomandos = parser.add_subparsers(dest='comando', required=True)
+
+    for nombre, funcion, ayuda in [
+        ('load', comando_load, "Crea las tablas y carga el CSV completo."),
+        ('sync', comando_sync, "Carga solo las obras del CSV que todavía no están en la base."),
+    ]:
+        sub = subcomandos.add_parser(nombre, help=ayuda)
+        sub.add_argument('--csv', default=CSV_POR_DEFECTO, help="Archivo CSV de origen.")
+        sub.add_argument('--rechazos', default='filas_rechazadas.csv',
+                         help="Archivo donde se guardan las filas que no se pudieron cargar.")
+        sub.add_argument('--motor', choices=['auto', 'pyarrow', 'c'], default='auto',
+                         help="Lector del CSV: pyarrow (varios hilos) o el de pandas; auto usa pyarrow si está instalado.")
+        sub.add_argument('--sombra', action='store_true',
+                         help="Carga en una tabla de sombra y la intercambia al final (los lectores no se bloquean).")
+        sub.add_argument('--nomenclador', default='nomenclador.csv',
+                         help="Nomenclador local de calles para ubicar las obras que no traen coordenadas.")
+        sub.set_defaults(funcion=funcion)
+
+    sub = subcomandos.add_parser('indicadores', help="Muestra los indicadores de obras.")
+    sub.add_argument('--json', action='store_true', help="Imprime los indicadores en formato JSON.")
+    sub.set_defaults(funcion=comando_indicadores)
+
+    sub = subcomandos.add_parser('export', help="Exporta las obras a CSV o JSONL.")
+    sub.add_argument('--salida', default='obras_exportadas.csv', help="Archivo de salida (.csv o .jsonl).")
+    sub.set_defaults(funcion=comando_export)
+
+    sub = subcomandos.add_parser('archivar', help="Mueve las obras terminadas a la tabla de archivo.")
+    sub.add_argument('--lote', type=int, default=1000, help="Obras movidas por transacción.")
+    sub.set_defaults(funcion=comando_archivar)
+
+    sub = subcomandos.add_parser('snapshot', help="Guarda la foto diaria de los indicadores.")
+    sub.add_argument('--fecha', default=None, help="Fecha de la foto (AAAA-MM-DD, por defecto hoy).")
+    sub.set_defaults(funcion=comando_snapshot)
+
+    sub = subcomandos.add_parser('tendencia', help="Muestra la serie de un indicador a partir de las fotos diarias.")
+    sub.add_argument('--dimension', default='total',
+                     choices=['total', 'etapa', 'tipo_obra', 'area_responsable', 'comuna'])
+    sub.add_argument('--valor', default=None, help="Grupo dentro de la dimensión (por ejemplo 'En Ejecucion').")
+    sub.add_argument('--metrica', default='cantidad', choices=['cantidad', 'mano_obra', 'porcentaje_avance', 'monto_contrato'])
+    sub.add_argument('--periodo', default='semana', choices=['dia', 'semana', 'mes'])
+    sub.add_argument('--desde', default=None, help="Primera fecha (AAAA-MM-DD).")
+    sub.add_argument('--hasta', default=None, help="Última fecha (AAAA-MM-DD).")
+    sub.add_argument('--json', action='store_true', help="Imprime la serie en formato JSON.")
+    sub.set_defaults(funcion=comando_tendencia)
+
+    return parser
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    _preparar_db(args.db)
+    return args.funcion(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
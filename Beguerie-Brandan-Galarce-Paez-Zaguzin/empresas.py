@@ -0,0 +1,182 @@
+import re
+import unicodedata
+
+from peewee import fn
+from modelo_orm import db, Empresa, EmpresaTrigrama, Obra
+from archivo import hay_archivo, modelo_archivo
+
+# Resolución de empresas contratistas (esquema con claves foráneas, modelo_orm).
+#
+# El CSV trae la empresa como texto libre (licitacion_oferta_empresa) y el CUIT aparte, y la
+# misma firma aparece escrita de muchas formas. ResolvedorEmpresas lleva cada par
+# (nombre, cuit) a una fila de Empresa:
+#
+#   1. Por CUIT: si ya hay una empresa con ese CUIT, es esa (índice único).
+#   2. Por nombre normalizado idéntico (índice sobre nombre_normalizado).
+#   3. Por parecido: los candidatos son las empresas que comparten trigramas con el nombre
+#      (tabla EmpresaTrigrama, indexada por trigrama) y se elige la de mayor coeficiente de
+#      Dice si supera UMBRAL_SIMILITUD. Así cada nombre se compara con unas pocas empresas
+#      y no con todas. Los números del nombre tienen que coincidir ('Constructora 1' no es
+#      'Constructora 2', aunque se parezcan).
+#   4. Si no hay ninguna, se crea la empresa y se indexan sus trigramas.
+#
+# Dos empresas con CUIT distinto nunca se unen, aunque los nombres coincidan.
+
+TAMANO_NGRAMA = 3
+UMBRAL_SIMILITUD = 0.8
+MAX_CANDIDATOS = 10
+
+# Palabras de la forma societaria que no ayudan a distinguir empresas ('s.a.' queda 'sa' al quitar los puntos)
+FORMAS_SOCIETARIAS = {
+    'sa', 'srl', 'sas', 'sac', 'saic', 'saci', 'sacif', 'sacifi', 'ute', 'ltda', 'cia',
+    'sociedad', 'anonima', 'responsabilidad', 'limitada', 'accidental', 'comercial', 'industrial',
+}
+
+_CUIT = re.compile(r'(\d{2})\D?(\d{8})\D?(\d)')
+
+
+def _sin_dato(valor):
+    return valor is None or valor != valor or not str(valor).strip() # None, NaN o texto vacío
+
+
+def normalizar_nombre(nombre):
+    """Minúsculas, sin tildes, sin puntuación y sin la forma societaria: 'CONSTRUCTORA SUR S.A.' -> 'constructora sur'."""
+    if _sin_dato(nombre):
+        return None
+    texto = unicodedata.normalize('NFKD', str(nombre)).encode('ascii', 'ignore').decode('ascii').lower()
+    palabras = re.sub(r'[^a-z0-9]+', ' ', texto.replace('.', '')).split()
+    significativas = [palabra for palabra in palabras if palabra not in FORMAS_SOCIETARIAS]
+    return ' '.join(significativas or palabras) or None
+
+
+def normalizar_cuit(cuit):
+    """Retorna los 11 dígitos del primer CUIT que aparece en el texto ('30-71234567-8' -> '30712345678'), o None."""
+    if _sin_dato(cuit):
+        return None
+    encontrado = _CUIT.search(str(cuit))
+    return ''.join(encontrado.groups()) if encontrado else None
+
+
+def ngramas(nombre_normalizado, tamano=TAMANO_NGRAMA):
+    """Conjunto de n-gramas de caracteres del nombre, con un espacio de relleno en cada punta."""
+    texto = f' {nombre_normalizado} '
+    return {texto[i:i + tamano] for i in range(max(len(texto) - tamano + 1, 1))}
+
+
+def numeros(nombre_normalizado):
+    return set(re.findall(r'\d+', nombre_normalizado))
+
+
+def similitud(ngramas_a, ngramas_b):
+    """Coeficiente de Dice entre dos conjuntos de n-gramas (1.0 = iguales)."""
+    if not ngramas_a or not ngramas_b:
+        return 0.0
+    return 2 * len(ngramas_a & ngramas_b) / (len(ngramas_a) + len(ngramas_b))
+
+
+class ResolvedorEmpresas:
+    """
+    Resuelve (nombre, cuit) a ids de Empresa, creando las empresas que falten.
+    Recuerda lo ya resuelto, así una carga consulta la base una vez por cada par distinto
+    y no una vez por fila. Tiene que usarse con la conexión abierta.
+    """
+
+    def __init__(self, umbral=UMBRAL_SIMILITUD):
+        self.umbral = umbral
+        self._resueltos = {}
+        self.creadas = 0
+
+    def resolver(self, nombre, cuit=None):
+        """Retorna el id de la empresa (o None si no hay ni nombre ni CUIT)."""
+        clave = (None if _sin_dato(nombre) else str(nombre).strip(), normalizar_cuit(cuit))
+        if clave not in self._resueltos:
+            self._resueltos[clave] = self._resolver(*clave)
+        return self._resueltos[clave]
+
+    def resolver_columnas(self, nombres, cuits):
+        """Resuelve dos columnas paralelas (por ejemplo de un DataFrame) y retorna la lista de ids."""
+        return [self.resolver(nombre, cuit) for nombre, cuit in zip(nombres, cuits)]
+
+    def _resolver(self, nombre, cuit):
+        normalizado = normalizar_nombre(nombre)
+        if normalizado is None and cuit is None:
+            return None
+
+        # 1. Por CUIT
+        if cuit is not None:
+            empresa = Empresa.get_or_none(Empresa.cuit == cuit)
+            if empresa is not None:
+                return empresa.id
+        if normalizado is None:
+            return self._crear(cuit, cuit, cuit) # Solo CUIT: el CUIT hace de nombre
+
+        # 2. Nombre normalizado idéntico; 3. nombre parecido
+        empresa = (Empresa.select().where(Empresa.nombre_normalizado == normalizado).first()
+                   or self._mas_parecida(normalizado))
+        if empresa is not None and (cuit is None or empresa.cuit is None):
+            if cuit is not None:
+                # Primera vez que aparece con CUIT: se completa para que las siguientes resuelvan por el paso 1
+                Empresa.update(cuit=cuit).where(Empresa.id == empresa.id).execute()
+            return empresa.id
+        return self._crear(nombre, normalizado, cuit) # Sin candidatos, o el candidato tiene otro CUIT
+
+    def _mas_parecida(self, normalizado):
+        propios, numeros_propios = ngramas(normalizado), numeros(normalizado)
+        comunes = fn.COUNT(EmpresaTrigrama.trigrama)
+        candidatos = (EmpresaTrigrama
+                      .select(EmpresaTrigrama.empresa, comunes)
+                      .where(EmpresaTrigrama.trigrama.in_(list(propios)))
+                      .group_by(EmpresaTrigrama.empresa)
+                      .order_by(comunes.desc())
+                      .limit(MAX_CANDIDATOS)
+                      .tuples())
+        ids = [empresa_id for empresa_id, _ in candidatos]
+        mejor, mejor_similitud = None, self.umbral
+        for empresa in Empresa.select().where(Empresa.id.in_(ids)).order_by(Empresa.id):
+            if numeros(empresa.nombre_normalizado) != numeros_propios:
+                continue
+            valor = similitud(propios, ngramas(empresa.nombre_normalizado))
+            if valor >= mejor_similitud:
+                mejor, mejor_similitud = empresa, valor
+        return mejor
+
+    def _crear(self, nombre, normalizado, cuit):
+        empresa = Empresa.create(nombre=str(nombre).strip(), nombre_normalizado=normalizado, cuit=cuit)
+        EmpresaTrigrama.insert_many([(trigrama, empresa.id) for trigrama in ngramas(normalizado)],
+                                    fields=[EmpresaTrigrama.trigrama, EmpresaTrigrama.empresa]).execute()
+        self.creadas += 1
+        return empresa.id
+
+
+def migrar_empresas(filas_por_lote=5000):
+    """
+    Agrega la columna empresa_id a una tabla 'obras' (y a su archivo) creada antes de Empresa
+    y la completa por lotes de ids, resolviendo cada par (empresa_licitacion, cuit_contratista).
+    Es idempotente: si la columna ya existe no hace nada. Retorna la cantidad de empresas creadas.
+    """
+    columna = Obra.empresa.column_name
+    tablas = [Obra] + ([modelo_archivo(Obra)] if hay_archivo(Obra) else [])
+    faltantes = [modelo._meta.table_name for modelo in tablas
+                 if columna not in [fila[1] for fila in db.execute_sql(
+                     f'PRAGMA table_info("{modelo._meta.table_name}")').fetchall()]]
+    if not faltantes:
+        return 0
+
+    resolvedor = ResolvedorEmpresas()
+    for tabla in faltantes:
+        db.execute_sql(f'ALTER TABLE "{tabla}" ADD COLUMN "{columna}" INTEGER '
+                       f'REFERENCES "{Empresa._meta.table_name}" ("id")')
+        ultimo_id = 0
+        while True:
+            filas = db.execute_sql(
+                f'SELECT id, empresa_licitacion, cuit_contratista FROM "{tabla}" '
+                f'WHERE id > ? ORDER BY id LIMIT ?', (ultimo_id, filas_por_lote)).fetchall()
+            if not filas:
+                break
+            with db.atomic():
+                cambios = [(resolvedor.resolver(nombre, cuit), obra_id) for obra_id, nombre, cuit in filas]
+                db.cursor().executemany(f'UPDATE "{tabla}" SET "{columna}" = ? WHERE id = ?',
+                                        [cambio for cambio in cambios if cambio[0] is not None])
+            ultimo_id = filas[-1][0]
+    print(f"Columna '{columna}' agregada a {', '.join(faltantes)}: {resolvedor.creadas} empresas creadas.")
+    return resolvedor.creadas
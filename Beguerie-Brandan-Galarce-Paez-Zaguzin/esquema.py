@@ -0,0 +1,72 @@
+# Utilidades de esquema compartidas por los dos modelos (modelo_orm y modelo_orm2).
+
+
+def columnas_indexadas(db, tabla):
+    """Retorna el conjunto de (columnas, unico) de los índices que ya tiene una tabla en la base."""
+    indices = set()
+    for _, nombre, unico, *_ in db.execute_sql(f'PRAGMA index_list("{tabla}")').fetchall():
+        columnas = tuple(fila[2] for fila in db.execute_sql(f'PRAGMA index_info("{nombre}")').fetchall())
+        indices.add((columnas, bool(unico)))
+    return indices
+
+
+def agregar_columnas(db, modelo):
+    """
+    Agrega a la tabla del modelo las columnas nulables que tenga el modelo y no la tabla
+    (ALTER TABLE ... ADD COLUMN). Las columnas NOT NULL necesitan su propia migración,
+    que les dé un valor a las filas existentes (ver por ejemplo modelo_orm2.migrar_version).
+    Retorna los nombres de las columnas agregadas.
+    """
+    tabla = modelo._meta.table_name
+    existentes = {fila[1] for fila in db.execute_sql(f'PRAGMA table_info("{tabla}")').fetchall()}
+    agregadas = []
+    for campo in modelo._meta.sorted_fields:
+        if campo.column_name in existentes or not campo.null:
+            continue
+        contexto = db.get_sql_context()
+        definicion, _ = contexto.sql(campo.ddl(contexto)).query()
+        db.execute_sql(f'ALTER TABLE "{tabla}" ADD COLUMN {definicion}')
+        agregadas.append(campo.column_name)
+    if agregadas:
+        print(f"Columnas agregadas a '{tabla}': {', '.join(agregadas)}.")
+    return agregadas
+
+
+def crear_tablas(db, modelos):
+    """
+    Crea las tablas que falten y, en las que ya existen, solo las columnas nulables
+    (ver agregar_columnas()) y los índices que falten.
+
+    A diferencia de db.create_tables(safe=True), un índice se considera existente si
+    hay otro sobre las mismas columnas aunque tenga otro nombre. Esto importa después
+    de una carga en sombra (ver carga_sombra.py): la tabla nueva conserva los nombres
+    de índice de la tabla de sombra y create_tables() los duplicaría.
+    """
+    for modelo in modelos:
+        if not modelo.table_exists():
+            db.create_tables([modelo], safe=True)
+            continue
+        agregar_columnas(db, modelo)
+        existentes = columnas_indexadas(db, modelo._meta.table_name)
+        for indice in modelo._meta.fields_to_index():
+            columnas = tuple(campo.column_name for campo in indice._expressions)
+            if (columnas, bool(indice._unique)) not in existentes:
+                db.execute(modelo._schema._create_index(indice, safe=True))
+
+
+def tiene_autoincremento(db, tabla):
+    """True si la clave primaria de la tabla se declaró AUTOINCREMENT (SQLite no reusa sus ids)."""
+    fila = db.execute_sql("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (tabla,)).fetchone()
+    return fila is not None and 'AUTOINCREMENT' in fila[0].upper()
+
+
+def secuencia(db, tabla):
+    """Último id entregado por una tabla AUTOINCREMENT (0 si todavía no entregó ninguno)."""
+    fila = db.execute_sql('SELECT seq FROM sqlite_sequence WHERE name = ?', (tabla,)).fetchone()
+    return fila[0] if fila else 0
+
+
+def subir_secuencia(db, tabla, minimo):
+    """Lleva el contador de una tabla AUTOINCREMENT a `minimo` si estaba por debajo: los ids nuevos serán mayores."""
+    if db.execute_sql('UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?', (minimo, tabla)).rowcount == 0:
+        db.execute_sql('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (tabla, minimo))
@@ -0,0 +1,116 @@
+import csv
+import json
+from collections import Counter
+from datetime import date, datetime
+
+# Sumidero de filas rechazadas durante la carga.
+#
+# En lugar de imprimir cada fila que falla, cargar_datos() la registra acá junto con
+# el motivo. Las filas se acumulan en memoria y se escriben en bloques a un archivo
+# de cuarentena (CSV o JSONL), así el bucle de inserción no hace E/S por cada fila.
+# El archivo conserva las columnas originales, de modo que se puede corregir y
+# volver a cargar solamente lo que falló.
+
+
+def _valor_serializable(valor):
+    """Convierte los valores de pandas/numpy a tipos que entienden csv y json."""
+    if valor is None:
+        return None
+    if hasattr(valor, 'item'): # Escalares de numpy (int64, float64, bool_)
+        valor = valor.item()
+    try:
+        if valor != valor: # NaN / NaT
+            return None
+    except TypeError: # pd.NA no se puede usar en un if
+        return None
+    if isinstance(valor, (date, datetime)):
+        return valor.isoformat()
+    return valor
+
+
+class SumideroRechazos:
+    """
+    Acumula filas rechazadas y las vuelca a un archivo de cuarentena.
+
+    - ruta: archivo de salida. Si termina en '.jsonl' se escribe JSON por línea, si no CSV.
+    - tamano_bloque: cantidad de filas que se juntan en memoria antes de escribir.
+    - ruta None: solo se lleva el resumen por tipo de error, sin archivo.
+    """
+
+    def __init__(self, ruta='filas_rechazadas.csv', tamano_bloque=1000):
+        self.ruta = ruta
+        self.tamano_bloque = tamano_bloque
+        self.formato = 'jsonl' if ruta and ruta.endswith('.jsonl') else 'csv'
+        self.por_error = Counter()
+        self.total = 0
+        self._pendientes = []
+        self._columnas = None # Columnas del CSV, se fijan con la primera fila
+        self._archivo = None
+        self._escritor = None
+
+    def registrar(self, indice, fila, error, motivo=None):
+        """
+        Registra una fila rechazada.
+        - indice: índice de la fila en el DataFrame.
+        - fila: la fila (Series de pandas o diccionario) con los datos originales.
+        - error: la excepción que la hizo fallar (o el nombre del motivo si no hubo excepción).
+        - motivo: texto opcional con el detalle; por defecto el mensaje del error.
+        """
+        clase = error if isinstance(error, str) else type(error).__name__
+        self.por_error[clase] += 1
+        self.total += 1
+        if self.ruta is None:
+            return
+        datos = fila.to_dict() if hasattr(fila, 'to_dict') else dict(fila)
+        self._pendientes.append((indice, clase, motivo if motivo is not None else str(error), datos))
+        if len(self._pendientes) >= self.tamano_bloque:
+            self.vaciar()
+
+    def _abrir(self):
+        self._archivo = open(self.ruta, 'w', encoding='utf-8', newline='')
+        if self.formato == 'csv':
+            self._columnas = list(self._pendientes[0][3].keys())
+            self._escritor = csv.writer(self._archivo)
+            self._escritor.writerow(['_indice', '_error', '_motivo'] + self._columnas)
+
+    def vaciar(self):
+        """Escribe en el archivo las filas acumuladas en memoria."""
+        if not self._pendientes or self.ruta is None:
+            return
+        if self._archivo is None:
+            self._abrir()
+        if self.formato == 'csv':
+            self._escritor.writerows(
+                [indice, clase, motivo] + [_valor_serializable(datos.get(columna)) for columna in self._columnas]
+                for indice, clase, motivo, datos in self._pendientes
+            )
+        else:
+            self._archivo.writelines(
+                json.dumps({'_indice': _valor_serializable(indice), '_error': clase, '_motivo': motivo,
+                            **{columna: _valor_serializable(valor) for columna, valor in datos.items()}},
+                           ensure_ascii=False) + '\n'
+                for indice, clase, motivo, datos in self._pendientes
+            )
+        self._pendientes = []
+
+    def cerrar(self):
+        """Escribe lo pendiente, cierra el archivo y retorna el resumen por tipo de error."""
+        self.vaciar()
+        if self._archivo is not None:
+            self._archivo.close()
+            self._archivo = None
+        return dict(self.por_error)
+
+    def mostrar_resumen(self):
+        if not self.total:
+            return
+        print(f"Filas rechazadas: {self.total}" + (f" (guardadas en '{self.ruta}')" if self.ruta else ""))
+        for clase, cantidad in self.por_error.most_common():
+            print(f"   - {clase}: {cantidad}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+        return False
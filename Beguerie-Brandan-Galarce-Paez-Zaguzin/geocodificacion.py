@@ -0,0 +1,270 @@
+import os
+import pickle
+import re
+import unicodedata
+from bisect import bisect_right
+
+# Geocodificación sin conexión de las obras que no traen coordenadas.
+#
+# Las coordenadas salen de un nomenclador local (un CSV, sin consultas por red) con dos
+# tipos de filas:
+#
+#   calle;altura_desde;altura_hasta;cruce;lat;lng;lat_hasta;lng_hasta;barrio;comuna
+#   Av. Corrientes;1000;1099;;-34.6037;-58.3816;-34.6038;-58.3830;San Nicolás;1   <- tramo
+#   Av. Corrientes;;;Uruguay;-34.6040;-58.3870;;;San Nicolás;1                     <- esquina
+#
+# Un tramo va de (lat, lng) en altura_desde a (lat_hasta, lng_hasta) en altura_hasta y la
+# posición de una altura se interpola entre las dos puntas. Con el nomenclador se arma un
+# índice de direcciones normalizadas ('Av. Corrientes' y 'AVENIDA CORRIENTES' son la misma
+# calle) que se guarda al lado del CSV ('<nomenclador>.indice') y se vuelve a armar solo
+# si el CSV cambió.
+#
+# geocodificar(df) completa lat/lng de las filas que no tienen y agrega 'geo_confianza':
+# cada dirección distinta se resuelve una sola vez, por muchas filas que la repitan.
+
+NOMENCLADOR_POR_DEFECTO = 'nomenclador.csv'
+VERSION_INDICE = 1
+
+# Qué tan precisa es cada forma de ubicar una obra (columna geo_confianza)
+CONFIANZA = {
+    'original': 1.0, # Coordenadas que ya venían en el CSV
+    'altura': 0.9, # Calle y altura dentro de un tramo
+    'esquina': 0.8, # Cruce de dos calles
+    'calle': 0.5, # Centro de la calle (en el barrio si se conoce)
+    'barrio': 0.3, # Centro del barrio
+    'comuna': 0.2, # Centro de la comuna
+}
+
+ABREVIATURAS = {
+    'av': 'avenida', 'avda': 'avenida', 'gral': 'general', 'pte': 'presidente', 'dr': 'doctor',
+    'sta': 'santa', 'sto': 'santo', 'tte': 'teniente', 'cnel': 'coronel', 'pje': 'pasaje',
+    'bv': 'boulevard', 'bvd': 'boulevard', 'ing': 'ingeniero', 'int': 'intendente',
+}
+# Tipos de calle que se pueden omitir: 'avenida corrientes' también se encuentra como 'corrientes'
+TIPOS_DE_CALLE = ('avenida', 'pasaje', 'boulevard', 'calle', 'autopista')
+
+_CRUCE = re.compile(r'\s+(?:y|e|esq|esquina)\s+|\s*/\s*|\s*&\s*')
+# La altura es el último número: 'avenida 9 de julio 1200' -> ('avenida 9 de julio', 1200)
+_ALTURA = re.compile(r'^(?P<calle>.*?[a-z].*?)\s+(?:(?:n|nro|numero)\s+)?(?P<altura>\d{1,5})$')
+
+
+def normalizar(texto):
+    """Minúsculas, sin tildes ni puntuación y con las abreviaturas expandidas: 'Av. Gral. Paz' -> 'avenida general paz'."""
+    if texto is None or texto != texto or not str(texto).strip(): # None, NaN o vacío
+        return None
+    texto = unicodedata.normalize('NFKD', str(texto)).encode('ascii', 'ignore').decode('ascii').lower()
+    palabras = re.sub(r'[^a-z0-9/&]+', ' ', texto).split()
+    return ' '.join(ABREVIATURAS.get(palabra, palabra) for palabra in palabras) or None
+
+
+def _variantes(calle):
+    """La calle normalizada y, si empieza con un tipo de calle, también sin él."""
+    primera, _, resto = calle.partition(' ')
+    return [calle, resto] if primera in TIPOS_DE_CALLE and resto else [calle]
+
+
+def _comuna(valor):
+    try:
+        return int(float(valor))
+    except (TypeError, ValueError):
+        return None
+
+
+def interpretar_direccion(direccion):
+    """
+    Separa una dirección normalizada en ('esquina', (calle, cruce)), ('altura', (calle, altura)),
+    ('calle', calle) o None.
+    """
+    if direccion is None:
+        return None
+    partes = [parte for parte in _CRUCE.split(direccion) if parte]
+    if len(partes) == 2:
+        return 'esquina', tuple(partes)
+    coincidencia = _ALTURA.match(direccion)
+    if coincidencia:
+        return 'altura', (coincidencia['calle'], int(coincidencia['altura']))
+    return 'calle', direccion
+
+
+class Nomenclador:
+    """Índice de direcciones normalizadas armado a partir del CSV del nomenclador."""
+
+    def __init__(self):
+        self.tramos = {} # calle -> (alturas_desde ordenadas, tramos en el mismo orden)
+        self.esquinas = {} # (calle, calle) ordenadas -> (lat, lng, barrio)
+        self.calles = {} # calle -> {barrio (o None para toda la calle): (lat, lng)}
+        self.barrios = {} # barrio -> (lat, lng)
+        self.comunas = {} # comuna -> (lat, lng)
+        self._cache = {} # (direccion, barrio, comuna) -> (lat, lng, confianza)
+
+    @classmethod
+    def cargar(cls, ruta=NOMENCLADOR_POR_DEFECTO):
+        """Lee el índice ya armado ('<ruta>.indice') o, si no existe o es más viejo que el CSV, lo arma y lo guarda."""
+        ruta_indice = ruta + '.indice'
+        if os.path.exists(ruta_indice) and os.path.getmtime(ruta_indice) >= os.path.getmtime(ruta):
+            with open(ruta_indice, 'rb') as archivo:
+                version, nomenclador = pickle.load(archivo)
+            if version == VERSION_INDICE:
+                return nomenclador
+        nomenclador = cls.armar(ruta)
+        try:
+            with open(ruta_indice, 'wb') as archivo:
+                pickle.dump((VERSION_INDICE, nomenclador), archivo, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            print(f"No se pudo guardar el índice del nomenclador ({e}); se volverá a armar la próxima vez.")
+        return nomenclador
+
+    @classmethod
+    def armar(cls, ruta):
+        from lectura_csv import leer_csv
+        import pandas as pd
+
+        df = leer_csv(ruta, columnas_texto=('calle', 'cruce', 'barrio'))
+        for columna in ('altura_desde', 'altura_hasta', 'cruce', 'lat_hasta', 'lng_hasta', 'barrio', 'comuna'):
+            if columna not in df.columns:
+                df[columna] = None
+        df['calle'] = df['calle'].map(normalizar)
+        df['cruce'] = df['cruce'].map(normalizar)
+        df['barrio'] = df['barrio'].map(normalizar)
+        df['comuna'] = df['comuna'].map(_comuna)
+        df = df[df['calle'].notna() & df['lat'].notna() & df['lng'].notna()]
+
+        nomenclador = cls()
+        es_esquina = df['cruce'].notna()
+        tramos = df[~es_esquina & df['altura_desde'].notna() & df['altura_hasta'].notna()]
+        tramos = tramos.assign(lat_hasta=tramos['lat_hasta'].fillna(tramos['lat']),
+                               lng_hasta=tramos['lng_hasta'].fillna(tramos['lng'])).sort_values('altura_desde')
+        for calle, grupo in tramos.groupby('calle', sort=False):
+            filas = list(zip(grupo['altura_desde'].astype(int), grupo['altura_hasta'].astype(int), grupo['lat'],
+                             grupo['lng'], grupo['lat_hasta'], grupo['lng_hasta'], grupo['barrio']))
+            for variante in _variantes(calle):
+                nomenclador.tramos.setdefault(variante, ([], []))
+                desdes, lista = nomenclador.tramos[variante]
+                for fila in filas:
+                    posicion = bisect_right(desdes, fila[0])
+                    desdes.insert(posicion, fila[0])
+                    lista.insert(posicion, fila)
+        for calle, cruce, lat, lng, barrio in df.loc[es_esquina, ['calle', 'cruce', 'lat', 'lng', 'barrio']].itertuples(index=False):
+            for a in _variantes(calle):
+                for b in _variantes(cruce):
+                    nomenclador.esquinas.setdefault(tuple(sorted((a, b))), (lat, lng, barrio))
+
+        # Centros: promedio de los puntos de cada calle, barrio y comuna
+        puntos = pd.concat([df[['calle', 'barrio', 'comuna', 'lat', 'lng']],
+                            df.loc[es_esquina, ['cruce', 'barrio', 'comuna', 'lat', 'lng']].rename(columns={'cruce': 'calle'})])
+        for (calle, barrio), (lat, lng) in puntos.groupby(['calle', 'barrio'])[['lat', 'lng']].mean().iterrows():
+            for variante in _variantes(calle):
+                nomenclador.calles.setdefault(variante, {}).setdefault(barrio, (lat, lng))
+        for calle, (lat, lng) in puntos.groupby('calle')[['lat', 'lng']].mean().iterrows():
+            for variante in _variantes(calle):
+                nomenclador.calles.setdefault(variante, {}).setdefault(None, (lat, lng))
+        nomenclador.barrios = {barrio: (lat, lng) for barrio, (lat, lng) in puntos.groupby('barrio')[['lat', 'lng']].mean().iterrows()}
+        nomenclador.comunas = {comuna: (lat, lng) for comuna, (lat, lng) in puntos.groupby('comuna')[['lat', 'lng']].mean().iterrows()}
+        print(f"Nomenclador '{ruta}': {len(tramos)} tramos, {int(es_esquina.sum())} esquinas, "
+              f"{len(nomenclador.barrios)} barrios.")
+        return nomenclador
+
+    def __getstate__(self):
+        estado = self.__dict__.copy()
+        estado['_cache'] = {} # Los resultados no se guardan con el índice
+        return estado
+
+    def resolver(self, direccion, barrio=None, comuna=None):
+        """Retorna (lat, lng, confianza) para la dirección, o (None, None, None) si no se pudo ubicar."""
+        clave = (normalizar(direccion), normalizar(barrio), _comuna(comuna))
+        if clave not in self._cache:
+            self._cache[clave] = self._resolver(*clave)
+        return self._cache[clave]
+
+    def _resolver(self, direccion, barrio, comuna):
+        interpretada = interpretar_direccion(direccion)
+        calle = direccion
+        if interpretada is not None:
+            tipo, valor = interpretada
+            if tipo == 'esquina':
+                punto = self.esquinas.get(tuple(sorted(valor)))
+                if punto is not None:
+                    return punto[0], punto[1], CONFIANZA['esquina']
+                calle = valor[0]
+            elif tipo == 'altura':
+                punto = self._por_altura(valor[0], valor[1], barrio)
+                if punto is not None:
+                    return punto[0], punto[1], CONFIANZA['altura']
+                if valor[0] in self.calles:
+                    calle = valor[0] # Altura fuera de los tramos; si no, el número era parte del nombre
+            else:
+                calle = valor
+
+        centros = self.calles.get(calle) if calle else None
+        if centros:
+            lat, lng = centros.get(barrio) or centros[None]
+            return lat, lng, CONFIANZA['calle']
+        if barrio in self.barrios:
+            return (*self.barrios[barrio], CONFIANZA['barrio'])
+        if comuna in self.comunas:
+            return (*self.comunas[comuna], CONFIANZA['comuna'])
+        return None, None, None
+
+    def _por_altura(self, calle, altura, barrio):
+        if calle not in self.tramos:
+            return None
+        desdes, tramos = self.tramos[calle]
+        candidatos = [tramo for tramo in tramos[:bisect_right(desdes, altura)] if tramo[1] >= altura]
+        if not candidatos:
+            return None
+        # Si la misma altura está en más de un tramo (calles homónimas), se prefiere el del barrio
+        desde, hasta, lat, lng, lat_hasta, lng_hasta, _ = next(
+            (tramo for tramo in candidatos if tramo[6] == barrio), candidatos[-1])
+        fraccion = (altura - desde) / (hasta - desde) if hasta > desde else 0.0
+        return lat + (lat_hasta - lat) * fraccion, lng + (lng_hasta - lng) * fraccion
+
+
+_nomencladores = {}
+
+
+def obtener_nomenclador(ruta=NOMENCLADOR_POR_DEFECTO):
+    """El nomenclador de `ruta`, cargado una sola vez por proceso (None si el archivo no existe)."""
+    if not os.path.exists(ruta):
+        return None
+    clave = (os.path.abspath(ruta), os.path.getmtime(ruta))
+    if clave not in _nomencladores:
+        _nomencladores[clave] = Nomenclador.cargar(ruta)
+    return _nomencladores[clave]
+
+
+def geocodificar(df, ruta_nomenclador=NOMENCLADOR_POR_DEFECTO, direccion='direccion', barrio='barrio',
+                 comuna='comuna', lat='lat', lng='lng'):
+    """
+    Completa lat/lng de las filas del DataFrame que no tienen coordenadas y agrega la columna
+    'geo_confianza' (ver CONFIANZA; None si la obra no se pudo ubicar). Las filas que ya
+    tenían coordenadas quedan igual, con confianza 1.0. Modifica y retorna el DataFrame.
+    """
+    import pandas as pd
+
+    nomenclador = obtener_nomenclador(ruta_nomenclador)
+    if nomenclador is None:
+        print(f"No se encontró el nomenclador '{ruta_nomenclador}'; las obras sin coordenadas quedan sin ubicar.")
+        return df
+
+    for columna in (lat, lng):
+        df[columna] = pd.to_numeric(df[columna], errors='coerce') if columna in df.columns else float('nan')
+    faltan = (df[lat].isna() | df[lng].isna()).to_numpy()
+    confianza = pd.Series(CONFIANZA['original'], index=df.index, dtype='float64')
+
+    if faltan.any():
+        def columna(nombre):
+            return df.loc[faltan, nombre].tolist() if nombre in df.columns else [None] * int(faltan.sum())
+
+        # Una búsqueda por dirección distinta; el resultado se reparte a todas las filas que la repiten
+        claves = list(zip(columna(direccion), columna(barrio), columna(comuna)))
+        resultados = {clave: nomenclador.resolver(*clave) for clave in dict.fromkeys(claves)}
+        lats, lngs, confianzas = zip(*(resultados[clave] for clave in claves))
+        df.loc[faltan, lat] = pd.to_numeric(pd.Series(lats), errors='coerce').to_numpy()
+        df.loc[faltan, lng] = pd.to_numeric(pd.Series(lngs), errors='coerce').to_numpy()
+        confianza[faltan] = pd.to_numeric(pd.Series(confianzas), errors='coerce').to_numpy()
+
+        ubicadas = int(pd.notna(pd.Series(confianzas)).sum())
+        print(f"Geocodificación: {int(faltan.sum())} obras sin coordenadas ({len(resultados)} direcciones distintas), "
+              f"{ubicadas} ubicadas con el nomenclador.")
+    df['geo_confianza'] = confianza
+    return df
@@ -1,14 +1,75 @@
-import pandas as pd  # Librería para trabajar con datos tipo tabla (como hojas de cálculo)
-from modelo_orm import *  # Importamos las clases de la base de datos (modelo_orm.py)
-from datetime import datetime  # Para trabajar con fechas
+# pandas se importa dentro de los métodos que lo usan (extraer, limpiar y cargar):
+# así quien solo consulta la base no paga el costo de importarlo.
+from modelo_orm import db, TipoObra, AreaResponsable, Barrio, Empresa, EmpresaTrigrama, Obra  # Clases de la base de datos (modelo_orm.py)
 import peewee  # Librería ORM para manejar la base de datos
-
-print(f"Versión de Peewee utilizada: {peewee.__version__}")  # Mostramos la versión actual de peewee
+from peewee import OperationalError
+from instrumentacion import medir, contar  # Tiempos por etapa y contadores agregados
+from filas_rechazadas import SumideroRechazos  # Cuarentena de filas que no se pudieron cargar
+from carga_sombra import cargar_en_sombra  # Carga azul/verde sobre una tabla de sombra
+from esquema import crear_tablas
+from lectura_csv import leer_csv  # Detección de formato y lector pyarrow/pandas
+from archivo import archivar, crear_vista_historico, hay_archivo, migrar_autoincremento, modelo_archivo  # Obras terminadas
+from empresas import ResolvedorEmpresas, migrar_empresas  # Empresas contratistas
+from geocodificacion import NOMENCLADOR_POR_DEFECTO, geocodificar  # Coordenadas de las obras que no las traen
+from mapeo_filas import FILAS_POR_INSERT, Campo, MapeoFilas, insertar_filas, numero  # Columnas del DataFrame -> campos de Obra
+from peewee import fn
 
 
 class GestionarObra:
     _db_initialized = False  # Variable para saber si ya inicializamos la base de datos
 
+    # Columnas del CSV que usan limpiar_datos() y la carga; las demás no se leen
+    COLUMNAS_CSV = [
+        'entorno', 'nombre', 'etapa', 'tipo', 'area_responsable', 'descripcion', 'monto_contrato',
+        'comuna', 'barrio', 'direccion', 'lat', 'lng', 'fecha_inicio', 'fecha_fin_inicial',
+        'plazo_meses', 'porcentaje_avance', 'licitacion_oferta_empresa', 'licitacion_anio',
+        'contratacion_tipo', 'nro_contratacion', 'cuit_contratista', 'beneficiarios', 'mano_obra',
+        'compromiso', 'destacada', 'ba_elige', 'link_interno', 'expediente-numero', 'financiamiento',
+    ]
+    # Columnas que se leen como texto tal cual (sin inferir tipo: el CUIT o el monto con '$' no son números todavía)
+    COLUMNAS_TEXTO_CSV = [
+        'entorno', 'nombre', 'etapa', 'tipo', 'area_responsable', 'descripcion', 'monto_contrato',
+        'barrio', 'direccion', 'fecha_inicio', 'fecha_fin_inicial', 'licitacion_oferta_empresa',
+        'contratacion_tipo', 'nro_contratacion', 'cuit_contratista', 'beneficiarios', 'compromiso',
+        'destacada', 'ba_elige', 'link_interno', 'expediente-numero', 'financiamiento',
+    ]
+    # Columnas que la carga necesita sí o sí (las renombra limpiar_datos)
+    COLUMNAS_OBLIGATORIAS = ['nombre', 'tipo_obra', 'area', 'barrio']
+    # Columna del DataFrame limpio -> campo de Obra, para la carga secuencial y la paralela (ver mapeo_filas.py).
+    # tipo, area, barrio y empresa no tienen columna: son ids que se resuelven antes (carga_paralela.resolver_referencias)
+    MAPEO_FILAS = MapeoFilas([
+        Campo('entorno', 'entorno'),
+        Campo('nombre', 'nombre'),
+        Campo('etapa', 'etapa'),
+        Campo('descripcion', 'descripcion'),
+        Campo('beneficiarios', 'beneficiarios'),
+        Campo('compromiso', 'compromiso'),
+        Campo('destacada', 'destacada'),
+        Campo('ba_elige', 'ba_elige'),
+        Campo('enlace', 'enlace'),
+        Campo('tipo'),
+        Campo('area'),
+        Campo('barrio'),
+        Campo('empresa_licitacion', 'empresa_licitacion'),
+        Campo('nro_contratacion', 'nro_contratacion'),
+        Campo('cuit_contratista', 'cuit_contratista'),
+        Campo('empresa'),
+        Campo('contratacion_tipo', 'contratacion_tipo'),
+        Campo('nro_expediente', 'nro_expediente'),
+        Campo('monto_contrato', 'monto_contrato'),
+        Campo('fuente_financiamiento', 'fuente_financiamiento'),
+        Campo('porcentaje_avance', 'porcentaje_avance'),
+        Campo('fecha_inicio', 'fecha_inicio'),
+        Campo('fecha_fin_inicial', 'fecha_fin_inicial'),
+        Campo('plazo_meses', 'plazo_meses'),
+        Campo('comuna', 'comuna'),
+        Campo('direccion', 'direccion'),
+        Campo('latitud', 'lat', numero),
+        Campo('longitud', 'lng', numero),
+        Campo('geo_confianza', 'geo_confianza'),
+        Campo('mano_obra', 'mano_obra'),
+    ])
+
     @classmethod
     def conectar_db(cls):
         """Conecta con la base de datos si aún no está conectada."""
@@ -25,8 +86,17 @@ class GestionarObra:
         """Crea las tablas necesarias en la base de datos si no existen."""
         cls.conectar_db()
         try:
-            db.create_tables([TipoObra, AreaResponsable, Barrio, Obra], safe=True)
-            print("Estructura de la base de datos creada/actualizada correctamente.")
+            if Obra.table_exists():
+                # Bases creadas antes de Empresa: agrega y completa obras.empresa_id
+                crear_tablas(db, [Empresa, EmpresaTrigrama])
+                migrar_empresas()
+                migrar_autoincremento(Obra) # Obra.id sin AUTOINCREMENT: se reusaban los ids archivados
+            crear_tablas(db, [TipoObra, AreaResponsable, Barrio, Empresa, EmpresaTrigrama, Obra])
+            if hay_archivo(Obra):
+                # La tabla de archivo y la vista histórica acompañan los cambios del modelo
+                crear_tablas(db, [modelo_archivo(Obra)])
+                crear_vista_historico(Obra)
+            print(f"Estructura de la base de datos creada/actualizada correctamente (Peewee {peewee.__version__}).")
             cls._db_initialized = True
         except Exception as e:
             print(f"Error al crear las tablas de la base de datos: {e}")
@@ -34,28 +104,28 @@ class GestionarObra:
             db.close()
 
     @classmethod
-    def extraer_datos(cls):
-        """Lee los datos desde el archivo CSV."""
+    @medir('extraer_datos')
+    def extraer_datos(cls, nombre_archivo_csv='observatorio-de-obras-urbanas.csv', motor='auto'):
+        """
+        Lee los datos desde el archivo CSV.
+        La codificación y el separador se detectan del comienzo del archivo; motor puede ser
+        'auto', 'pyarrow' o 'c' (ver lectura_csv.py).
+        """
         try:
-            with open('observatorio-de-obras-urbanas.csv', 'r', encoding='latin-1') as f:
-                primera_linea = f.readline()
-                print("Encabezados del CSV (crudos):", primera_linea.strip())
-
-            df = pd.read_csv(
-                'observatorio-de-obras-urbanas.csv',
-                encoding='latin-1',
-                delimiter=';',
-                on_bad_lines='skip'
-            )
+            df = leer_csv(nombre_archivo_csv, cls.COLUMNAS_CSV, cls.COLUMNAS_TEXTO_CSV, motor)
             print("Columnas en el DataFrame (después del parseo):", df.columns.tolist())
+            contar('filas_extraidas', len(df))
             return df
         except Exception as e:
             print(f"Error al leer el archivo: {str(e)}")
             return None
 
     @classmethod
+    @medir('limpiar_datos')
     def limpiar_datos(cls, df):
         """Limpia los datos eliminando errores, ajustando tipos y eliminando valores vacíos."""
+        import pandas as pd
+
         if df is not None:
             initial_rows = len(df)
             
@@ -98,8 +168,29 @@ class GestionarObra:
         return None
 
     @classmethod
-    def cargar_datos(cls):
-        """Carga los datos limpios del CSV a la base de datos."""
+    @medir('geocodificar_datos')
+    def geocodificar_datos(cls, df, ruta_nomenclador=NOMENCLADOR_POR_DEFECTO):
+        """
+        Completa lat/lng de las obras limpias que no tienen coordenadas a partir de
+        direccion, barrio y comuna, con el nomenclador local (ver geocodificacion.py),
+        y agrega la columna geo_confianza. Retorna el DataFrame.
+        """
+        if df is None or df.empty:
+            return df
+        return geocodificar(df, ruta_nomenclador)
+
+    @classmethod
+    @medir('cargar_datos')
+    def cargar_datos(cls, ruta_rechazos='filas_rechazadas.csv', en_sombra=False, ruta_nomenclador=NOMENCLADOR_POR_DEFECTO):
+        """
+        Carga los datos limpios del CSV a la base de datos.
+        Las filas que no se pueden cargar se guardan con su motivo en `ruta_rechazos`
+        (CSV, o JSONL si termina en '.jsonl') para corregirlas y volver a cargarlas.
+
+        Con en_sombra=True la carga se hace sobre una tabla aparte, confirmando por lotes,
+        y al final se intercambia con la tabla 'obras' (ver carga_sombra.py): los lectores
+        nunca ven la tabla a medio cargar y el bloqueo de escritura dura milisegundos.
+        """
         df = cls.extraer_datos()
         if df is None:
             print("No se pudieron cargar los datos")
@@ -109,59 +200,150 @@ class GestionarObra:
         if df is None or df.empty:
             print("No hay datos para cargar después de la limpieza.")
             return
+        df = cls.geocodificar_datos(df, ruta_nomenclador)
+
+        if en_sombra:
+            cargar_en_sombra(Obra, lambda sombra: cls._cargar_filas(df, sombra, ruta_rechazos, filas_por_lote=1000))
+        else:
+            cls._cargar_filas(df, Obra, ruta_rechazos)
+
+    @classmethod
+    @medir('cargar_datos_en_paralelo')
+    def cargar_datos_en_paralelo(cls, procesos=None, particion='comuna', ruta_nomenclador=NOMENCLADOR_POR_DEFECTO):
+        """
+        Carga el CSV usando varios procesos: cada uno escribe una partición (por comuna o por
+        hash de nombre/barrio) en su propio archivo SQLite y después se unen en la base
+        principal (ver carga_paralela.py). Las filas inválidas o repetidas se descartan
+        sin detalle por fila; para obtener la cuarentena de rechazos usar cargar_datos().
+        """
+        from carga_paralela import cargar_en_paralelo
+
+        df = cls.extraer_datos()
+        if df is None:
+            print("No se pudieron cargar los datos")
+            return None
+        df = cls.limpiar_datos(df)
+        if df is None or df.empty:
+            print("No hay datos para cargar después de la limpieza.")
+            return None
+        df = cls.geocodificar_datos(df, ruta_nomenclador)
+        return cargar_en_paralelo(df, cls.MAPEO_FILAS, procesos, particion)
+
+    @classmethod
+    @medir('archivar_obras')
+    def archivar_obras(cls, filas_por_lote=1000):
+        """
+        Mueve las obras finalizadas y rescindidas a la tabla 'obras_archivo' (ver archivo.py).
+        Siguen visibles en la vista 'obras_historico'. Retorna la cantidad de obras movidas.
+        """
+        cls.conectar_db()
+        try:
+            movidas = archivar(Obra, filas_por_lote=filas_por_lote)
+            print(f"Se archivaron {movidas} obras terminadas en '{modelo_archivo(Obra)._meta.table_name}'.")
+            return movidas
+        finally:
+            db.close()
+
+    @classmethod
+    @medir('resumen_empresas')
+    def resumen_empresas(cls, limite=20):
+        """
+        Muestra y retorna las empresas con más monto contratado: cantidad de obras y monto total
+        por empresa, incluidas las obras archivadas. Agrupa por obras.empresa_id, que está
+        indexado junto con monto_contrato, así que no hace falta leer las filas de las obras.
+        """
+        cls.conectar_db()
+        try:
+            resumen = []
+            for modelo in [Obra] + ([modelo_archivo(Obra)] if hay_archivo(Obra) else []):
+                consulta = (modelo
+                            .select(modelo.empresa, fn.COUNT(modelo.id), fn.COALESCE(fn.SUM(modelo.monto_contrato), 0))
+                            .where(modelo.empresa.is_null(False))
+                            .group_by(modelo.empresa)
+                            .tuples())
+                resumen.extend(consulta)
+            # Obras en uso + archivadas, por empresa
+            totales = {}
+            for empresa_id, obras, monto in resumen:
+                acumulado = totales.setdefault(empresa_id, [0, 0])
+                acumulado[0] += obras
+                acumulado[1] += monto
+            mayores = sorted(totales.items(), key=lambda item: item[1][1], reverse=True)[:limite]
+            empresas = {empresa.id: empresa for empresa in Empresa.select().where(Empresa.id.in_([e for e, _ in mayores]))}
+
+            print("\n--- Empresas con mayor monto contratado ---")
+            filas = []
+            for empresa_id, (obras, monto) in mayores:
+                empresa = empresas[empresa_id]
+                filas.append({'empresa': empresa.nombre, 'cuit': empresa.cuit, 'obras': obras, 'monto_total': monto})
+                print(f"   - {empresa.nombre} (CUIT {empresa.cuit or 'sin dato'}): {obras} obras, ${monto:,.2f}")
+            return filas
+        finally:
+            db.close()
+
+    @classmethod
+    def _cargar_filas(cls, df, modelo, ruta_rechazos, filas_por_lote=None):
+        """
+        Inserta las filas del DataFrame en la tabla del modelo indicado (Obra o su tabla de sombra).
+        Sin filas_por_lote cada bloque de insert se confirma solo; con filas_por_lote se confirma
+        cada esa cantidad de filas. Así no se retiene el bloqueo de escritura de la base.
+
+        Los tipos, áreas, barrios y empresas se resuelven una vez por valor distinto y las filas
+        se arman columna por columna con MAPEO_FILAS; se insertan por bloques (ver mapeo_filas.py).
+        """
+        from carga_paralela import resolver_referencias, preparar_registros
 
         print("Iniciando carga de datos en la base de datos...")
         cls.conectar_db()
 
-        with db.atomic():
-            for index, fila in df.iterrows():
-                try:
-                    tipo_obra_obj, _ = TipoObra.get_or_create(nombre=fila['tipo_obra'])
-                    area_responsable_obj, _ = AreaResponsable.get_or_create(nombre=fila['area'])
-                    barrio_obj, _ = Barrio.get_or_create(nombre=fila['barrio'])
+        rechazos = SumideroRechazos(ruta_rechazos)
+        try:
+            def rechazar(posicion, error, motivo=None):
+                # La fila original se arma solo para las rechazadas
+                rechazos.registrar(df.index[posicion], df.iloc[posicion], error, motivo)
+
+            faltantes = [columna for columna in cls.COLUMNAS_OBLIGATORIAS if columna not in df.columns]
+            if faltantes:
+                error = KeyError(faltantes[0])
+                contar('filas_omitidas_columna_faltante', len(df))
+                for posicion in range(len(df)):
+                    rechazar(posicion, error, f"Falta la columna {error}")
+                print(f"Carga de datos cancelada: faltan las columnas {', '.join(faltantes)}. Filas omitidas: {rechazos.total}.")
+                rechazos.mostrar_resumen()
+                return
 
-                    obra_existente = Obra.get_or_none(Obra.nombre == fila['nombre'], Obra.barrio == barrio_obj)
-                    if obra_existente:
-                        print(f"Obra duplicada '{fila['nombre']}' en barrio '{fila['barrio']}'. Saltada.")
+            empresas = ResolvedorEmpresas()
+            ids = resolver_referencias(df, empresas) # Crea los tipos, áreas, barrios y empresas que falten
+            filas = preparar_registros(df, ids, cls.MAPEO_FILAS)
+
+            # Obras que ya existen (índice único nombre + barrio), también entre las archivadas
+            existentes = set(modelo.select(modelo.nombre, modelo.barrio).tuples())
+            if hay_archivo(Obra):
+                archivo = modelo_archivo(Obra)
+                existentes.update(archivo.select(archivo.nombre, archivo.barrio).tuples())
+            nombre, barrio = cls.MAPEO_FILAS.nombres.index('nombre'), cls.MAPEO_FILAS.nombres.index('barrio')
+
+            def nuevas():
+                for posicion, fila in enumerate(filas):
+                    clave = (fila[nombre], fila[barrio])
+                    if clave in existentes:
+                        contar('filas_duplicadas')
+                        rechazar(posicion, 'ObraDuplicada',
+                                 f"Ya existe la obra '{df['nombre'].iat[posicion]}' en el barrio '{df['barrio'].iat[posicion]}'")
                         continue
+                    existentes.add(clave)
+                    yield posicion, fila
+
+            def al_rechazar(posicion, error):
+                contar(f'filas_omitidas_{type(error).__name__}')
+                rechazar(posicion, error)
 
-                    Obra.create(
-                        entorno=fila.get('entorno'),
-                        nombre=fila.get('nombre'),
-                        etapa=fila.get('etapa'),
-                        descripcion=fila.get('descripcion'),
-                        beneficiarios=fila.get('beneficiarios'),
-                        compromiso=fila.get('compromiso'),
-                        destacada=fila.get('destacada'),
-                        ba_elige=fila.get('ba_elige'),
-                        enlace=fila.get('enlace'),
-                        tipo=tipo_obra_obj,
-                        area=area_responsable_obj,
-                        barrio=barrio_obj,
-                        empresa_licitacion=fila.get('empresa_licitacion'),
-                        nro_contratacion=fila.get('nro_contratacion'),
-                        cuit_contratista=fila.get('cuit_contratista'),
-                        contratacion_tipo=fila.get('contratacion_tipo'),
-                        nro_expediente=fila.get('nro_expediente'),
-                        monto_contrato=fila.get('monto_contrato'),
-                        fuente_financiamiento=fila.get('fuente_financiamiento'),
-                        porcentaje_avance=fila.get('porcentaje_avance'),
-                        fecha_inicio=fila.get('fecha_inicio') if pd.notna(fila.get('fecha_inicio')) else None,
-                        fecha_fin_inicial=fila.get('fecha_fin_inicial') if pd.notna(fila.get('fecha_fin_inicial')) else None,
-                        plazo_meses=fila.get('plazo_meses'),
-                        comuna=fila.get('comuna'),
-                        direccion=fila.get('direccion'),
-                        latitud=fila.get('lat'),
-                        longitud=fila.get('lng'),
-                        mano_obra=fila.get('mano_obra')
-                    )
-                except IntegrityError as e:
-                    print(f"Error en fila {index+1}: {e}. Dato duplicado.")
-                except KeyError as e:
-                    print(f"Falta una columna: {str(e)} - Fila omitida. Index: {index+1}")
-                    continue
-                except Exception as e:
-                    print(f"Error al procesar fila {index+1}: {e}. Fila omitida.")
-                    continue
-        db.close()
-        print("Carga de datos completada.")
+            cargadas = insertar_filas(modelo, cls.MAPEO_FILAS.campos_de(modelo), nuevas(), al_rechazar,
+                                      filas_por_lote or FILAS_POR_INSERT)
+            contar('filas_cargadas', cargadas)
+            print(f"Carga de datos completada. Filas cargadas: {cargadas}. Filas omitidas: {rechazos.total}. "
+                  f"Empresas nuevas: {empresas.creadas}.")
+            rechazos.mostrar_resumen()
+        finally:
+            rechazos.cerrar()
+            db.close()
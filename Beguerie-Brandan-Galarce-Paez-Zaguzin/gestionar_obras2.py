@@ -1,22 +1,77 @@
 from abc import ABC, abstractmethod
-import pandas as pd # Necesitamos importar pandas para trabajar con DataFrames
-from modelo_orm import db, Obra
+# pandas se importa dentro de extraer_datos() y limpiar_datos(): las consultas (indicadores,
+# listados, exportación) no lo necesitan y así arrancan bastante más rápido.
+from modelo_orm2 import (db, Obra, ContadorCambios, TransicionEtapa, SnapshotIndicador, DICCIONARIOS,
+                         instalar_contador_cambios, instalar_transiciones, registrar_cambio, version_datos,
+                         migrar_a_diccionarios, migrar_fechas, migrar_version, migrar_transiciones,
+                         limpiar_cache_diccionarios,
+                         normalizar_fecha)
+from datetime import date, timedelta
+import json
 from peewee import fn
+from instrumentacion import medir, contar
+from filas_rechazadas import SumideroRechazos
+from carga_sombra import cargar_en_sombra
+from esquema import crear_tablas
+from cache_consultas import CacheConsultas
+from lectura_csv import leer_csv
+from archivo import (archivar, crear_vista_historico, hay_archivo, migrar_autoincremento, modelo_archivo,
+                     modelo_de_lectura)
+from geocodificacion import NOMENCLADOR_POR_DEFECTO, geocodificar, obtener_nomenclador
+from mapeo_filas import FILAS_POR_INSERT, Campo, MapeoFilas, insertar_filas, numero
+
+# Caché de las lecturas de GestionarObra. La versión incluye la ruta de la base para que
+# dos bases distintas (por ejemplo con cli.py --db) nunca compartan resultados.
+cache_consultas = CacheConsultas(version=lambda: (db.database, version_datos()), max_entradas=256)
+
 # Definimos la clase abstracta GestionarObra.
 class GestionarObra(ABC):
 
+    # Columnas del CSV que usan limpiar_datos() y cargar_datos(); las demás no se leen
+    COLUMNAS_CSV = [
+        'nombre', 'etapa', 'tipo', 'tipo_obra', 'area_responsable', 'estado', 'comuna', 'barrio',
+        'direccion', 'lat', 'lng', 'latitud', 'longitud', 'fecha_inicio', 'fecha_fin_inicial', 'monto_contrato',
+    ]
+    # Columnas que se leen como texto, sin que el lector intente adivinar el tipo
+    COLUMNAS_TEXTO_CSV = [
+        'nombre', 'etapa', 'tipo', 'tipo_obra', 'area_responsable', 'estado', 'barrio',
+        'direccion', 'fecha_inicio', 'fecha_fin_inicial', 'monto_contrato',
+    ]
+    # Columna del DataFrame limpio -> campo de Obra para cargar_datos() (ver mapeo_filas.py).
+    # 'estado' no se carga: el CSV no trae un estado que corresponda al del ciclo de vida.
+    MAPEO_FILAS = MapeoFilas([
+        Campo('nombre', 'nombre'),
+        Campo('etapa', 'etapa'),
+        Campo('tipo_obra', 'tipo'),
+        Campo('area_responsable', 'area_responsable'),
+        Campo('comuna', 'comuna'),
+        Campo('barrio', 'barrio'),
+        Campo('direccion', 'direccion'),
+        Campo('latitud', 'lat', numero),
+        Campo('longitud', 'lng', numero),
+        Campo('geo_confianza', 'geo_confianza'), # Agregada por geocodificar_datos()
+        Campo('fecha_inicio', 'fecha_inicio'),
+        Campo('fecha_fin_inicial', 'fecha_fin_inicial'),
+        # Obra.save() la calcula, pero insert_many() no pasa por save(): sin plazo es la fecha de fin inicial
+        Campo('fecha_fin_estimada', 'fecha_fin_inicial'),
+        Campo('monto_contrato', 'monto_contrato', numero),
+    ])
+
     # a. Método para extraer datos del CSV
     @classmethod # Indicamos que es un método de clase. Lo llamamos con GestionarObra.extraer_datos()
-    def extraer_datos(cls, nombre_archivo_csv='observatorio-de-obras-urbanas.csv'):
+    @medir('extraer_datos')
+    def extraer_datos(cls, nombre_archivo_csv='observatorio-de-obras-urbanas.csv', motor='auto'):
         """
-        Extrae datos de un archivo CSV usando pandas y los carga en un DataFrame.
+        Extrae datos de un archivo CSV y los carga en un DataFrame.
+        La codificación y el separador se detectan del comienzo del archivo; motor puede ser
+        'auto' (pyarrow si está instalado), 'pyarrow' o 'c' (ver lectura_csv.py).
         Retorna el DataFrame de pandas.
         """
         try:
-            # pd.read_csv lee el archivo CSV y lo convierte en un DataFrame.
-            # Es la forma más simple de cargar datos desde un CSV.
-            df = pd.read_csv(nombre_archivo_csv)
+            # Solo se leen las columnas que usa la carga
+            df = leer_csv(nombre_archivo_csv, cls.COLUMNAS_CSV, cls.COLUMNAS_TEXTO_CSV, motor)
             print(f"Dataset '{nombre_archivo_csv}' extraído exitosamente. Total de registros: {len(df)}")
+            contar('filas_extraidas', len(df))
             return df
         except FileNotFoundError:
             # Si el archivo no se encuentra, mostramos un mensaje de error claro.
@@ -58,7 +113,22 @@ class GestionarObra(ABC):
             # db.create_tables([Obra]) es el método de Peewee.
             # Toma una lista de modelos (nuestra clase Obra) y crea
             # las tablas correspondientes en la base de datos si no existen.
-            db.create_tables([Obra])
+            limpiar_cache_diccionarios() # Por si la base se recreó desde la última vez
+            if Obra.table_exists():
+                # Bases creadas con versiones anteriores del modelo (van antes de crear los índices nuevos)
+                migrar_a_diccionarios() # etapa, barrio, etc. eran columnas de texto
+                migrar_fechas() # fechas en texto libre y sin fecha_fin_estimada
+                migrar_version() # sin columna de versión para el control optimista
+                # Obra.id sin AUTOINCREMENT: se reusaban los ids de las obras archivadas
+                migrar_autoincremento(Obra, despues_de_intercambio=instalar_contador_cambios)
+            migrar_transiciones() # etapa '*' en lugar de NULL, o sin la columna inicial
+            crear_tablas(db, DICCIONARIOS + [Obra, ContadorCambios, TransicionEtapa, SnapshotIndicador])
+            if hay_archivo(Obra):
+                # La tabla de archivo y la vista histórica acompañan los cambios del modelo
+                crear_tablas(db, [modelo_archivo(Obra)])
+                crear_vista_historico(Obra)
+            instalar_transiciones() # Pasos de etapa permitidos para los métodos del ciclo de vida
+            instalar_contador_cambios() # Triggers que mantienen la versión de los datos
             print("Estructura de la base de datos (tabla 'obras') creada/verificada.")
         except Exception as e:
             print(f"Error al mapear el ORM y crear tablas: {e}")
@@ -72,6 +142,7 @@ class GestionarObra(ABC):
         
 
     @classmethod
+    @medir('limpiar_datos')
     def limpiar_datos(cls, df):
         """
         Realiza la limpieza de datos nulos y 'no accesibles' del DataFrame.
@@ -79,6 +150,8 @@ class GestionarObra(ABC):
         Intenta convertir a numérico si es posible para ciertas columnas.
         Retorna el DataFrame limpio.
         """
+        import pandas as pd
+
         if df is None or df.empty:
             print("No hay DataFrame para limpiar o está vacío.")
             return df
@@ -92,7 +165,7 @@ class GestionarObra(ABC):
         # Columnas en nuestro modelo Obra que vamos a limpiar y procesar
         columnas_a_procesar = [
             'nombre', 'etapa', 'tipo_obra', 'area_responsable', 'estado',
-            'comuna', 'barrio', 'latitud', 'longitud',
+            'comuna', 'barrio', 'direccion', 'latitud', 'longitud',
             'fecha_inicio', 'fecha_fin_inicial'
         ]
 
@@ -115,63 +188,198 @@ class GestionarObra(ABC):
             else:
                 print(f"Advertencia: La columna '{col}' del modelo no se encontró en el CSV.")
 
+        # El monto viene como texto con formato argentino ('$1.234.567,89'), igual que en gestionar_obras.py
+        if 'monto_contrato' in df.columns and not pd.api.types.is_numeric_dtype(df['monto_contrato']):
+            df['monto_contrato'] = pd.to_numeric(
+                df['monto_contrato'].astype(str).str.replace('$', '', regex=False).str.replace('.', '', regex=False).str.replace(',', '.'),
+                errors='coerce'
+            )
+
         print("Limpieza de datos completada.")
         return df
     
     @classmethod
-    def cargar_datos(cls, df):
+    @medir('geocodificar_datos')
+    def geocodificar_datos(cls, df, ruta_nomenclador=NOMENCLADOR_POR_DEFECTO):
+        """
+        Completa lat/lng de las obras limpias que no tienen coordenadas a partir de
+        direccion, barrio y comuna, con el nomenclador local (ver geocodificacion.py),
+        y agrega la columna geo_confianza. Va después de limpiar_datos(). Retorna el DataFrame.
+        """
+        if df is None or df.empty:
+            return df
+        return geocodificar(df, ruta_nomenclador)
+
+    @classmethod
+    @medir('cargar_datos')
+    def cargar_datos(cls, df, ruta_rechazos='filas_rechazadas.csv', en_sombra=False):
         """
         Persiste los datos limpios del DataFrame en la tabla 'obras' de la base de datos SQLite.
         Utiliza el método de clase Model.create() de Peewee.
+        Las filas que fallan se guardan con su motivo en `ruta_rechazos` (CSV, o JSONL si
+        termina en '.jsonl') en lugar de imprimirse una por una.
+
+        Con en_sombra=True se carga en una tabla aparte y al final se la intercambia con la
+        tabla en uso (ver carga_sombra.py), así quien consulta nunca ve una carga a medias.
         """
         if df is None or df.empty:
             print("No hay datos en el DataFrame para cargar o está vacío.")
             return
 
+        if en_sombra:
+            def despues_de_intercambio():
+                # La tabla nueva necesita sus triggers, y el cambio tiene que invalidar cachés y ETags
+                instalar_contador_cambios()
+                registrar_cambio()
+            cargar_en_sombra(Obra, lambda sombra: cls._cargar_filas(df, sombra, ruta_rechazos, filas_por_lote=1000),
+                             despues_de_intercambio=despues_de_intercambio)
+        else:
+            cls._cargar_filas(df, Obra, ruta_rechazos)
+
+    @classmethod
+    def _cargar_filas(cls, df, modelo, ruta_rechazos, filas_por_lote=None):
+        """
+        Inserta las filas del DataFrame en la tabla del modelo indicado (Obra o su tabla de sombra).
+        Las filas se arman columna por columna con MAPEO_FILAS y se insertan por bloques; sin
+        filas_por_lote cada bloque se confirma solo, con filas_por_lote se confirma por lotes.
+        """
         print(f"Cargando {len(df)} registros en la base de datos. Esto puede llevar un momento...")
 
         cls.conectar_db() # Nos aseguramos de estar conectados
 
+        cargadas = 0
+        rechazos = SumideroRechazos(ruta_rechazos)
         try:
-            # Iteramos fila por fila del DataFrame
-            for index, row in df.iterrows():
-                try:
-                    # Mapeamos los nombres de las columnas del CSV a los atributos del modelo Obra.
-                    # ¡ESTO ES CRÍTICO Y USA TUS NOMBRES EXACTOS DEL CSV!
-                    # Asegúrate de que los atributos de tu modelo Obra en modelo_orm.py
-                    # están definidos para recibir estos valores (Charfield, IntField, FloatField, etc.)
-                    Obra.create(
-                        nombre=row.get('nombre', None), # Columna 'nombre' en CSV
-                        etapa=row.get('etapa', None),   # Columna 'etapa' en CSV
-                        tipo_obra=row.get('tipo', None), # Columna 'tipo' en CSV -> a 'tipo_obra' en modelo
-                        area_responsable=row.get('area_responsable', None), # Columna 'area_responsable' en CSV
-                        # 'estado' no parece estar en tu CSV. Si no existe, Peewee pondrá None.
-                        estado=None, # Asignamos None si no hay una columna 'estado' en el CSV
-                        comuna=row.get('comuna', None), # Columna 'comuna' en CSV
-                        barrio=row.get('barrio', None), # Columna 'barrio' en CSV
-                        latitud=row.get('lat', None), # Columna 'lat' en CSV -> a 'latitud' en modelo
-                        longitud=row.get('lng', None), # Columna 'lng' en CSV -> a 'longitud' en modelo
-                        fecha_inicio=row.get('fecha_inicio', None), # Columna 'fecha_inicio' en CSV
-                        fecha_fin_inicial=row.get('fecha_fin_inicial', None) # Columna 'fecha_fin_inicial' en CSV
-                    )
-                except KeyError as ke:
-                    # Si una columna no existe en el DataFrame, lo indicamos
-                    print(f"Error: Columna '{ke}' faltante en el CSV para el registro {index}. Saltando este registro.")
-                except Exception as e:
-                    # Para cualquier otro error al crear un registro, lo indicamos
-                    # Intentamos obtener el nombre de la obra para el mensaje de error si es posible
-                    obra_nombre_error = row.get('nombre', 'N/D')
-                    print(f"Error al cargar el registro {index} (obra: {obra_nombre_error}). Error: {e}. Saltando este registro.")
-
-            print("Carga de datos completada exitosamente.")
+            def al_rechazar(posicion, error):
+                # Cualquier error al crear el registro queda clasificado por tipo de error
+                contar(f'filas_omitidas_{type(error).__name__}')
+                rechazos.registrar(df.index[posicion], df.iloc[posicion], error)
+
+            # Los valores nuevos de etapa, barrio, etc. se confirman antes de abrir los bloques
+            cls.MAPEO_FILAS.registrar_referencias(modelo, df)
+            filas = enumerate(cls.MAPEO_FILAS.filas(modelo, df))
+            cargadas = insertar_filas(modelo, cls.MAPEO_FILAS.campos_de(modelo), filas, al_rechazar,
+                                      filas_por_lote or FILAS_POR_INSERT)
+
+            contar('filas_cargadas', cargadas)
+            print(f"Carga de datos completada. Registros cargados: {cargadas}. Registros omitidos: {rechazos.total}.")
+            rechazos.mostrar_resumen()
 
         except Exception as e:
             print(f"Error general durante la carga de datos: {e}")
         finally:
+            rechazos.cerrar()
             if not db.is_closed():
                 db.close()
                 print("Conexión a la base de datos cerrada después de cargar datos.")
 
+    @classmethod
+    def sincronizar_datos(cls, df, ruta_rechazos='filas_rechazadas.csv', en_sombra=False):
+        """
+        Carga solamente las filas del DataFrame cuya combinación (nombre, barrio)
+        todavía no está en la base. Sirve para volver a correr la carga sobre un CSV
+        actualizado sin duplicar las obras que ya estaban.
+        """
+        if df is None or df.empty:
+            print("No hay datos en el DataFrame para sincronizar o está vacío.")
+            return
+
+        cls.conectar_db()
+        try:
+            # También las obras archivadas: no hay que volver a cargarlas
+            fuente = modelo_de_lectura(Obra)
+            existentes = set(fuente.select(fuente.nombre, fuente.barrio).tuples())
+        finally:
+            if not db.is_closed():
+                db.close()
+
+        # Los nulos de pandas (NaN/NA) se comparan como None, igual que los NULL que vienen de la base
+        nombres = df['nombre'].astype(object).where(df['nombre'].notna(), None)
+        barrios = df['barrio'].astype(object).where(df['barrio'].notna(), None)
+        nuevas = [(nombre, barrio) not in existentes for nombre, barrio in zip(nombres, barrios)]
+        df_nuevas = df[nuevas]
+        print(f"Sincronización: {len(df) - len(df_nuevas)} obras ya estaban cargadas, {len(df_nuevas)} son nuevas.")
+        cls.cargar_datos(df_nuevas, ruta_rechazos, en_sombra)
+
+    @classmethod
+    @medir('tomar_snapshot_indicadores')
+    def tomar_snapshot_indicadores(cls, fecha=None):
+        """
+        Guarda la foto de los indicadores del día (por defecto hoy) en SnapshotIndicador:
+        para cada dimensión, la cantidad de obras y las sumas de mano de obra, de porcentaje
+        de avance y de monto de contrato por valor. Incluye las obras archivadas. Si ya había una foto de ese día se
+        reemplaza, así se puede correr más de una vez por día. Retorna la cantidad de filas guardadas.
+        """
+        fecha = normalizar_fecha(fecha) or date.today()
+        cls.conectar_db()
+        try:
+            fuente = modelo_de_lectura(Obra)
+            metricas = [fn.COUNT(fuente.id),
+                        fn.COALESCE(fn.SUM(fuente.mano_obra), 0),
+                        fn.COALESCE(fn.SUM(fuente.porcentaje_avance), 0),
+                        fn.COALESCE(fn.SUM(fuente.monto_contrato), 0)]
+            filas = []
+            # Una sola transacción: todas las dimensiones ven los mismos datos
+            with db.atomic():
+                for dimension in SnapshotIndicador.DIMENSIONES:
+                    if dimension == 'total':
+                        grupos = [[None, *fila] for fila in fuente.select(*metricas).tuples()]
+                    else:
+                        campo = getattr(fuente, dimension)
+                        consulta = fuente.select(campo, *metricas).group_by(campo).order_by(campo).tuples()
+                        grupos = [list(fila) for fila in consulta]
+                    filas.append({'dimension': dimension, 'fecha': fecha,
+                                  'valores': json.dumps(grupos, ensure_ascii=False, separators=(',', ':'))})
+                SnapshotIndicador.replace_many(filas).execute()
+            print(f"Snapshot de indicadores del {fecha.isoformat()} guardado ({len(filas)} dimensiones).")
+            return len(filas)
+        finally:
+            if not db.is_closed():
+                db.close()
+
+    # Inicio del período al que pertenece una fecha
+    PERIODOS = {
+        'dia': lambda fecha: fecha,
+        'semana': lambda fecha: fecha - timedelta(days=fecha.weekday()), # Lunes
+        'mes': lambda fecha: fecha.replace(day=1),
+    }
+
+    @classmethod
+    def tendencia_indicador(cls, dimension='total', valor=None, metrica='cantidad', periodo='semana',
+                            desde=None, hasta=None):
+        """
+        Serie de un indicador a partir de los snapshots diarios, por ejemplo
+        tendencia_indicador('etapa', 'En Ejecucion', periodo='semana') para las obras en ejecución por semana.
+        - valor: grupo dentro de la dimensión (se ignora para 'total'); un día sin obras de ese grupo cuenta 0.
+        - metrica: 'cantidad', 'mano_obra', 'porcentaje_avance' o 'monto_contrato' (sumas); las fotos
+          tomadas antes de que existiera monto_contrato dan None en esa métrica.
+        - periodo: 'dia', 'semana' o 'mes'; de cada período se toma el último snapshot.
+        Retorna una lista de (inicio_del_periodo, valor) ordenada por fecha. No abre ni cierra la conexión.
+        """
+        if dimension not in SnapshotIndicador.DIMENSIONES:
+            raise ValueError(f"Dimensión no admitida: '{dimension}'. Opciones: {', '.join(SnapshotIndicador.DIMENSIONES)}")
+        if metrica not in SnapshotIndicador.METRICAS:
+            raise ValueError(f"Métrica no admitida: '{metrica}'. Opciones: {', '.join(SnapshotIndicador.METRICAS)}")
+        if periodo not in cls.PERIODOS:
+            raise ValueError(f"Período no admitido: '{periodo}'. Opciones: {', '.join(cls.PERIODOS)}")
+
+        consulta = SnapshotIndicador.select().where(SnapshotIndicador.dimension == dimension)
+        if desde is not None:
+            consulta = consulta.where(SnapshotIndicador.fecha >= normalizar_fecha(desde))
+        if hasta is not None:
+            consulta = consulta.where(SnapshotIndicador.fecha <= normalizar_fecha(hasta))
+
+        serie = {} # inicio del período -> valor del último snapshot del período
+        for snapshot in consulta.order_by(SnapshotIndicador.fecha):
+            grupos = snapshot.grupos()
+            if dimension == 'total':
+                metricas = next(iter(grupos.values()), None)
+            else:
+                # Los valores vienen del JSON: la comuna 3 se puede pedir como 3 o como '3'
+                metricas = next((m for v, m in grupos.items() if v == valor or str(v) == str(valor)), None)
+            serie[cls.PERIODOS[periodo](snapshot.fecha)] = metricas.get(metrica) if metricas else 0
+        return list(serie.items())
+
     @classmethod
     def nueva_obra(cls):
         """
@@ -288,73 +496,72 @@ class GestionarObra(ABC):
                 db.close()
                 print("Conexión a la base de datos cerrada después de crear nueva obra.")
     
+    # Campos que devuelve la API de lectura para cada obra
+    CAMPOS_LECTURA = [
+        'id', 'nombre', 'etapa', 'tipo_obra', 'area_responsable', 'estado',
+        'comuna', 'barrio', 'direccion', 'latitud', 'longitud', 'geo_confianza', 'fecha_inicio', 'fecha_fin_inicial',
+        'porcentaje_avance', 'plazo_meses', 'mano_obra', 'tipo_contratacion',
+        'nro_contratacion', 'empresa_adjudicada', 'nro_expediente'
+    ]
+
+    @classmethod
+    @cache_consultas.cacheada()
+    def calcular_indicadores(cls):
+        """
+        Calcula los indicadores de obras y los retorna en un diccionario.
+        No abre ni cierra la conexión ni imprime nada: eso queda a cargo de quien la llama
+        (obtener_indicadores() o la API HTTP). El resultado queda en cache_consultas hasta
+        que cambien los datos. Incluye las obras archivadas (vista histórica).
+        """
+        fuente = modelo_de_lectura(Obra)
+
+        def contar_por(campo):
+            # SELECT campo, COUNT(id) FROM obras GROUP BY campo ORDER BY COUNT(id) DESC;
+            consulta = (fuente
+                        .select(campo, fn.COUNT(fuente.id).alias('cantidad'))
+                        .group_by(campo)
+                        .order_by(fn.COUNT(fuente.id).desc())
+                        .tuples())
+            return [[valor, cantidad] for valor, cantidad in consulta]
+
+        return {
+            'total_obras': fuente.select().count(),
+            'obras_por_tipo': contar_por(fuente.tipo_obra),
+            'obras_por_area': contar_por(fuente.area_responsable),
+            'obras_por_estado': contar_por(fuente.estado),
+        }
+
+    @classmethod
+    @medir('obtener_indicadores')
     def obtener_indicadores(cls):
         """
         Obtiene y muestra indicadores básicos de las obras existentes en la base de datos.
+        Retorna el diccionario de indicadores (o None si hubo un error).
         """
         print("\n--- Obteniendo indicadores de obras ---")
         cls.conectar_db() # Nos aseguramos de estar conectados a la BD
 
         try:
+            indicadores = cls.calcular_indicadores()
+
             # 1. Cantidad total de obras
-            total_obras = Obra.select().count()
-            print(f"1. Cantidad total de obras: {total_obras}")
-
-            # 2. Obras por tipo
-            # SELECT tipo_obra, COUNT(id) FROM obras GROUP BY tipo_obra;
-            print("\n2. Obras por tipo:")
-            # .dicts() convierte los resultados en diccionarios Python, más fácil de manejar.
-            obras_por_tipo = (Obra
-                                .select(Obra.tipo_obra, fn.COUNT(Obra.id).alias('cantidad'))
-                                .group_by(Obra.tipo_obra)
-                                .order_by(fn.COUNT(Obra.id).desc()) # Ordenamos de mayor a menor
-                                .dicts()) # Obtener los resultados como diccionarios
-
-            if not obras_por_tipo:
-                print("   No hay obras registradas por tipo.")
-            else:
-                for item in obras_por_tipo:
-                    tipo = item['tipo_obra'] if item['tipo_obra'] else "Sin Tipo (Nulo)"
-                    cantidad = item['cantidad']
-                    print(f"   - {tipo}: {cantidad}")
-
-            # 3. Obras por área responsable
-            print("\n3. Obras por área responsable:")
-            obras_por_area = (Obra
-                                .select(Obra.area_responsable, fn.COUNT(Obra.id).alias('cantidad'))
-                                .group_by(Obra.area_responsable)
-                                .order_by(fn.COUNT(Obra.id).desc())
-                                .dicts())
-
-            if not obras_por_area:
-                print("   No hay obras registradas por área responsable.")
-            else:
-                for item in obras_por_area:
-                    area = item['area_responsable'] if item['area_responsable'] else "Sin Área (Nulo)"
-                    cantidad = item['cantidad']
-                    print(f"   - {area}: {cantidad}")
-
-            # 4. Obras por estado
-            print("\n4. Obras por estado:")
-            obras_por_estado = (Obra
-                                .select(Obra.estado, fn.COUNT(Obra.id).alias('cantidad'))
-                                .group_by(Obra.estado)
-                                .order_by(fn.COUNT(Obra.id).desc())
-                                .dicts())
-
-            if not obras_por_estado:
-                print("   No hay obras registradas por estado.")
-            else:
-                for item in obras_por_estado:
-                    estado = item['estado'] if item['estado'] else "Sin Estado (Nulo)"
-                    cantidad = item['cantidad']
-                    print(f"   - {estado}: {cantidad}")
+            print(f"1. Cantidad total de obras: {indicadores['total_obras']}")
+
+            # 2, 3 y 4. Obras agrupadas por tipo, área responsable y estado
+            secciones = [
+                ('2. Obras por tipo:', 'obras_por_tipo', 'tipo', "Sin Tipo (Nulo)"),
+                ('3. Obras por área responsable:', 'obras_por_area', 'área responsable', "Sin Área (Nulo)"),
+                ('4. Obras por estado:', 'obras_por_estado', 'estado', "Sin Estado (Nulo)"),
+            ]
+            for titulo, clave, descripcion, sin_valor in secciones:
+                print(f"\n{titulo}")
+                if not indicadores[clave]:
+                    print(f"   No hay obras registradas por {descripcion}.")
+                for valor, cantidad in indicadores[clave]:
+                    print(f"   - {valor if valor else sin_valor}: {cantidad}")
 
             print("\nGeneración de indicadores completada.")
-            # Este método no necesita retornar un diccionario, solo imprime.
-            # Si en el futuro lo necesitaras, puedes descomentar la línea
-            # que crea y retorna el diccionario 'indicadores'.
-            # return indicadores
+            return indicadores
 
         except Exception as e:
             print(f"Error al obtener indicadores de obras: {e}")
@@ -364,6 +571,62 @@ class GestionarObra(ABC):
                 db.close()
                 print("Conexión a la base de datos cerrada después de obtener indicadores.")
 
+    @classmethod
+    @cache_consultas.cacheada()
+    def listar_obras(cls, etapa=None, barrio=None, comuna=None, despues_de=0, limite=50):
+        """
+        Lista obras filtradas por etapa, barrio y/o comuna, paginando por clave (keyset) sobre Obra.id.
+        En lugar de OFFSET se pide "las siguientes `limite` obras con id mayor a `despues_de`",
+        así el costo de una página no depende de qué tan lejos esté en la tabla.
+        Retorna (lista_de_diccionarios, siguiente_cursor); el cursor es None en la última página.
+        Incluye las obras archivadas. No abre ni cierra la conexión.
+        """
+        fuente = modelo_de_lectura(Obra)
+        consulta = fuente.select().where(fuente.id > despues_de)
+        if etapa is not None:
+            consulta = consulta.where(fuente.etapa == etapa)
+        if barrio is not None:
+            consulta = consulta.where(fuente.barrio == barrio)
+        if comuna is not None:
+            consulta = consulta.where(fuente.comuna == comuna)
+
+        # Pedimos una fila de más para saber si existe una página siguiente
+        campos = [getattr(fuente, campo) for campo in cls.CAMPOS_LECTURA]
+        filas = list(consulta.select(*campos).order_by(fuente.id).limit(limite + 1).dicts())
+        siguiente = None
+        if len(filas) > limite:
+            filas = filas[:limite]
+            siguiente = filas[-1]['id']
+        return filas, siguiente
+
+    @classmethod
+    @cache_consultas.cacheada()
+    def obtener_obra(cls, obra_id):
+        """
+        Retorna la obra con el id indicado como diccionario, o None si no existe.
+        Busca también entre las obras archivadas. No abre ni cierra la conexión.
+        """
+        fuente = modelo_de_lectura(Obra)
+        campos = [getattr(fuente, campo) for campo in cls.CAMPOS_LECTURA]
+        return fuente.select(*campos).where(fuente.id == obra_id).dicts().first()
+
+    @classmethod
+    @medir('archivar_obras')
+    def archivar_obras(cls, filas_por_lote=1000):
+        """
+        Mueve las obras finalizadas y rescindidas a la tabla 'obra_archivo' (ver archivo.py).
+        Siguen apareciendo en indicadores, listados y obtener_obra() a través de la vista
+        'obra_historico'. Retorna la cantidad de obras movidas.
+        """
+        cls.conectar_db()
+        try:
+            movidas = archivar(Obra, Obra.ETAPAS_TERMINADAS, filas_por_lote)
+            print(f"Se archivaron {movidas} obras terminadas en '{modelo_archivo(Obra)._meta.table_name}'.")
+            return movidas
+        finally:
+            if not db.is_closed():
+                db.close()
+
     @classmethod
     def nueva_obra(cls):
             """
@@ -415,6 +678,7 @@ class GestionarObra(ABC):
 
                 estado = input("Estado de la obra: ").strip()
                 comuna_str = input("Comuna (número entero, dejar vacío si no aplica): ").strip()
+                direccion = input("Dirección (calle y altura o esquina, dejar vacío si no aplica): ").strip()
                 latitud_str = input("Latitud (número decimal, ej: -34.6, dejar vacío si no aplica): ").strip()
                 longitud_str = input("Longitud (número decimal, ej: -58.4, dejar vacío si no aplica): ").strip()
                 fecha_inicio = input("Fecha de inicio (YYYY-MM-DD, dejar vacío si no aplica): ").strip()
@@ -441,6 +705,15 @@ class GestionarObra(ABC):
                     except ValueError:
                         print("Longitud ingresada no es un número decimal válido. Se guardará como vacío.")
 
+                geo_confianza = 1.0 if latitud is not None and longitud is not None else None
+                if geo_confianza is None and (direccion or barrio or comuna is not None):
+                    # Sin coordenadas: se buscan en el nomenclador local, como en la carga del CSV
+                    nomenclador = obtener_nomenclador()
+                    if nomenclador is not None:
+                        latitud, longitud, geo_confianza = nomenclador.resolver(direccion, barrio, comuna)
+                        if geo_confianza is not None:
+                            print(f"Coordenadas tomadas del nomenclador: ({latitud}, {longitud}), confianza {geo_confianza}.")
+
                 nueva_obra_obj = Obra.create(
                     nombre=nombre if nombre else None,
                     etapa=etapa if etapa else None,
@@ -449,8 +722,10 @@ class GestionarObra(ABC):
                     estado=estado if estado else None,
                     comuna=comuna,
                     barrio=barrio,
+                    direccion=direccion if direccion else None,
                     latitud=latitud,
                     longitud=longitud,
+                    geo_confianza=geo_confianza,
                     fecha_inicio=fecha_inicio if fecha_inicio else None,
                     fecha_fin_inicial=fecha_fin_inicial if fecha_fin_inicial else None,
                     tipo_contratacion=tipo_contratacion,
@@ -0,0 +1,276 @@
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+# Instrumentación del proceso de obras: tiempo por etapa, sentencias SQL y filas
+# afectadas por etapa, y contadores agregados de eventos (filas omitidas, duplicadas, etc.).
+#
+# Uso típico:
+#   instrumentacion.activar(db)
+#   ... correr el proceso ...
+#   instrumentacion.volcar_resumen('instrumentacion.json')
+#
+# Mientras está desactivada, @medir y contar() no hacen nada más que comprobar un booleano,
+# así que se pueden dejar puestos en el código de todos los días.
+#
+# Con activar(db, memoria=True) cada etapa registra además:
+#   - rss_pico_mb: el pico de memoria residente del proceso durante la etapa (VmHWM de Linux,
+#     que se reinicia al empezar cada etapa; en otros sistemas es el pico desde que arrancó el proceso),
+#   - python_pico_mb: el pico de memoria asignada por Python (tracemalloc),
+#   - mayores_asignaciones: las líneas de código que más memoria dejaron asignada al terminar la etapa.
+# tracemalloc hace bastante más lento el proceso: es para diagnosticar, no para dejarlo activo.
+
+_KB = 1024
+_MB = 1024 * 1024
+
+
+def _leer_status(clave):
+    """Valor en bytes de una línea de /proc/self/status ('VmRSS', 'VmHWM'), o None fuera de Linux."""
+    try:
+        with open('/proc/self/status', encoding='ascii') as archivo:
+            for linea in archivo:
+                if linea.startswith(clave + ':'):
+                    return int(linea.split()[1]) * _KB
+    except OSError:
+        pass
+    return None
+
+
+def rss_actual():
+    return _leer_status('VmRSS')
+
+
+def rss_pico():
+    """Pico de memoria residente en bytes (desde el último reiniciar_rss_pico() si se pudo reiniciar)."""
+    pico = _leer_status('VmHWM')
+    if pico is None:
+        try:
+            import resource
+            import sys
+            pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            pico *= 1 if sys.platform == 'darwin' else _KB # macOS lo da en bytes, Linux en KB
+        except ImportError: # Windows
+            return None
+    return pico
+
+
+def reiniciar_rss_pico():
+    """Vuelve el pico de RSS al valor actual (solo Linux). Retorna False si no se pudo."""
+    try:
+        with open('/proc/self/clear_refs', 'w', encoding='ascii') as archivo:
+            archivo.write('5')
+        return True
+    except OSError:
+        return False
+
+
+logger = logging.getLogger('obras')
+
+
+class Instrumentacion:
+    def __init__(self):
+        self.activa = False
+        self.etapas = {} # nombre -> {'llamadas', 'segundos', 'consultas_sql', 'filas_afectadas'}
+        self.contadores = Counter()
+        self._local = threading.local() # Pila de etapas en curso, una por hilo
+        self._bases_instrumentadas = []
+        self.memoria = False
+        self.max_asignaciones = 10 # Líneas de código que se informan por etapa
+        self._rss_inicial = None
+        self._pico_reiniciable = False
+
+    def _pila(self):
+        if not hasattr(self._local, 'pila'):
+            self._local.pila = []
+        return self._local.pila
+
+    def _pila_memoria(self):
+        if not hasattr(self._local, 'pila_memoria'):
+            self._local.pila_memoria = []
+        return self._local.pila_memoria
+
+    def _estadistica(self, nombre):
+        if nombre not in self.etapas:
+            self.etapas[nombre] = {'llamadas': 0, 'segundos': 0.0, 'consultas_sql': 0, 'filas_afectadas': 0}
+        return self.etapas[nombre]
+
+    def activar(self, *bases, memoria=False):
+        """
+        Activa la instrumentación y engancha execute_sql() de cada base de datos peewee
+        indicada para contar las sentencias SQL y las filas que afectan.
+        Con memoria=True también se mide la memoria de cada etapa (ver el comentario del módulo).
+        """
+        self.activa = True
+        if memoria and not self.memoria:
+            self.memoria = True
+            tracemalloc.start()
+            self._rss_inicial = rss_actual()
+            self._pico_reiniciable = reiniciar_rss_pico()
+        for base in bases:
+            if any(base is instrumentada for instrumentada, _ in self._bases_instrumentadas):
+                continue
+            original = base.execute_sql
+
+            @wraps(original)
+            def execute_sql(sql, *args, _original=original, **kwargs):
+                cursor = _original(sql, *args, **kwargs)
+                if self.activa:
+                    filas = max(cursor.rowcount, 0) # rowcount es -1 para los SELECT
+                    for nombre in self._pila():
+                        estadistica = self._estadistica(nombre)
+                        estadistica['consultas_sql'] += 1
+                        estadistica['filas_afectadas'] += filas
+                return cursor
+
+            base.execute_sql = execute_sql
+            self._bases_instrumentadas.append((base, original))
+
+    def desactivar(self):
+        """Desactiva la instrumentación y restaura el execute_sql() original de cada base."""
+        self.activa = False
+        if self.memoria:
+            self.memoria = False
+            tracemalloc.stop()
+        for base, original in self._bases_instrumentadas:
+            base.execute_sql = original
+        self._bases_instrumentadas = []
+
+    def reiniciar(self):
+        self.etapas = {}
+        self.contadores = Counter()
+
+    @contextmanager
+    def etapa(self, nombre):
+        """
+        Mide el tiempo de un bloque y le atribuye las sentencias SQL que se ejecuten dentro.
+        Las etapas se pueden anidar: los tiempos y consultas son inclusivos.
+        """
+        if not self.activa:
+            yield
+            return
+        pila = self._pila()
+        pila.append(nombre)
+        if self.memoria:
+            self._empezar_medicion_memoria()
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            transcurrido = time.perf_counter() - inicio
+            pila.pop()
+            estadistica = self._estadistica(nombre)
+            estadistica['llamadas'] += 1
+            estadistica['segundos'] += transcurrido
+            if self.memoria and self._pila_memoria():
+                self._terminar_medicion_memoria(estadistica)
+            logger.debug("Etapa '%s' terminada en %.3f s", nombre, transcurrido)
+
+    def _registrar_picos(self):
+        """
+        Pasa los picos actuales (RSS y tracemalloc) a todas las etapas en curso y los reinicia.
+        Así una etapa anidada mide solo lo suyo y las de afuera igual se quedan con el máximo.
+        """
+        rss, (_, python) = rss_pico() or 0, tracemalloc.get_traced_memory()
+        for medicion in self._pila_memoria():
+            medicion['rss_pico'] = max(medicion['rss_pico'], rss)
+            medicion['python_pico'] = max(medicion['python_pico'], python)
+        if self._pico_reiniciable:
+            reiniciar_rss_pico()
+        tracemalloc.reset_peak()
+
+    def _empezar_medicion_memoria(self):
+        self._registrar_picos()
+        self._pila_memoria().append({'rss_pico': 0, 'python_pico': 0, 'foto': tracemalloc.take_snapshot()})
+
+    def _terminar_medicion_memoria(self, estadistica):
+        self._registrar_picos()
+        medicion = self._pila_memoria().pop()
+        anterior = estadistica.get('memoria')
+        if anterior is not None and anterior['rss_pico'] >= medicion['rss_pico']:
+            return # Se informa la llamada de mayor pico
+        # Diferencia entre las fotos de tracemalloc: lo que la etapa dejó asignado, por línea de código
+        # (sin las de tracemalloc, este módulo y la maquinaria de importación, que solo mete ruido)
+        filtros = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__),
+                   tracemalloc.Filter(False, '<frozen importlib._bootstrap*>')]
+        diferencias = (tracemalloc.take_snapshot().filter_traces(filtros)
+                       .compare_to(medicion['foto'].filter_traces(filtros), 'lineno'))
+        estadistica['memoria'] = {
+            'rss_pico': medicion['rss_pico'],
+            'python_pico': medicion['python_pico'],
+            'mayores_asignaciones': [
+                {'lugar': f'{d.traceback[0].filename}:{d.traceback[0].lineno}',
+                 'kb': round(d.size_diff / _KB, 1), 'bloques': d.count_diff}
+                for d in diferencias[:self.max_asignaciones] if d.size_diff > 0
+            ],
+        }
+
+    def medir(self, nombre=None):
+        """Decorador que mide cada llamada a la función como una etapa."""
+        def decorador(funcion):
+            nombre_etapa = nombre or funcion.__qualname__
+
+            @wraps(funcion)
+            def envoltura(*args, **kwargs):
+                if not self.activa:
+                    return funcion(*args, **kwargs)
+                with self.etapa(nombre_etapa):
+                    return funcion(*args, **kwargs)
+            return envoltura
+        return decorador
+
+    def contar(self, evento, cantidad=1):
+        """Suma `cantidad` al contador agregado del evento (por ejemplo 'filas_duplicadas')."""
+        if self.activa:
+            self.contadores[evento] += cantidad
+
+    def resumen(self):
+        etapas = {}
+        for nombre, estadistica in self.etapas.items():
+            etapas[nombre] = dict(estadistica, segundos=round(estadistica['segundos'], 6))
+            if 'memoria' in estadistica:
+                memoria = estadistica['memoria']
+                etapas[nombre]['memoria'] = {
+                    'rss_pico_mb': round(memoria['rss_pico'] / _MB, 1),
+                    'python_pico_mb': round(memoria['python_pico'] / _MB, 1),
+                    'mayores_asignaciones': memoria['mayores_asignaciones'],
+                }
+        resumen = {'etapas': etapas, 'contadores': dict(self.contadores)}
+        if self._rss_inicial is not None:
+            resumen['memoria'] = {
+                'rss_inicial_mb': round(self._rss_inicial / _MB, 1),
+                # Si el pico no se puede reiniciar, el de cada etapa es el pico desde que arrancó el proceso
+                'pico_por_etapa': self._pico_reiniciable,
+            }
+        return resumen
+
+    def volcar_resumen(self, ruta):
+        """Escribe el resumen en formato JSON y lo deja también en el log."""
+        resumen = self.resumen()
+        with open(ruta, 'w', encoding='utf-8') as archivo:
+            json.dump(resumen, archivo, ensure_ascii=False, indent=2)
+        for nombre, estadistica in resumen['etapas'].items():
+            logger.info("%s: %d llamada(s), %.3f s, %d consultas SQL, %d filas afectadas",
+                        nombre, estadistica['llamadas'], estadistica['segundos'],
+                        estadistica['consultas_sql'], estadistica['filas_afectadas'])
+            if 'memoria' in estadistica:
+                memoria = estadistica['memoria']
+                logger.info("%s: pico RSS %.1f MB, pico Python %.1f MB", nombre,
+                            memoria['rss_pico_mb'], memoria['python_pico_mb'])
+                for asignacion in memoria['mayores_asignaciones'][:3]:
+                    logger.info("    %s: %.1f KB en %d bloques", asignacion['lugar'], asignacion['kb'], asignacion['bloques'])
+        for evento, cantidad in resumen['contadores'].items():
+            logger.info("%s: %d", evento, cantidad)
+        logger.info("Resumen de instrumentación guardado en '%s'.", ruta)
+        return resumen
+
+
+# Instancia única que usa todo el proceso
+instrumentacion = Instrumentacion()
+medir = instrumentacion.medir
+etapa = instrumentacion.etapa
+contar = instrumentacion.contar
@@ -0,0 +1,134 @@
+import codecs
+import csv
+import importlib.util
+
+# Lectura del CSV de obras, compartida por gestionar_obras.py y gestionar_obras2.py.
+#
+# - La codificación y el separador se detectan leyendo solo el comienzo del archivo
+#   (el dataset del observatorio viene en latin-1 con ';', pero otras exportaciones no).
+#   Si el comienzo es UTF-8 válido pero más adelante aparece un byte que no lo es, el
+#   archivo se vuelve a leer completo como latin-1.
+# - Con motor='pyarrow' (o 'auto' si pyarrow está instalado) se usa el lector CSV de
+#   Arrow, que parsea en varios hilos. Si pyarrow no está o no puede con el archivo, se
+#   vuelve al parser C de pandas, que es lo que se usaba antes.
+# - Las columnas que no se van a usar no se leen (include_columns / usecols) y las de
+#   texto se leen directamente como texto, sin que el lector intente adivinar su tipo.
+
+MOTORES = ('auto', 'pyarrow', 'c')
+SEPARADORES = ';,\t|'
+BYTES_MUESTRA = 64 * 1024
+
+
+class CodificacionIncorrecta(Exception):
+    """El archivo tiene bytes que no son válidos en la codificación detectada al comienzo."""
+
+
+def detectar_formato(ruta, bytes_muestra=BYTES_MUESTRA):
+    """
+    Lee los primeros `bytes_muestra` bytes del archivo y retorna (codificacion, separador, encabezados).
+    Si el comienzo no es UTF-8 válido se asume latin-1, que acepta cualquier byte.
+    """
+    with open(ruta, 'rb') as archivo:
+        muestra = archivo.read(bytes_muestra)
+
+    codificacion = 'utf-8-sig' if muestra.startswith(codecs.BOM_UTF8) else 'utf-8'
+    try:
+        # final=False: un carácter multibyte cortado al final de la muestra no es un error
+        texto = codecs.getincrementaldecoder(codificacion)().decode(muestra, final=False)
+    except UnicodeDecodeError:
+        codificacion = 'latin-1'
+        texto = muestra.decode(codificacion)
+
+    lineas = texto.splitlines()
+    if len(muestra) == bytes_muestra and len(lineas) > 1:
+        lineas = lineas[:-1] # La última línea de la muestra puede estar incompleta
+    try:
+        separador = csv.Sniffer().sniff('\n'.join(lineas[:20]), delimiters=SEPARADORES).delimiter
+    except csv.Error:
+        # El Sniffer no decide (por ejemplo con un solo renglón): el más frecuente en el encabezado
+        encabezado = lineas[0] if lineas else ''
+        separador = max(SEPARADORES, key=encabezado.count)
+    encabezados = next(csv.reader(lineas[:1], delimiter=separador), [])
+    return codificacion, separador, encabezados
+
+
+def pyarrow_disponible():
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def leer_csv(ruta, columnas=None, columnas_texto=(), motor='auto'):
+    """
+    Lee el CSV en un DataFrame.
+
+    - columnas: columnas a leer; las que no estén en el archivo se ignoran (None = todas).
+    - columnas_texto: columnas que se leen como texto sin inferir su tipo.
+    - motor: 'auto' (pyarrow si está instalado), 'pyarrow' o 'c' (parser de pandas).
+    Las líneas mal formadas se descartan, igual que con on_bad_lines='skip'.
+    """
+    if motor not in MOTORES:
+        raise ValueError(f"Motor de lectura no admitido: '{motor}'. Opciones: {', '.join(MOTORES)}")
+
+    codificacion, separador, encabezados = detectar_formato(ruta)
+    if columnas is not None:
+        columnas = [columna for columna in encabezados if columna in set(columnas)]
+    texto = [columna for columna in columnas_texto if columna in (columnas or encabezados)]
+    print(f"Leyendo '{ruta}' (codificación {codificacion}, separador {separador!r}).")
+
+    if motor == 'auto':
+        motor = 'pyarrow' if pyarrow_disponible() else 'c'
+    if motor == 'pyarrow' and not pyarrow_disponible():
+        print("pyarrow no está instalado; se usa el lector de pandas.")
+        motor = 'c'
+
+    try:
+        return _leer(ruta, motor, codificacion, separador, columnas, texto)
+    except (UnicodeDecodeError, CodificacionIncorrecta) as e:
+        if codificacion == 'latin-1':
+            raise
+        # La muestra era UTF-8 válido pero el resto del archivo no (latin-1 acepta cualquier byte)
+        print(f"'{ruta}' no es {codificacion} válido más allá del comienzo ({e}); se vuelve a leer como latin-1.")
+        return _leer(ruta, motor, 'latin-1', separador, columnas, texto)
+
+
+def _leer(ruta, motor, codificacion, separador, columnas, texto):
+    if motor == 'pyarrow':
+        try:
+            return _leer_con_pyarrow(ruta, codificacion, separador, columnas, texto)
+        except CodificacionIncorrecta:
+            raise
+        except Exception as e:
+            print(f"El lector de pyarrow no pudo leer el archivo ({e}); se usa el lector de pandas.")
+    return _leer_con_pandas(ruta, codificacion, separador, columnas, texto)
+
+
+def _leer_con_pyarrow(ruta, codificacion, separador, columnas, texto):
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    opciones_lectura = pa_csv.ReadOptions(encoding='utf-8' if codificacion == 'utf-8-sig' else codificacion,
+                                          use_threads=True)
+    opciones_parseo = pa_csv.ParseOptions(delimiter=separador,
+                                          newlines_in_values=True, # Descripciones con saltos de línea
+                                          invalid_row_handler=lambda fila: 'skip')
+    opciones_conversion = pa_csv.ConvertOptions(include_columns=columnas,
+                                                column_types={columna: pa.string() for columna in texto},
+                                                strings_can_be_null=True) # '' -> nulo, como en pandas
+    try:
+        tabla = pa_csv.read_csv(ruta, read_options=opciones_lectura, parse_options=opciones_parseo,
+                                convert_options=opciones_conversion)
+    except pa.ArrowInvalid as e:
+        if 'invalid UTF8' in str(e):
+            raise CodificacionIncorrecta(str(e)) from e
+        raise
+    # Con texto que no es UTF-8 válido pyarrow no falla: deja la columna como binaria (bytes)
+    binarias = [campo.name for campo in tabla.schema if pa.types.is_binary(campo.type)]
+    if binarias:
+        raise CodificacionIncorrecta(f"columnas con texto no válido: {', '.join(binarias)}")
+    return tabla.to_pandas()
+
+
+def _leer_con_pandas(ruta, codificacion, separador, columnas, texto):
+    import pandas as pd
+
+    return pd.read_csv(ruta, encoding=codificacion, sep=separador, usecols=columnas,
+                       dtype={columna: str for columna in texto}, on_bad_lines='skip')
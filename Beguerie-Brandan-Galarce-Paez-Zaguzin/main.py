@@ -1,7 +1,21 @@
-from gestionar_obras import GestionarObra
-from modelo_orm import Obra, db
+import argparse
+import logging
+
+from gestionar_obras2 import GestionarObra
+from modelo_orm2 import Obra, db
+from instrumentacion import instrumentacion
+
+def ejecutar_proceso(resumen_instrumentacion=None, perfil_memoria=None):
+    """
+    Corre el proceso completo. Si se indica `resumen_instrumentacion` (ruta a un .json),
+    se miden las etapas y las consultas SQL y al final se guarda el resumen en esa ruta.
+    Con `perfil_memoria` (ruta a un .json) se mide además la memoria de cada etapa (pico de RSS,
+    pico de tracemalloc y mayores asignaciones) y el resumen se guarda en esa ruta.
+    El chequeo de memoria contra un presupuesto, sin pasos interactivos, está en prueba_memoria.py.
+    """
+    if resumen_instrumentacion or perfil_memoria:
+        instrumentacion.activar(db, memoria=bool(perfil_memoria))
 
-def ejecutar_proceso():
     print("--- Inicio del Proceso de Gestión de Obras ---")
 
     # 1. Asegurarse de que la base de datos y la tabla estén creadas
@@ -16,6 +30,7 @@ def ejecutar_proceso():
             if df_obras is not None:
                 df_limpio = GestionarObra.limpiar_datos(df_obras)
                 if df_limpio is not None:
+                    df_limpio = GestionarObra.geocodificar_datos(df_limpio)
                     GestionarObra.cargar_datos(df_limpio)
         else:
             print("\nLa base de datos ya contiene obras. No se cargará el CSV de nuevo.")
@@ -198,5 +213,22 @@ def ejecutar_proceso():
 
     print("\n--- Fin del Proceso ---")
 
+    if resumen_instrumentacion or perfil_memoria:
+        for ruta in dict.fromkeys(ruta for ruta in (resumen_instrumentacion, perfil_memoria) if ruta):
+            instrumentacion.volcar_resumen(ruta)
+        instrumentacion.desactivar()
+
 if __name__ == "__main__":
-    ejecutar_proceso()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Proceso de gestión de obras urbanas.")
+    parser.add_argument('--instrumentar', nargs='?', const='instrumentacion.json', default=None, metavar='RUTA_JSON',
+                        help="Mide tiempos y consultas SQL por etapa y guarda el resumen (por defecto en instrumentacion.json).")
+    parser.add_argument('--detalle', action='store_true',
+                        help="Con --instrumentar, muestra en el log el tiempo de cada etapa al terminar. "
+                             "Las filas omitidas en la carga no van al log: quedan en filas_rechazadas.csv.")
+    parser.add_argument('--perfil-memoria', '--profile-memory', nargs='?', const='perfil_memoria.json', default=None,
+                        metavar='RUTA_JSON',
+                        help="Mide la memoria de cada etapa (pico de RSS y tracemalloc) y guarda el informe "
+                             "(por defecto en perfil_memoria.json). Hace el proceso más lento.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG if args.detalle else logging.INFO, format='%(levelname)s %(message)s')
+    ejecutar_proceso(args.instrumentar, args.perfil_memoria)
\ No newline at end of file
@@ -0,0 +1,146 @@
+from collections import namedtuple
+from itertools import islice, repeat
+
+# Mapeo declarativo de las columnas del DataFrame limpio a los campos de Obra, compartido por
+# los dos esquemas (gestionar_obras.py y gestionar_obras2.py) y por la carga en paralelo.
+#
+# Cada modelo declara una sola vez qué columna alimenta cada campo y con qué conversión:
+#
+#   MAPEO = MapeoFilas([
+#       Campo('nombre', 'nombre'),
+#       Campo('latitud', 'lat', numero),
+#       Campo('barrio'), # Sin columna: el valor lo calcula quien carga (por ejemplo un id de referencia)
+#   ])
+#
+# compilar() arma, una vez por modelo y conjunto de columnas, una función que convierte
+# columnas enteras (no fila por fila) y las junta en tuplas listas para insert_many():
+# los nulos de pandas (NaN, NaT, NA) pasan a None, o al default del campo si tiene uno fijo,
+# y los escalares de numpy a tipos de Python. Una columna que no está en el DataFrame
+# deja el campo en su default (o NULL), como hacían los fila.get() de antes.
+#
+# insertar_filas() inserta esas tuplas por bloques y, si un bloque falla, lo reintenta fila
+# por fila para que solo las filas con problemas terminen en la cuarentena de rechazos.
+# Antes hay que llamar a registrar_referencias() para que los valores de diccionario se
+# agreguen fuera de esos bloques.
+
+FILAS_POR_INSERT = 500
+
+# - campo: nombre del campo del modelo.
+# - columna: columna del DataFrame; None si el valor se pasa ya calculado a filas().
+# - convertir: función opcional Serie -> Serie que se aplica a la columna completa.
+Campo = namedtuple('Campo', ['campo', 'columna', 'convertir'], defaults=(None, None))
+
+
+def numero(serie):
+    """Convierte a número; lo que no se puede convertir queda nulo (como limpiar_datos con latitud)."""
+    import pandas as pd
+    return pd.to_numeric(serie, errors='coerce')
+
+
+def a_valores(serie, por_defecto=None):
+    """Arreglo de objetos de Python con los nulos de pandas convertidos a `por_defecto`."""
+    return serie.astype(object).where(serie.notna(), por_defecto).to_numpy()
+
+
+class MapeoFilas:
+    def __init__(self, campos):
+        self.campos = [campo if isinstance(campo, Campo) else Campo(*campo) for campo in campos]
+        self.nombres = [campo.campo for campo in self.campos]
+        self._compilados = {} # (modelo, columnas del DataFrame) -> función
+
+    def campos_de(self, modelo):
+        """Campos del modelo en el orden de las tuplas (para insert_many(fields=...))."""
+        return [getattr(modelo, nombre) for nombre in self.nombres]
+
+    def compilar(self, modelo, columnas):
+        """
+        Retorna la función convertir(df, calculados) -> iterador de tuplas para el modelo y
+        las columnas indicadas. Se arma una sola vez por cada combinación.
+        """
+        clave = (modelo, tuple(columnas))
+        if clave in self._compilados:
+            return self._compilados[clave]
+
+        extractores = []
+        for campo in self.campos:
+            por_defecto = getattr(modelo, campo.campo).default
+            por_defecto = None if callable(por_defecto) else por_defecto
+            if campo.columna is None:
+                extractores.append(lambda df, calculados, nombre=campo.campo: calculados[nombre])
+            elif campo.columna in columnas:
+                convertir = campo.convertir or (lambda serie: serie)
+                extractores.append(lambda df, calculados, columna=campo.columna, convertir=convertir, por_defecto=por_defecto:
+                                   a_valores(convertir(df[columna]), por_defecto))
+            else:
+                extractores.append(lambda df, calculados, por_defecto=por_defecto: repeat(por_defecto, len(df)))
+
+        def convertir_filas(df, calculados):
+            return zip(*[extraer(df, calculados) for extraer in extractores])
+
+        self._compilados[clave] = convertir_filas
+        return convertir_filas
+
+    def registrar_referencias(self, modelo, df):
+        """
+        Para los campos que guardan una referencia a otra tabla (los que tienen
+        registrar_valores(), como CampoDiccionario) agrega de una vez todos los valores de su
+        columna, confirmados y fuera de cualquier transacción de la carga. Hay que llamarlo
+        antes de insertar_filas(): si no, cada valor nuevo se agregaría dentro del bloque que
+        lo usa y el rollback de un bloque rechazado podría dejar obras con códigos inexistentes.
+        """
+        for campo in self.campos:
+            registrar = getattr(getattr(modelo, campo.campo), 'registrar_valores', None)
+            if registrar is not None and campo.columna in df.columns:
+                serie = df[campo.columna]
+                if campo.convertir is not None:
+                    serie = campo.convertir(serie)
+                registrar(serie.dropna().unique())
+
+    def filas(self, modelo, df, **calculados):
+        """
+        Tuplas de valores (en el orden de self.nombres) para cada fila del DataFrame.
+        `calculados` trae, para los campos sin columna, una secuencia con un valor por fila.
+        """
+        return self.compilar(modelo, df.columns)(df, calculados)
+
+
+def insertar_filas(modelo, campos, filas, al_rechazar, filas_por_lote=None, filas_por_insert=FILAS_POR_INSERT):
+    """
+    Inserta las filas en la tabla del modelo con insert_many() de a `filas_por_insert`.
+
+    - campos: campos del modelo en el orden de las tuplas (ver MapeoFilas.campos_de()).
+    - filas: iterable de (posicion, tupla); la posición es la que recibe al_rechazar().
+    - al_rechazar(posicion, error): se llama por cada fila que no se pudo insertar.
+    - filas_por_lote: sin él todo va en una única transacción; con él se confirma cada
+      esa cantidad de filas (redondeada a bloques de insert) para no retener el bloqueo de escritura.
+
+    Si un bloque falla se deshace solo ese bloque (savepoint) y se reintenta fila por fila;
+    por eso los valores de diccionario tienen que estar ya registrados (MapeoFilas.registrar_referencias()).
+    Retorna la cantidad de filas insertadas.
+    """
+    db = modelo._meta.database
+    filas = iter(filas)
+    insertadas = 0
+    terminado = False
+    while not terminado:
+        with db.atomic():
+            en_transaccion = 0
+            while filas_por_lote is None or en_transaccion < filas_por_lote:
+                bloque = list(islice(filas, filas_por_insert))
+                if not bloque:
+                    terminado = True
+                    break
+                en_transaccion += len(bloque)
+                try:
+                    with db.atomic():
+                        modelo.insert_many([fila for _, fila in bloque], fields=campos).execute()
+                    insertadas += len(bloque)
+                except Exception:
+                    for posicion, fila in bloque:
+                        try:
+                            with db.atomic():
+                                modelo.insert_many([fila], fields=campos).execute()
+                            insertadas += 1
+                        except Exception as e:
+                            al_rechazar(posicion, e)
+    return insertadas
@@ -1,5 +1,9 @@
 from peewee import *
-from datetime import datetime
+from playhouse.sqlite_ext import AutoIncrementField
+from instrumentacion import medir
+from datetime import date, datetime
+import base64
+import json
 
 # Configuramos la base de datos SQLite
 db = SqliteDatabase('obras_urbanas.db')
@@ -21,8 +25,27 @@ class AreaResponsable(BaseModel):
 class Barrio(BaseModel):
     nombre = CharField(unique=True)
 
+# Empresas contratistas. El CSV escribe la misma empresa de muchas formas ('CONSTRUCTORA SUR S.A.',
+# 'Constructora Sur SA', ...); empresas.py las resuelve a una sola fila, primero por CUIT y
+# después por parecido del nombre normalizado (ver EmpresaTrigrama).
+class Empresa(BaseModel):
+    nombre = CharField() # Nombre tal como apareció la primera vez
+    nombre_normalizado = CharField(index=True) # Sin tildes, puntuación ni forma societaria
+    cuit = CharField(null=True, unique=True) # Solo dígitos
+
+# Índice de trigramas de Empresa.nombre_normalizado: los candidatos para un nombre nuevo son
+# las empresas que comparten trigramas con él, así no hay que compararlo con todas.
+class EmpresaTrigrama(BaseModel):
+    trigrama = CharField()
+    empresa = ForeignKeyField(Empresa, backref='trigramas', on_delete='CASCADE')
+
+    class Meta:
+        primary_key = CompositeKey('trigrama', 'empresa')
+        without_rowid = True
+
 # Modelo principal de Obra
 class Obra(BaseModel):
+    id = AutoIncrementField() # AUTOINCREMENT: los ids de las obras archivadas no se reusan (ver archivo.py)
     entorno = CharField(null=True)
     nombre = CharField()
     etapa = CharField(default='Proyecto')
@@ -40,6 +63,9 @@ class Obra(BaseModel):
     empresa_licitacion = CharField(null=True)
     nro_contratacion = CharField(null=True)
     cuit_contratista = CharField(null=True)
+    # Empresa resuelta a partir de empresa_licitacion y cuit_contratista (que quedan como vinieron).
+    # Sin índice propio: lo cubre el índice (empresa, monto_contrato) de Meta.indexes
+    empresa = ForeignKeyField(Empresa, backref='obras', null=True, index=False)
     contratacion_tipo = CharField(null=True)
     nro_expediente = CharField(null=True)
 
@@ -55,10 +81,12 @@ class Obra(BaseModel):
     direccion = CharField(null=True)
     latitud = FloatField(null=True)
     longitud = FloatField(null=True)
+    geo_confianza = FloatField(null=True) # 1.0 si las coordenadas venían en el CSV; menos si salen del nomenclador
 
     mano_obra = IntegerField(null=True)
     creado_en = DateTimeField(default=datetime.now)
 
+    @medir()
     def nuevo_proyecto(self, tipo_obra_obj, area_responsable_obj, barrio_obj):
         self.etapa = "Proyecto"
         self.tipo = tipo_obra_obj
@@ -67,6 +95,7 @@ class Obra(BaseModel):
         self.save()
         print(f"La obra '{self.nombre}' ha sido creada en la etapa: {self.etapa}")
 
+    @medir()
     def iniciar_contratacion(self, tipo_contratacion, nro_contratacion):
         self.etapa = "En Contratacion"
         self.contratacion_tipo = tipo_contratacion
@@ -74,13 +103,19 @@ class Obra(BaseModel):
         self.save()
         print(f"La obra '{self.nombre}' ha pasado a la etapa: {self.etapa}. Número de contratación: {self.nro_contratacion}")
 
+    @medir()
     def adjudicar_obra(self, empresa_licitacion, nro_expediente):
+        from empresas import ResolvedorEmpresas
+
         self.etapa = "Adjudicada"
         self.empresa_licitacion = empresa_licitacion
+        # Solo por nombre: el cuit_contratista que tenga la obra puede ser de una adjudicación anterior
+        self.empresa = ResolvedorEmpresas().resolver(empresa_licitacion)
         self.nro_expediente = nro_expediente
         self.save()
         print(f"La obra '{self.nombre}' ha pasado a la etapa: {self.etapa}. Empresa: {self.empresa_licitacion}")
 
+    @medir()
     def iniciar_obra(self, destacada_val, fecha_inicio_val, fecha_fin_inicial_val, fuente_financiamiento_val, mano_obra_val):
         self.etapa = "En Ejecucion"
         self.destacada = destacada_val
@@ -91,11 +126,13 @@ class Obra(BaseModel):
         self.save()
         print(f"La obra '{self.nombre}' ha pasado a la etapa: {self.etapa}. Inicio: {self.fecha_inicio}")
 
+    @medir()
     def actualizar_porcentaje_avance(self, porcentaje):
         self.porcentaje_avance = porcentaje
         self.save()
         print(f"La obra '{self.nombre}' ha actualizado su porcentaje de avance a: {self.porcentaje_avance}%")
 
+    @medir()
     def incrementar_plazo(self, meses):
         if self.plazo_meses is None:
             self.plazo_meses = 0
@@ -103,6 +140,7 @@ class Obra(BaseModel):
         self.save()
         print(f"La obra '{self.nombre}' ha incrementado su plazo en {meses} meses. Nuevo plazo: {self.plazo_meses} meses.")
 
+    @medir()
     def incrementar_mano_obra(self, cantidad):
         if self.mano_obra is None:
             self.mano_obra = 0
@@ -110,25 +148,155 @@ class Obra(BaseModel):
         self.save()
         print(f"La obra '{self.nombre}' ha incrementado su mano de obra en {cantidad}. Nueva mano de obra: {self.mano_obra}.")
 
+    @medir()
     def finalizar_obra(self):
         self.etapa = "Finalizada"
         self.porcentaje_avance = 100
         self.save()
         print(f"La obra '{self.nombre}' ha pasado a la etapa: {self.etapa}. Porcentaje de avance: {self.porcentaje_avance}%")
 
+    @medir()
     def rescindir_obra(self):
         self.etapa = "Rescindida"
         self.save()
         print(f"La obra '{self.nombre}' ha pasado a la etapa: {self.etapa}.")
 
+    # Órdenes admitidos por Obra.paginar(). Cada uno tiene su índice compuesto (campo, id)
+    # en Meta.indexes para que la búsqueda de la página siguiente sea un rango sobre el índice.
+    ORDENES_PAGINACION = ('fecha_inicio', 'monto_contrato', 'porcentaje_avance', 'creado_en')
+
     class Meta:
         database = db
         table_name = 'obras'
-        indexes = ((('nombre', 'barrio'), True),)
+        indexes = (
+            (('nombre', 'barrio'), True),
+            (('fecha_inicio', 'id'), False),
+            (('monto_contrato', 'id'), False),
+            (('porcentaje_avance', 'id'), False),
+            (('creado_en', 'id'), False),
+            (('empresa', 'monto_contrato'), False), # Obras y monto por empresa sin leer la tabla
+        )
+
+    @classmethod
+    def paginar(cls, orden='creado_en', cursor=None, limite=50, descendente=False, consulta=None):
+        """
+        Pagina obras por clave (keyset) sobre el par (orden, id), en lugar de LIMIT/OFFSET.
+        Cada página continúa desde la última fila de la anterior, así que pedir la página
+        1000 cuesta lo mismo que pedir la primera.
+
+        - orden: uno de Obra.ORDENES_PAGINACION.
+        - cursor: token opaco devuelto por la llamada anterior (None para la primera página).
+        - consulta: consulta base opcional (por ejemplo con filtros); por defecto Obra.select().
+
+        Retorna (lista_de_obras, siguiente_cursor); siguiente_cursor es None en la última página.
+        """
+        if orden not in cls.ORDENES_PAGINACION:
+            raise ValueError(f"Orden de paginación no admitido: '{orden}'. Opciones: {', '.join(cls.ORDENES_PAGINACION)}")
+        campo = getattr(cls, orden)
+        consulta = cls.select() if consulta is None else consulta
+
+        # "Después del cursor" se arma como una lista de tramos que se recorren en orden. Cada tramo
+        # es una condición que SQLite resuelve con un SEARCH sobre el índice (campo, id): el par
+        # se compara como row value, (campo, id) > (valor, id), y no con un OR de
+        # campo > valor OR (campo = valor AND id > ...), que lo obliga a recorrer todo el índice.
+        # SQLite ordena los NULL primero en orden ascendente y últimos en descendente, así que
+        # las obras sin valor van en un tramo aparte (solo si el campo admite NULL: si no, ese
+        # tramo no encuentra nada pero igual recorre el índice entero).
+        if cursor is None:
+            tramos = [None]
+        else:
+            valor, ultimo_id = _decodificar_cursor(cursor, campo, descendente)
+            if descendente:
+                if valor is None:
+                    tramos = [campo.is_null() & (cls.id < ultimo_id)]
+                else:
+                    tramos = [Tuple(campo, cls.id) < Tuple(campo.db_value(valor), ultimo_id)]
+                    if campo.null:
+                        tramos.append(campo.is_null())
+            else:
+                if valor is None:
+                    tramos = [campo.is_null() & (cls.id > ultimo_id), campo.is_null(False)]
+                else:
+                    tramos = [Tuple(campo, cls.id) > Tuple(campo.db_value(valor), ultimo_id)]
+
+        if descendente:
+            consulta = consulta.order_by(campo.desc(), cls.id.desc())
+        else:
+            consulta = consulta.order_by(campo, cls.id)
+
+        # Pedimos una fila de más para saber si hay página siguiente
+        obras = []
+        for condicion in tramos:
+            tramo = consulta if condicion is None else consulta.where(condicion)
+            obras.extend(tramo.limit(limite + 1 - len(obras)))
+            if len(obras) > limite:
+                break
+        siguiente = None
+        if len(obras) > limite:
+            obras = obras[:limite]
+            ultima = obras[-1]
+            siguiente = _codificar_cursor(orden, descendente, getattr(ultima, orden), ultima.id)
+        return obras, siguiente
+
+    # Campos propios que devuelve Obra.filas_livianas() si no se indican otros
+    CAMPOS_LIVIANOS = (
+        'id', 'nombre', 'etapa', 'comuna', 'direccion', 'latitud', 'longitud', 'geo_confianza',
+        'empresa_licitacion', 'cuit_contratista', 'monto_contrato', 'porcentaje_avance',
+        'fecha_inicio', 'fecha_fin_inicial', 'plazo_meses', 'mano_obra',
+    )
+
+    @classmethod
+    def filas_livianas(cls, campos=None, consulta=None):
+        """
+        Itera las obras como namedtuples de solo lectura, para reportes que recorren toda la tabla.
+        Cada fila es una tupla (sin el diccionario de cambios ni los descriptores de un modelo)
+        y trae los nombres de tipo, área, barrio y empresa resueltos con LEFT JOIN en la misma consulta,
+        así que no hay una consulta extra por fila como al acceder a obra.barrio.nombre.
+
+        - campos: nombres de campos propios de Obra (por defecto CAMPOS_LIVIANOS).
+        - consulta: consulta base opcional con filtros sobre Obra (sin joins propios).
+        Las filas no se guardan en la consulta (iterator()), así que la memoria no crece con la tabla.
+        """
+        campos = cls.CAMPOS_LIVIANOS if campos is None else campos
+        consulta = cls.select() if consulta is None else consulta
+        return (consulta
+                .select(*[getattr(cls, campo) for campo in campos],
+                        TipoObra.nombre.alias('tipo'),
+                        AreaResponsable.nombre.alias('area'),
+                        Barrio.nombre.alias('barrio'),
+                        Empresa.nombre.alias('empresa'))
+                .join(TipoObra, JOIN.LEFT_OUTER, on=(cls.tipo == TipoObra.id))
+                .switch(cls)
+                .join(AreaResponsable, JOIN.LEFT_OUTER, on=(cls.area == AreaResponsable.id))
+                .switch(cls)
+                .join(Barrio, JOIN.LEFT_OUTER, on=(cls.barrio == Barrio.id))
+                .switch(cls)
+                .join(Empresa, JOIN.LEFT_OUTER, on=(cls.empresa == Empresa.id))
+                .namedtuples()
+                .iterator())
 
     def inicializar_bd():
         """Inicializa la base de datos y crea las tablas si no existen."""
         db.connect()
-        db.create_tables([TipoObra, AreaResponsable, Barrio, Obra], safe=True)
+        db.create_tables([TipoObra, AreaResponsable, Barrio, Empresa, EmpresaTrigrama, Obra], safe=True)
         print("Base de datos inicializada y tablas creadas.")
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+def _codificar_cursor(orden, descendente, valor, obra_id):
+    """Arma el token opaco de paginación a partir de la última fila de una página."""
+    if isinstance(valor, (date, datetime)):
+        valor = str(valor) # Mismo formato de texto con el que SQLite guarda las fechas
+    datos = json.dumps([orden, descendente, valor, obra_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(datos.encode('utf-8')).decode('ascii')
+
+
+def _decodificar_cursor(cursor, campo, descendente):
+    """Valida un token de paginación y retorna (valor, id) ya convertidos al tipo del campo."""
+    try:
+        orden, cursor_descendente, valor, obra_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError):
+        raise ValueError("Cursor de paginación inválido.")
+    if orden != campo.name or cursor_descendente != descendente:
+        raise ValueError("El cursor de paginación no corresponde a este orden.")
+    return (None if valor is None else campo.python_value(valor)), obra_id
@@ -1,5 +1,14 @@
 from peewee import *
-# from datetime import date # No la necesitamos si las fechas son CharField
+from peewee import Node
+from playhouse.sqlite_ext import AutoIncrementField
+from instrumentacion import medir
+from contextlib import contextmanager
+from datetime import date, datetime
+import calendar
+import json
+import random
+import time
+import types
 
 # Configuración de la base de datos SQLite
 # Conecta a la base de datos 'obras_urbanas.db'. Si no existe, la crea.
@@ -10,21 +19,239 @@ class BaseModel(Model):
     class Meta:
         database = db # Conecta el modelo a la base de datos
 
+# Tablas diccionario para los valores de texto que se repiten en muchas obras
+# (mismo patrón que TipoObra, AreaResponsable y Barrio en modelo_orm.py).
+# La tabla 'obra' guarda solo el id de cada valor.
+class Diccionario(BaseModel):
+    nombre = CharField(unique=True)
+
+class Etapa(Diccionario):
+    pass
+
+class TipoObra(Diccionario):
+    pass
+
+class AreaResponsable(Diccionario):
+    pass
+
+class Estado(Diccionario):
+    pass
+
+class Barrio(Diccionario):
+    pass
+
+class TipoContratacion(Diccionario):
+    pass
+
+class EmpresaAdjudicada(Diccionario):
+    pass
+
+
+# Caché de los diccionarios: (ruta de la base, modelo) -> ({nombre: id}, {id: nombre}, {ids sin confirmar}).
+# Los valores de un diccionario no cambian y solo los borran las migraciones, que después vacían
+# la caché (ver migrar_transiciones()); también se vacía si se apunta el modelo a otra base
+# (ver limpiar_cache_diccionarios()).
+# Solo se guardan códigos ya confirmados: uno agregado dentro de una transacción puede
+# desaparecer con un rollback (o el de un savepoint) y la caché seguiría devolviéndolo. Esos
+# quedan anotados como sin confirmar y se vuelven a buscar cada vez; los demás se guardan aunque
+# se lean dentro de una transacción, porque lo que esta conexión no escribió ya estaba confirmado.
+_cache_diccionarios = {}
+
+
+def limpiar_cache_diccionarios():
+    _cache_diccionarios.clear()
+
+
+class CampoDiccionario(IntegerField):
+    """
+    Campo que en la base guarda el id del valor en una tabla diccionario y en Python se
+    comporta como texto: obra.tipo_obra sigue siendo 'Escuela', Obra.create(tipo_obra='Escuela')
+    y Obra.tipo_obra == 'Escuela' funcionan igual que con un CharField, y los GROUP BY comparan enteros.
+    Un valor que todavía no está en el diccionario se agrega la primera vez que se guarda; en las
+    comparaciones (==, !=, in_, not_in) solo se busca, así que filtrar por un valor desconocido
+    no encuentra nada y no escribe en la base.
+    """
+    # Código que nunca existe en un diccionario (los ids empiezan en 1): es el que se usa
+    # para comparar contra un valor desconocido
+    SIN_CODIGO = 0
+
+    def __init__(self, diccionario, *args, **kwargs):
+        self.diccionario = diccionario
+        super().__init__(*args, **kwargs)
+
+    def _cache(self):
+        clave = (self.diccionario._meta.database.database, self.diccionario)
+        if clave not in _cache_diccionarios:
+            _cache_diccionarios[clave] = ({}, {}, set())
+        return _cache_diccionarios[clave]
+
+    def _recordar(self, nombre, codigo):
+        codigos, nombres, sin_confirmar = self._cache()
+        if codigo in sin_confirmar:
+            return
+        codigos[nombre] = codigo
+        nombres[codigo] = nombre
+
+    def _agregado(self, codigo):
+        # Un código insertado dentro de una transacción puede deshacerse: no va a la caché
+        if self.diccionario._meta.database.in_transaction():
+            self._cache()[2].add(codigo)
+
+    def db_value(self, valor):
+        if valor is None or valor != valor: # NaN de pandas también es "sin dato"
+            return None
+        codigo = self.codigo_existente(valor)
+        if codigo == self.SIN_CODIGO:
+            valor = str(valor)
+            modelo = self.diccionario
+            modelo.insert(nombre=valor).on_conflict_ignore().execute()
+            codigo = modelo.select(modelo.id).where(modelo.nombre == valor).scalar()
+            self._agregado(codigo)
+            self._recordar(valor, codigo)
+        return codigo
+
+    def python_value(self, codigo):
+        if codigo is None:
+            return None
+        nombre = self._cache()[1].get(codigo)
+        if nombre is None:
+            modelo = self.diccionario
+            nombre = modelo.select(modelo.nombre).where(modelo.id == codigo).scalar()
+            if nombre is not None:
+                self._recordar(nombre, codigo)
+        return nombre
+
+    def registrar_valores(self, valores):
+        """
+        Agrega de una vez al diccionario los valores que falten, en una transacción propia que
+        se confirma antes de seguir, y los deja en la caché. Las cargas masivas lo llaman antes
+        de abrir sus transacciones: así db_value() no inserta nada dentro de un savepoint que
+        después puede deshacerse.
+        """
+        codigos = self._cache()[0]
+        faltantes = sorted({str(valor) for valor in valores
+                            if valor is not None and valor == valor and str(valor) not in codigos})
+        if not faltantes:
+            return
+        modelo = self.diccionario
+
+        def buscar(nombres):
+            for bloque in chunked(nombres, 500):
+                yield from modelo.select(modelo.nombre, modelo.id).where(modelo.nombre.in_(bloque)).tuples()
+
+        existentes = {}
+        for nombre, codigo in buscar(faltantes):
+            existentes[nombre] = codigo
+            self._recordar(nombre, codigo)
+        nuevos = [nombre for nombre in faltantes if nombre not in existentes]
+        if not nuevos:
+            return
+        with modelo._meta.database.atomic():
+            for bloque in chunked(nuevos, 500):
+                modelo.insert_many([(nombre,) for nombre in bloque], fields=[modelo.nombre]).on_conflict_ignore().execute()
+        for nombre, codigo in buscar(nuevos):
+            self._agregado(codigo) # Dentro de otra transacción el bloque de arriba fue solo un savepoint
+            self._recordar(nombre, codigo)
+
+    def codigo_existente(self, valor):
+        """Como db_value() pero sin agregar el valor: uno desconocido se convierte en SIN_CODIGO."""
+        if valor is None or valor != valor:
+            return None
+        valor = str(valor)
+        codigo = self._cache()[0].get(valor)
+        if codigo is None:
+            modelo = self.diccionario
+            codigo = modelo.select(modelo.id).where(modelo.nombre == valor).scalar()
+            if codigo is None:
+                return self.SIN_CODIGO
+            self._recordar(valor, codigo)
+        return codigo
+
+    def _valor_consulta(self, valor):
+        # Los valores de Python de un filtro se convierten sin insertar; los nodos (otro campo,
+        # una subconsulta) y None se dejan como están
+        if valor is None or isinstance(valor, Node):
+            return valor
+        if isinstance(valor, types.GeneratorType):
+            valor = tuple(valor)
+        return Value(valor, converter=self.codigo_existente)
+
+    def __eq__(self, valor):
+        return super().__eq__(self._valor_consulta(valor))
+
+    def __ne__(self, valor):
+        return super().__ne__(self._valor_consulta(valor))
+
+    def in_(self, valores):
+        return super().in_(self._valor_consulta(valores))
+
+    def not_in(self, valores):
+        return super().not_in(self._valor_consulta(valores))
+
+    __lshift__ = in_
+    __hash__ = IntegerField.__hash__ # Definir __eq__ anula el __hash__ heredado
+
+
+# Formatos de fecha que aparecen en el CSV y en la carga por teclado
+FORMATOS_FECHA = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%Y/%m/%d', '%Y-%m-%d %H:%M:%S')
+
+
+def normalizar_fecha(valor):
+    """
+    Convierte una fecha en cualquiera de los FORMATOS_FECHA (o un date/datetime) a date.
+    Retorna None si no hay dato y lanza ValueError si el texto no es una fecha reconocible.
+    """
+    if valor is None or valor != valor: # NaN/NaT de pandas
+        return None
+    if isinstance(valor, datetime): # También cubre pandas.Timestamp
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    texto = str(valor).strip()
+    if not texto:
+        return None
+    for formato in FORMATOS_FECHA:
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            pass
+    raise ValueError(f"Fecha inválida: '{texto}'")
+
+
+def sumar_meses(fecha, meses):
+    """Suma meses a una fecha; si el día no existe en el mes final se usa el último día (31/01 + 1 = 28/02)."""
+    mes = fecha.month - 1 + meses
+    anio, mes = fecha.year + mes // 12, mes % 12 + 1
+    return date(anio, mes, min(fecha.day, calendar.monthrange(anio, mes)[1]))
+
+
+class CampoFecha(DateField):
+    """
+    DateField que acepta los formatos de FORMATOS_FECHA y siempre guarda 'AAAA-MM-DD'.
+    Así las fechas se comparan y ordenan bien como texto y los rangos pueden usar un índice.
+    """
+    def db_value(self, valor):
+        fecha = normalizar_fecha(valor)
+        return fecha.isoformat() if fecha is not None else None
+
+
 # 5. La clase "Obra" con sus atributos y nuevos métodos de instancia
 class Obra(BaseModel):
     # Atributos de la tabla 'obras' (columnas)
-    id = AutoField() # Clave primaria autoincremental
+    id = AutoIncrementField() # Clave primaria; AUTOINCREMENT para no reusar ids archivados (ver archivo.py)
     nombre = CharField(null=True) # Nombre de la obra, puede ser nulo
-    etapa = CharField(null=True) # Etapa actual (ej: "Proyecto", "Contratacion", "En Ejecucion", "Finalizada")
-    tipo_obra = CharField(null=True)
-    area_responsable = CharField(null=True)
-    estado = CharField(null=True) # Estado de la obra (ej: "Activa", "Cancelada", "Suspendida")
+    etapa = CampoDiccionario(Etapa, null=True) # Etapa actual (ej: "Proyecto", "Contratacion", "En Ejecucion", "Finalizada")
+    tipo_obra = CampoDiccionario(TipoObra, null=True)
+    area_responsable = CampoDiccionario(AreaResponsable, null=True)
+    estado = CampoDiccionario(Estado, null=True) # Estado de la obra (ej: "Activa", "Cancelada", "Suspendida")
     comuna = IntegerField(null=True)
-    barrio = CharField(null=True)
+    barrio = CampoDiccionario(Barrio, null=True)
+    direccion = CharField(null=True)
     latitud = FloatField(null=True)
     longitud = FloatField(null=True)
-    fecha_inicio = CharField(null=True) # Guardamos como texto para simplificar
-    fecha_fin_inicial = CharField(null=True) # Guardamos como texto para simplificar
+    geo_confianza = FloatField(null=True) # 1.0 si las coordenadas venían cargadas; menos si salen del nomenclador
+    fecha_inicio = CampoFecha(null=True, index=True) # Se guarda como 'AAAA-MM-DD'
+    fecha_fin_inicial = CampoFecha(null=True) # Se guarda como 'AAAA-MM-DD'
     # Nuevos campos para los métodos, si es necesario.
     # Porcentaje de avance: lo añadimos aquí para que el método e. lo use.
     porcentaje_avance = IntegerField(null=True, default=0)
@@ -32,17 +259,115 @@ class Obra(BaseModel):
     plazo_meses = IntegerField(null=True)
     # Cantidad de mano de obra: para el método g.
     mano_obra = IntegerField(null=True)
-    tipo_contratacion = CharField(null=True) # Tipo de contratación de la obra
+    tipo_contratacion = CampoDiccionario(TipoContratacion, null=True) # Tipo de contratación de la obra
     nro_contratacion = CharField(null=True) # Número de contratación
-    empresa_adjudicada = CharField(null=True) # Nombre de la empresa a la que se adjudicó
+    empresa_adjudicada = CampoDiccionario(EmpresaAdjudicada, null=True) # Nombre de la empresa a la que se adjudicó
     nro_expediente = CharField(null=True) # Número de expediente asociado a la obra
+    monto_contrato = FloatField(null=True) # Monto del contrato en pesos
+    # fecha_inicio + plazo_meses (o fecha_fin_inicial si no hay plazo). Se recalcula en cada save()
+    fecha_fin_estimada = CampoFecha(null=True, index=True)
+    # Se incrementa con cada UPDATE: las escrituras comparan la versión leída (ver _guardar_con_version)
+    version = IntegerField(default=0)
+
+    # Etapas después de las cuales la obra ya no puede vencer
+    ETAPAS_TERMINADAS = ('Finalizada', 'Rescindida')
 
 
     # Método para representar el objeto (útil para imprimir)
     def __str__(self):
         return f"Obra ID: {self.id}, Nombre: {self.nombre}, Etapa: {self.etapa}, Estado: {self.estado}"
 
+    def calcular_fecha_fin_estimada(self):
+        """Retorna la fecha de fin estimada según fecha_inicio y plazo_meses (o fecha_fin_inicial)."""
+        inicio = normalizar_fecha(self.fecha_inicio)
+        if inicio is not None and self.plazo_meses is not None:
+            return sumar_meses(inicio, self.plazo_meses)
+        return normalizar_fecha(self.fecha_fin_inicial)
+
+    def save(self, force_insert=False, only=None):
+        # Cualquier cambio de fechas o plazo (iniciar_obra, cargas, nueva_obra)
+        # deja la fecha de fin estimada al día
+        self.fecha_fin_estimada = self.calcular_fecha_fin_estimada()
+        if force_insert or self.id is None:
+            return super().save(force_insert=force_insert, only=only)
+        return self._guardar_con_version()
+
+    def _guardar_con_version(self, etapa_nueva=None):
+        """
+        Guarda los campos modificados con un UPDATE ... WHERE id = ? AND version = ?, que
+        solo se aplica si nadie más modificó la obra desde que se leyó (control optimista).
+        Con etapa_nueva, el mismo UPDATE exige que el paso de la etapa actual a etapa_nueva
+        figure en la tabla TransicionEtapa.
+        Lanza ConflictoConcurrencia o TransicionInvalida si no se aplicó; en ese caso conviene
+        volver a leer la obra (ver reintentar()).
+        """
+        cls = type(self)
+        self.fecha_fin_estimada = self.calcular_fecha_fin_estimada()
+        valores = {campo: getattr(self, campo.name) for campo in self.dirty_fields if campo is not cls.version}
+        valores[cls.version] = cls.version + 1
+        consulta = cls.update(valores).where((cls.id == self.id) & (cls.version == self.version))
+        if etapa_nueva is not None:
+            consulta = consulta.where(fn.EXISTS(TransicionEtapa.permitidas(cls.etapa, etapa_nueva)))
+        if consulta.execute() == 0:
+            actual = cls.select(cls.version, cls.etapa).where(cls.id == self.id).first()
+            if actual is None:
+                raise cls.DoesNotExist(f"La obra {self.id} ya no existe.")
+            if actual.version != self.version:
+                raise ConflictoConcurrencia(f"La obra {self.id} fue modificada por otro proceso "
+                                            f"(versión leída {self.version}, actual {actual.version}).")
+            raise TransicionInvalida(f"La obra {self.id} no puede pasar de la etapa '{actual.etapa}' a '{etapa_nueva}'.")
+        self.version += 1
+        self._dirty.clear()
+        return 1
+
+    def _actualizar_atomico(self, devolver=(), **valores):
+        """
+        Aplica un UPDATE que no depende de lo leído (por ejemplo mano_obra = mano_obra + 3),
+        así no hay conflicto posible entre procesos. Actualiza la instancia con lo que quedó
+        en la base para esos campos y para los nombrados en `devolver` (RETURNING).
+        """
+        cls = type(self)
+        valores['version'] = cls.version + 1
+        nombres = list(valores) + list(devolver)
+        fila = (cls.update(**valores).where(cls.id == self.id)
+                .returning(*[getattr(cls, nombre) for nombre in nombres]).tuples().execute())
+        fila = next(iter(fila), None)
+        if fila is None:
+            raise cls.DoesNotExist(f"La obra {self.id} ya no existe.")
+        self.__data__.update(zip(nombres, fila))
+
+    @classmethod
+    def filas_livianas(cls, campos=None, consulta=None):
+        """
+        Itera las obras como namedtuples de solo lectura, para reportes que recorren toda la tabla.
+        Los campos de diccionario (etapa, barrio, ...) ya vienen como texto, resueltos con la
+        caché de diccionarios sin consultas extra. Ver Obra.filas_livianas() en modelo_orm.py.
+
+        - campos: nombres de campos (por defecto todos).
+        - consulta: consulta base opcional con filtros sobre Obra.
+        """
+        campos = [campo.name for campo in cls._meta.sorted_fields] if campos is None else campos
+        consulta = cls.select() if consulta is None else consulta
+        return consulta.select(*[getattr(cls, campo) for campo in campos]).namedtuples().iterator()
+
+    @classmethod
+    def vencen_entre(cls, desde, hasta):
+        """Obras cuya fecha de fin estimada cae entre `desde` y `hasta` (inclusive), ordenadas por vencimiento."""
+        return (cls.select()
+                .where(cls.fecha_fin_estimada.between(normalizar_fecha(desde), normalizar_fecha(hasta)))
+                .order_by(cls.fecha_fin_estimada))
+
+    @classmethod
+    def atrasadas(cls, hoy=None):
+        """Obras no terminadas cuya fecha de fin estimada ya pasó, de la más atrasada a la menos."""
+        hoy = normalizar_fecha(hoy) or date.today()
+        return (cls.select()
+                .where((cls.fecha_fin_estimada < hoy) &
+                       (cls.etapa.is_null() | cls.etapa.not_in(cls.ETAPAS_TERMINADAS)))
+                .order_by(cls.fecha_fin_estimada))
+
     # 5.a. nuevo_proyecto()
+    @medir()
     def nuevo_proyecto(self):
         """
         Marca la obra como 'Nuevo Proyecto'.
@@ -51,10 +376,11 @@ class Obra(BaseModel):
         self.etapa = "Proyecto"
         self.porcentaje_avance = 0
         self.estado = "Activa" # Una obra nueva suele estar activa
-        self.save() # Guarda los cambios en la base de datos
+        self._guardar_con_version("Proyecto") # Guarda los cambios si la transición es válida
         print(f"Obra '{self.nombre}' (ID: {self.id}) marcada como NUEVO PROYECTO. Etapa: {self.etapa}")
 
     # 5.b. iniciar_contratacion()
+    @medir()
     def iniciar_contratacion(self, tipo_contratacion: str = None, nro_contratacion: str = None):
         """
         Cambia la etapa de la obra a 'Contratacion' y asigna el tipo y número de contratación.
@@ -62,11 +388,12 @@ class Obra(BaseModel):
         self.etapa = "Contratacion"
         self.tipo_contratacion = tipo_contratacion
         self.nro_contratacion = nro_contratacion
-        self.save() # Guarda los cambios en la base de datos
+        self._guardar_con_version("Contratacion") # Guarda los cambios si la transición es válida
         print(f"Obra '{self.nombre}' (ID: {self.id}) inició etapa de CONTRATACIÓN.")
         print(f"  Tipo Contratación: {self.tipo_contratacion}, Nro Contratación: {self.nro_contratacion}")
 
     # 5.c. adjudicar_obra()
+    @medir()
     def adjudicar_obra(self, empresa: str = None, nro_expediente: str = None):
         """
         Marca la obra como 'Adjudicada' y asigna la empresa y número de expediente.
@@ -74,71 +401,83 @@ class Obra(BaseModel):
         self.etapa = "Adjudicada"
         self.empresa_adjudicada = empresa
         self.nro_expediente = nro_expediente
-        self.save() # Guarda los cambios en la base de datos
+        self._guardar_con_version("Adjudicada") # Guarda los cambios si la transición es válida
         print(f"Obra '{self.nombre}' (ID: {self.id}) ha sido ADJUDICADA.")
         print(f"  Empresa Adjudicada: {self.empresa_adjudicada}, Nro Expediente: {self.nro_expediente}")
 
     # 5.d. iniciar_obra()
+    @medir()
     def iniciar_obra(self):
         """
         Marca la obra como 'En Ejecucion'.
-        También podría fijar la fecha de inicio si el campo `fecha_inicio` no está seteado.
+        Si la obra no tiene fecha de inicio, se fija en la fecha de hoy.
         """
         self.etapa = "En Ejecucion"
-        # Puedes añadir una lógica para setear la fecha de inicio si es la primera vez que se inicia
-        # if not self.fecha_inicio:
-        #     self.fecha_inicio = date.today().isoformat() # Requiere 'from datetime import date'
-        self.save()
+        # Si es la primera vez que se inicia, la obra empieza hoy (también se recalcula la fecha de fin estimada)
+        if not self.fecha_inicio:
+            self.fecha_inicio = date.today()
+        self._guardar_con_version("En Ejecucion")
         print(f"Obra '{self.nombre}' (ID: {self.id}) INICIÓ EJECUCIÓN. Etapa: {self.etapa}")
 
     # 5.e. actualizar_porcentaje_avance()
+    @medir()
     def actualizar_porcentaje_avance(self, porcentaje: int):
         """
         Actualiza el porcentaje de avance de la obra.
         El porcentaje debe ser un entero entre 0 y 100.
         """
         if 0 <= porcentaje <= 100:
-            self.porcentaje_avance = porcentaje
-            self.save()
+            self._actualizar_atomico(porcentaje_avance=porcentaje)
             print(f"Obra '{self.nombre}' (ID: {self.id}) - Porcentaje de avance actualizado: {self.porcentaje_avance}%")
         else:
             print(f"Error: El porcentaje de avance ({porcentaje}) debe ser entre 0 y 100.")
 
     # 5.f. incrementar_plazo()
+    @medir()
     def incrementar_plazo(self, meses_a_sumar: int):
         """
         Incrementa el plazo de la obra en la cantidad de meses especificada.
         Si el plazo_meses es nulo, lo inicializa.
         """
         if meses_a_sumar > 0:
-            if self.plazo_meses is None:
-                self.plazo_meses = meses_a_sumar # Si no tiene plazo, lo establece
+            tenia_plazo = self.plazo_meses is not None
+            # Suma sobre el valor de la base; si no tiene plazo, lo establece. La fecha de fin
+            # estimada depende del plazo: se calcula con lo que hay en la base, leído con el
+            # bloqueo de escritura ya tomado, y las dos columnas van en un solo UPDATE (una versión).
+            with db.atomic('IMMEDIATE'):
+                actual = (Obra.select(Obra.plazo_meses, Obra.fecha_inicio, Obra.fecha_fin_inicial)
+                          .where(Obra.id == self.id).get())
+                actual.plazo_meses = (actual.plazo_meses or 0) + meses_a_sumar
+                self._actualizar_atomico(plazo_meses=fn.COALESCE(Obra.plazo_meses, 0) + meses_a_sumar,
+                                         fecha_fin_estimada=actual.calcular_fecha_fin_estimada(),
+                                         devolver=('fecha_inicio', 'fecha_fin_inicial'))
+            if not tenia_plazo:
                 print(f"Obra '{self.nombre}' (ID: {self.id}) - Plazo inicial establecido en {self.plazo_meses} meses.")
             else:
-                self.plazo_meses += meses_a_sumar
                 print(f"Obra '{self.nombre}' (ID: {self.id}) - Plazo incrementado en {meses_a_sumar} meses. Nuevo plazo total: {self.plazo_meses} meses.")
-            self.save()
         else:
             print("Error: Los meses a sumar deben ser un número positivo.")
 
     # 5.g. incrementar_mano_obra()
+    @medir()
     def incrementar_mano_obra(self, cantidad_adicional: int):
         """
         Incrementa la cantidad de mano de obra de la obra.
         Si mano_obra es nulo, lo inicializa.
         """
         if cantidad_adicional > 0:
-            if self.mano_obra is None:
-                self.mano_obra = cantidad_adicional # Si no tiene, lo establece
+            tenia_mano_obra = self.mano_obra is not None
+            # Suma sobre el valor de la base; si no tiene, lo establece
+            self._actualizar_atomico(mano_obra=fn.COALESCE(Obra.mano_obra, 0) + cantidad_adicional)
+            if not tenia_mano_obra:
                 print(f"Obra '{self.nombre}' (ID: {self.id}) - Mano de obra inicial establecida en {self.mano_obra} personas.")
             else:
-                self.mano_obra += cantidad_adicional
                 print(f"Obra '{self.nombre}' (ID: {self.id}) - Mano de obra incrementada en {cantidad_adicional} personas. Nueva cantidad: {self.mano_obra} personas.")
-            self.save()
         else:
             print("Error: La cantidad adicional de mano de obra debe ser un número positivo.")
 
     # 5.h. finalizar_obra()
+    @medir()
     def finalizar_obra(self):
         """
         Marca la obra como 'Finalizada'.
@@ -150,10 +489,11 @@ class Obra(BaseModel):
         self.porcentaje_avance = 100
         # if not self.fecha_fin_real: # Si tuvieras un campo fecha_fin_real en el modelo
         #     self.fecha_fin_real = date.today().isoformat()
-        self.save()
+        self._guardar_con_version("Finalizada")
         print(f"Obra '{self.nombre}' (ID: {self.id}) FINALIZADA. Etapa: {self.etapa}, Avance: {self.porcentaje_avance}%")
 
     # 5.i. rescindir_obra()
+    @medir()
     def rescindir_obra(self):
         """
         Marca la obra como 'Rescindida' (cancelada).
@@ -161,5 +501,308 @@ class Obra(BaseModel):
         """
         self.estado = "Rescindida"
         self.etapa = "Rescindida" # La etapa también reflejaría esto
-        self.save()
-        print(f"Obra '{self.nombre}' (ID: {self.id}) RESCINDIDA. Estado: {self.estado}")
\ No newline at end of file
+        self._guardar_con_version("Rescindida")
+        print(f"Obra '{self.nombre}' (ID: {self.id}) RESCINDIDA. Estado: {self.estado}")
+
+
+class ConflictoConcurrencia(Exception):
+    """La obra cambió en la base desde que se leyó; hay que volver a leerla y reintentar."""
+
+
+class TransicionInvalida(Exception):
+    """El paso de la etapa actual a la pedida no figura en TransicionEtapa."""
+
+
+# Pasos de etapa permitidos. Se consultan dentro del mismo UPDATE que cambia la etapa,
+# así la validación no depende de lo que el proceso haya leído antes.
+# desde = NULL permite llegar a 'hasta' desde cualquier etapa que no esté terminada; con
+# inicial, solo desde una obra sin etapa (así 'Proyecto' no sirve para volver atrás).
+class TransicionEtapa(BaseModel):
+    desde = CampoDiccionario(Etapa, null=True) # NULL: desde cualquier etapa sin terminar
+    hasta = CampoDiccionario(Etapa)
+    inicial = BooleanField(default=False) # True (con desde NULL): solo para obras sin etapa
+
+    # Ciclo de vida de Obra: nuevo_proyecto -> iniciar_contratacion -> adjudicar_obra
+    # -> iniciar_obra -> finalizar_obra; rescindir_obra desde cualquier etapa sin terminar.
+    INICIALES = [
+        (None, 'Proyecto', True),
+        ('Proyecto', 'Contratacion', False),
+        ('Contratacion', 'Adjudicada', False),
+        ('Adjudicada', 'En Ejecucion', False),
+        ('En Ejecucion', 'Finalizada', False),
+        (None, 'Rescindida', False),
+    ]
+
+    class Meta:
+        indexes = ((('hasta', 'desde'), True),)
+
+    @classmethod
+    def permitidas(cls, etapa_actual, etapa_nueva):
+        """Subconsulta con las transiciones que permiten pasar de etapa_actual (una columna) a etapa_nueva."""
+        sin_etapa = etapa_actual.is_null()
+        sin_terminar = sin_etapa | etapa_actual.not_in(Obra.ETAPAS_TERMINADAS)
+        return (cls.select(SQL('1'))
+                .where((cls.hasta == etapa_nueva) &
+                       ((cls.desde == etapa_actual) |
+                        (cls.desde.is_null() & cls.inicial & sin_etapa) |
+                        (cls.desde.is_null() & ~cls.inicial & sin_terminar))))
+
+
+def instalar_transiciones():
+    """Carga las transiciones iniciales si la tabla está vacía (las que se agreguen a mano se respetan)."""
+    if not TransicionEtapa.select().exists():
+        TransicionEtapa.insert_many(TransicionEtapa.INICIALES,
+                                    fields=[TransicionEtapa.desde, TransicionEtapa.hasta, TransicionEtapa.inicial]).execute()
+
+
+def reintentar(operacion, intentos=5, espera=0.01):
+    """
+    Ejecuta operacion() y, si lanza ConflictoConcurrencia, la vuelve a ejecutar con una espera
+    creciente y aleatoria. operacion tiene que leer la obra cada vez, por ejemplo:
+        reintentar(lambda: Obra.get_by_id(obra_id).adjudicar_obra(empresa, expediente))
+    TransicionInvalida no se reintenta: repetir no la va a arreglar.
+    """
+    for intento in range(intentos):
+        try:
+            return operacion()
+        except ConflictoConcurrencia:
+            if intento == intentos - 1:
+                raise
+            time.sleep(espera * (2 ** intento) * random.random())
+
+
+# Foto diaria de los indicadores, para ver tendencias (obras en ejecución por semana, monto
+# contratado por mes, etc.) sin tener que reconstruir la historia. Una fila por día y por
+# dimensión; `valores` es un JSON compacto con una lista de
+# [valor, cantidad, mano_obra, porcentaje_avance, monto_contrato] por grupo (las tres últimas
+# son sumas; las fotos anteriores a monto_contrato no lo traen). La clave (dimension, fecha) sin rowid deja las filas de una
+# dimensión ordenadas por fecha, así una tendencia de varios años lee unos cientos de filas.
+class SnapshotIndicador(BaseModel):
+    dimension = CharField() # 'total', 'etapa', 'tipo_obra', 'area_responsable', 'comuna'
+    fecha = CampoFecha()
+    valores = TextField()
+
+    DIMENSIONES = ('total', 'etapa', 'tipo_obra', 'area_responsable', 'comuna')
+    METRICAS = ('cantidad', 'mano_obra', 'porcentaje_avance', 'monto_contrato')
+
+    class Meta:
+        table_name = 'snapshot_indicador'
+        primary_key = CompositeKey('dimension', 'fecha')
+        without_rowid = True
+
+    def grupos(self):
+        """Retorna {valor: {'cantidad': ..., 'mano_obra': ..., 'porcentaje_avance': ..., 'monto_contrato': ...}}."""
+        return {valor: dict(zip(self.METRICAS, metricas)) for valor, *metricas in json.loads(self.valores)}
+
+
+# Contador de cambios de la tabla 'obra'.
+# Cada INSERT/UPDATE/DELETE sobre la tabla lo incrementa mediante triggers,
+# así cualquier proceso (cargas, métodos del ciclo de vida, nueva_obra) lo
+# actualiza sin tener que acordarse de hacerlo a mano.
+class ContadorCambios(BaseModel):
+    tabla = CharField(primary_key=True) # Nombre de la tabla que se vigila
+    version = IntegerField(default=0) # Se incrementa con cada cambio
+
+    class Meta:
+        table_name = 'contador_cambios'
+
+
+def instalar_contador_cambios():
+    """
+    Crea la fila del contador para la tabla de obras y los triggers que lo incrementan.
+    Es idempotente: se puede llamar cada vez que se mapea el ORM.
+    """
+    tabla = Obra._meta.table_name
+    ContadorCambios.insert(tabla=tabla, version=0).on_conflict_ignore().execute()
+    for operacion in ('INSERT', 'UPDATE', 'DELETE'):
+        db.execute_sql(
+            f'CREATE TRIGGER IF NOT EXISTS "{tabla}_contador_{operacion.lower()}" '
+            f'AFTER {operacion} ON "{tabla}" FOR EACH ROW BEGIN '
+            f"UPDATE contador_cambios SET version = version + 1 WHERE tabla = '{tabla}'; "
+            f'END'
+        )
+
+
+def registrar_cambio():
+    """
+    Incrementa a mano el contador de cambios. Hace falta cuando los datos cambian sin pasar
+    por un INSERT/UPDATE/DELETE sobre la tabla (por ejemplo al intercambiar tablas en una carga en sombra).
+    """
+    (ContadorCambios
+     .update(version=ContadorCambios.version + 1)
+     .where(ContadorCambios.tabla == Obra._meta.table_name)
+     .execute())
+
+
+def version_datos():
+    """
+    Retorna la versión actual de los datos de la tabla de obras (0 si no hay contador).
+    Es una lectura por clave primaria, así que sirve para validar cachés y ETags.
+    """
+    fila = (ContadorCambios
+            .select(ContadorCambios.version)
+            .where(ContadorCambios.tabla == Obra._meta.table_name)
+            .tuples()
+            .first())
+    return fila[0] if fila else 0
+
+
+@contextmanager
+def _sin_contador_cambios():
+    """
+    Quita los triggers del contador mientras dura una migración (si no, cada fila actualizada
+    incrementaría el contador) y al final los vuelve a instalar con un solo registrar_cambio().
+    """
+    tabla = Obra._meta.table_name
+    triggers = db.execute_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ?", (tabla,)).fetchall()
+    for (nombre,) in triggers:
+        db.execute_sql(f'DROP TRIGGER "{nombre}"')
+    try:
+        yield
+    finally:
+        if ContadorCambios.table_exists():
+            instalar_contador_cambios()
+            registrar_cambio()
+
+
+DICCIONARIOS = [Etapa, TipoObra, AreaResponsable, Estado, Barrio, TipoContratacion, EmpresaAdjudicada]
+
+
+def migrar_a_diccionarios(filas_por_lote=5000):
+    """
+    Pasa a enteros las columnas de texto de una tabla 'obra' creada antes de los diccionarios.
+    Por cada columna todavía de texto:
+      1. agrega sus valores distintos a la tabla diccionario,
+      2. agrega una columna INTEGER y la completa por lotes de ids (una transacción corta por lote),
+      3. borra la columna vieja y renombra la nueva.
+    Los triggers del contador se suspenden durante la migración (ver _sin_contador_cambios()).
+    Es idempotente: si no hay columnas de texto no hace nada. Retorna las columnas migradas.
+    """
+    tabla = Obra._meta.table_name
+    tipos = {fila[1]: fila[2].upper() for fila in db.execute_sql(f'PRAGMA table_info("{tabla}")').fetchall()}
+    pendientes = [campo for campo in Obra._meta.sorted_fields
+                  if isinstance(campo, CampoDiccionario) and tipos.get(campo.column_name, 'INTEGER') != 'INTEGER']
+    if not pendientes:
+        return []
+
+    db.create_tables(DICCIONARIOS, safe=True)
+    maximo = db.execute_sql(f'SELECT COALESCE(MAX(id), 0) FROM "{tabla}"').fetchone()[0]
+    with _sin_contador_cambios():
+        for campo in pendientes:
+            columna = campo.column_name
+            nueva = f'{columna}_codigo'
+            diccionario = campo.diccionario._meta.table_name
+            with db.atomic():
+                db.execute_sql(f'INSERT OR IGNORE INTO "{diccionario}" (nombre) '
+                               f'SELECT DISTINCT "{columna}" FROM "{tabla}" WHERE "{columna}" IS NOT NULL')
+                db.execute_sql(f'ALTER TABLE "{tabla}" ADD COLUMN "{nueva}" INTEGER')
+            for desde in range(0, maximo, filas_por_lote):
+                with db.atomic():
+                    db.execute_sql(f'UPDATE "{tabla}" SET "{nueva}" = (SELECT id FROM "{diccionario}" '
+                                   f'WHERE nombre = "{tabla}"."{columna}") WHERE id > ? AND id <= ?',
+                                   (desde, desde + filas_por_lote))
+            with db.atomic():
+                db.execute_sql(f'ALTER TABLE "{tabla}" DROP COLUMN "{columna}"')
+                db.execute_sql(f'ALTER TABLE "{tabla}" RENAME COLUMN "{nueva}" TO "{columna}"')
+            print(f"Columna '{columna}' migrada a la tabla diccionario '{diccionario}'.")
+    return [campo.name for campo in pendientes]
+
+
+def migrar_fechas(filas_por_lote=5000):
+    """
+    Prepara una tabla 'obra' creada cuando las fechas eran texto libre: agrega la columna
+    fecha_fin_estimada y, por lotes de ids, reescribe fecha_inicio y fecha_fin_inicial en
+    formato 'AAAA-MM-DD' y calcula la fecha de fin estimada.
+    Las fechas que no se pueden interpretar quedan en NULL (se informa cuántas fueron).
+    Es idempotente: si la columna ya existe no hace nada. Retorna la cantidad de filas revisadas.
+    """
+    tabla = Obra._meta.table_name
+    columnas = [fila[1] for fila in db.execute_sql(f'PRAGMA table_info("{tabla}")').fetchall()]
+    if 'fecha_fin_estimada' in columnas:
+        return 0
+
+    def leer(valor):
+        try:
+            return normalizar_fecha(valor)
+        except ValueError:
+            return None
+
+    revisadas = invalidas = 0
+    with _sin_contador_cambios():
+        db.execute_sql(f'ALTER TABLE "{tabla}" ADD COLUMN "fecha_fin_estimada" DATE')
+        ultimo_id = 0
+        while True:
+            filas = db.execute_sql(
+                f'SELECT id, fecha_inicio, fecha_fin_inicial, plazo_meses FROM "{tabla}" '
+                f'WHERE id > ? ORDER BY id LIMIT ?', (ultimo_id, filas_por_lote)).fetchall()
+            if not filas:
+                break
+            cambios = []
+            for obra_id, inicio_texto, fin_texto, plazo in filas:
+                inicio, fin = leer(inicio_texto), leer(fin_texto)
+                invalidas += (inicio_texto is not None and inicio is None) + (fin_texto is not None and fin is None)
+                estimada = sumar_meses(inicio, plazo) if inicio is not None and plazo is not None else fin
+                cambios.append(tuple(f.isoformat() if f else None for f in (inicio, fin, estimada)) + (obra_id,))
+            with db.atomic():
+                db.cursor().executemany(
+                    f'UPDATE "{tabla}" SET fecha_inicio = ?, fecha_fin_inicial = ?, fecha_fin_estimada = ? '
+                    f'WHERE id = ?', cambios)
+            revisadas += len(filas)
+            ultimo_id = filas[-1][0]
+    print(f"Fechas normalizadas en {revisadas} obras ({invalidas} fechas no reconocidas quedaron vacías).")
+    return revisadas
+
+
+def migrar_transiciones(comodin='*', primera='Proyecto'):
+    """
+    Adapta una tabla de transiciones creada por versiones anteriores:
+    - "desde cualquier etapa" se guardaba como la etapa '*' del diccionario: esas filas pasan a
+      tener desde = NULL y la etapa '*' se borra del diccionario si ninguna obra la usa;
+    - sin la columna `inicial`, la fila (NULL, 'Proyecto') dejaba volver a 'Proyecto' desde
+      cualquier etapa sin terminar: pasa a ser inicial (solo para obras sin etapa).
+    La tabla se recrea (tiene pocas filas) conservando los códigos. Es idempotente.
+    """
+    tabla = TransicionEtapa._meta.table_name
+    if not TransicionEtapa.table_exists():
+        return
+    no_nula = {fila[1]: fila[3] for fila in db.execute_sql(f'PRAGMA table_info("{tabla}")').fetchall()}
+    con_inicial = 'inicial' in no_nula
+    fila = db.execute_sql(f'SELECT id FROM "{Etapa._meta.table_name}" WHERE nombre = ?', (comodin,)).fetchone()
+    codigo = fila[0] if fila else None
+    if con_inicial and not no_nula['desde'] and codigo is None:
+        return
+    fila = db.execute_sql(f'SELECT id FROM "{Etapa._meta.table_name}" WHERE nombre = ?', (primera,)).fetchone()
+    codigo_primera = fila[0] if fila else None
+
+    with db.atomic():
+        # SQL directo: los códigos ya son ids del diccionario y CampoDiccionario los tomaría como texto
+        filas = []
+        columnas = 'desde, hasta, inicial' if con_inicial else 'desde, hasta'
+        for desde, hasta, *inicial in db.execute_sql(f'SELECT {columnas} FROM "{tabla}"').fetchall():
+            desde = None if desde == codigo else desde
+            filas.append((desde, hasta, inicial[0] if inicial else int(desde is None and hasta == codigo_primera)))
+        db.drop_tables([TransicionEtapa])
+        db.create_tables([TransicionEtapa])
+        for desde, hasta, inicial in filas:
+            db.execute_sql(f'INSERT INTO "{tabla}" (desde, hasta, inicial) VALUES (?, ?, ?)', (desde, hasta, inicial))
+        if codigo is not None:
+            tablas_obra = [nombre for nombre in (Obra._meta.table_name, f'{Obra._meta.table_name}_archivo')
+                           if db.table_exists(nombre)]
+            if not any(db.execute_sql(f'SELECT 1 FROM "{nombre}" WHERE etapa = ? LIMIT 1', (codigo,)).fetchone()
+                       for nombre in tablas_obra):
+                db.execute_sql(f'DELETE FROM "{Etapa._meta.table_name}" WHERE id = ?', (codigo,))
+                limpiar_cache_diccionarios() # El id de '*' puede volver a usarlo otra etapa
+    if codigo is not None:
+        print(f"Transiciones de etapa: '{comodin}' reemplazado por NULL (desde cualquier etapa sin terminar).")
+    if not con_inicial:
+        print(f"Transiciones de etapa: '{primera}' solo se permite para obras sin etapa.")
+
+
+def migrar_version():
+    """Agrega la columna de versión a una tabla 'obra' creada antes del control optimista."""
+    tabla = Obra._meta.table_name
+    columnas = [fila[1] for fila in db.execute_sql(f'PRAGMA table_info("{tabla}")').fetchall()]
+    if 'version' not in columnas:
+        db.execute_sql(f'ALTER TABLE "{tabla}" ADD COLUMN "version" INTEGER NOT NULL DEFAULT 0')
+        print("Columna 'version' agregada a la tabla de obras.")
@@ -0,0 +1,70 @@
+import contextlib
+import os
+import sys
+import tempfile
+
+# Chequeo de que archivar obras no hace reusar sus ids (esquema de modelo_orm2), sin pasos interactivos.
+#
+# Sobre una base temporal carga unas obras cuya última (la de id más alto) está terminada,
+# la archiva y después agrega obras nuevas, con create() y con una carga en sombra
+# (cargar_datos(en_sombra=True)). Sin AUTOINCREMENT SQLite entregaba a la obra nueva el id
+# de la archivada y la vista 'obra_historico' mostraba dos obras con el mismo id.
+#
+# Termina con código 1 si algún id se repite o si una obra nueva recibe un id archivado:
+#
+#   python prueba_archivo.py
+
+OBRAS = [('Plaza de prueba', 'En Ejecucion'), ('Escuela de prueba', 'Proyecto'), ('Hospital de prueba', 'Finalizada')]
+
+
+def correr(ruta_db, ruta_rechazos):
+    """Archiva la última obra y agrega obras nuevas. Retorna (ids_archivados, ids_nuevos, ids_del_historico)."""
+    import pandas as pd
+    from archivo import modelo_archivo, modelo_historico
+    from gestionar_obras2 import GestionarObra
+    from modelo_orm2 import Obra, db, limpiar_cache_diccionarios
+
+    db.init(ruta_db)
+    limpiar_cache_diccionarios()
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        GestionarObra.mapear_orm()
+        db.connect(reuse_if_open=True)
+        for nombre, etapa in OBRAS:
+            Obra.create(nombre=nombre, etapa=etapa)
+        GestionarObra.archivar_obras()
+
+        db.connect(reuse_if_open=True)
+        nuevos = [Obra.create(nombre='Obra nueva', etapa='Proyecto').id]
+        GestionarObra.cargar_datos(pd.DataFrame([{'nombre': 'Obra nueva en sombra', 'barrio': 'Palermo'}]),
+                                   ruta_rechazos, en_sombra=True)
+        db.connect(reuse_if_open=True)
+        nuevos.append(Obra.select(Obra.id).where(Obra.nombre == 'Obra nueva en sombra').scalar())
+
+        archivados = [fila.id for fila in modelo_archivo(Obra).select(modelo_archivo(Obra).id)]
+        historico = [fila.id for fila in modelo_historico(Obra).select(modelo_historico(Obra).id)]
+        db.close()
+    return archivados, nuevos, historico
+
+
+def main():
+    with tempfile.TemporaryDirectory() as directorio:
+        archivados, nuevos, historico = correr(os.path.join(directorio, 'obras_archivo.db'),
+                                               os.path.join(directorio, 'filas_rechazadas.csv'))
+
+    print(f"Ids archivados: {archivados}; ids de las obras nuevas: {nuevos}")
+    repetidos = sorted({i for i in historico if historico.count(i) > 1})
+    if not archivados:
+        print("ERROR: no se archivó ninguna obra.")
+        return 1
+    if repetidos:
+        print(f"ERROR: la vista histórica repite los ids {repetidos}.")
+        return 1
+    if min(nuevos) <= max(archivados):
+        print("ERROR: una obra nueva recibió un id que ya había usado una obra archivada.")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
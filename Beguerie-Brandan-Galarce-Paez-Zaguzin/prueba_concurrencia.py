@@ -0,0 +1,363 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+# Prueba de carga concurrente sobre una base temporal (esquema de modelo_orm2).
+#
+# Lanza escritores y lectores a la vez, en hilos o en procesos, contra una base SQLite
+# recién creada y cargada con obras de prueba. Cada uno corre durante --duracion segundos
+# una mezcla de operaciones de la aplicación:
+#
+#   escritores: avance (actualizar_porcentaje_avance), mano_obra (incrementar_mano_obra),
+#               plazo (incrementar_plazo), etapa (nuevo_proyecto con reintentar(), que usa
+#               el control optimista) y carga (cargar_datos de un lote chico de obras nuevas).
+#   lectores:   indicadores (calcular_indicadores, lo que usan obtener_indicadores() y la API),
+#               listar (listar_obras) y obtener (obtener_obra).
+#
+# Al final informa por operación: cantidad, operaciones por segundo, latencia p50 y p99,
+# y el porcentaje de intentos que fallaron con 'database is locked'. Sirve para comparar
+# con números los cambios de almacenamiento o de concurrencia, por ejemplo:
+#
+#   python prueba_concurrencia.py --escritores 4 --lectores 8 --duracion 10
+#   python prueba_concurrencia.py --escritores 4 --lectores 8 --pragma journal_mode=wal
+#   python prueba_concurrencia.py --modo procesos --mezcla-escritura avance=1,carga=1 --json resultado.json
+#
+# Con --max-bloqueados termina con código 1 si el porcentaje de bloqueos lo supera.
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+MEZCLA_ESCRITURA = 'avance=4,mano_obra=3,plazo=1,etapa=1,carga=1'
+MEZCLA_LECTURA = 'indicadores=2,listar=3,obtener=5'
+
+BARRIOS = ['Palermo', 'Recoleta', 'Caballito', 'Flores', 'Boedo', 'Belgrano', 'Almagro', 'Liniers']
+TIPOS = ['Escuelas', 'Espacio Público', 'Hidráulica e Infraestructura', 'Salud', 'Vivienda']
+AREAS = ['Ministerio de Educación', 'Ministerio de Espacio Público', 'Corporación Buenos Aires Sur']
+ETAPAS = ['En Ejecucion', 'Finalizada', 'En Proyecto', 'En Licitación']
+
+
+def interpretar_mezcla(texto):
+    """'avance=4,carga=1' -> {'avance': 4.0, 'carga': 1.0}."""
+    mezcla = {}
+    for parte in texto.split(','):
+        nombre, _, peso = parte.partition('=')
+        mezcla[nombre.strip()] = float(peso) if peso else 1.0
+    return mezcla
+
+
+def interpretar_pragmas(pragmas):
+    """['journal_mode=wal', 'synchronous=1'] -> {'journal_mode': 'wal', 'synchronous': '1'}."""
+    return dict(pragma.split('=', 1) for pragma in pragmas)
+
+
+def percentil(valores_ordenados, porcentaje):
+    """Percentil por rango más cercano de una lista ya ordenada (None si está vacía)."""
+    if not valores_ordenados:
+        return None
+    posicion = max(int(round(porcentaje / 100 * len(valores_ordenados) + 0.5)) - 1, 0)
+    return valores_ordenados[min(posicion, len(valores_ordenados) - 1)]
+
+
+def es_bloqueo(error):
+    return 'database is locked' in str(error)
+
+
+def preparar_base(ruta_db, obras, pragmas, timeout):
+    """Crea las tablas en la base temporal y la llena con `obras` obras de prueba."""
+    from gestionar_obras2 import GestionarObra
+    from modelo_orm2 import db, Obra
+    _inicializar_db(ruta_db, pragmas, timeout)
+    GestionarObra.mapear_orm()
+    azar = random.Random(0)
+    with db.connection_context():
+        filas = [{
+            'nombre': f'Obra de prueba {i}', 'etapa': azar.choice(ETAPAS), 'tipo_obra': azar.choice(TIPOS),
+            'area_responsable': azar.choice(AREAS), 'comuna': azar.randint(1, 15), 'barrio': azar.choice(BARRIOS),
+            'fecha_inicio': '2023-01-01', 'fecha_fin_inicial': '2024-06-30', 'porcentaje_avance': azar.randint(0, 100),
+            'mano_obra': azar.randint(1, 50),
+        } for i in range(obras)]
+        with db.atomic():
+            for inicio in range(0, len(filas), 500):
+                Obra.insert_many(filas[inicio:inicio + 500]).execute()
+
+
+def _inicializar_db(ruta_db, pragmas, timeout):
+    from modelo_orm2 import db, limpiar_cache_diccionarios
+    opciones = {'pragmas': pragmas}
+    if timeout is not None:
+        opciones['timeout'] = timeout
+    db.init(ruta_db, **opciones)
+    limpiar_cache_diccionarios()
+
+
+class Trabajador:
+    """Corre la mezcla de operaciones de un escritor o de un lector y junta sus mediciones."""
+
+    def __init__(self, rol, indice, mezcla, obras, filas_por_carga, directorio):
+        from gestionar_obras2 import GestionarObra
+        from modelo_orm2 import Obra, reintentar
+        self.GestionarObra, self.Obra, self.reintentar = GestionarObra, Obra, reintentar
+        self.rol, self.indice = rol, indice
+        self.azar = random.Random(f'{rol}-{indice}')
+        self.nombres, self.pesos = list(mezcla), list(mezcla.values())
+        self.obras = obras
+        self.filas_por_carga = filas_por_carga
+        self.ruta_rechazos = os.path.join(directorio, f'rechazos_{rol}_{indice}.jsonl')
+        self.cargadas = 0
+        # operacion -> {'latencias': [...], 'ok', 'bloqueos', 'conflictos', 'errores'}
+        self.mediciones = defaultdict(lambda: {'latencias': [], 'ok': 0, 'bloqueos': 0, 'conflictos': 0, 'errores': 0})
+
+    def _obra_al_azar(self):
+        return self.Obra.get_by_id(self.azar.randint(1, self.obras))
+
+    def avance(self):
+        self._obra_al_azar().actualizar_porcentaje_avance(self.azar.randint(0, 100))
+
+    def mano_obra(self):
+        self._obra_al_azar().incrementar_mano_obra(self.azar.randint(1, 5))
+
+    def plazo(self):
+        self._obra_al_azar().incrementar_plazo(self.azar.randint(1, 3))
+
+    def etapa(self):
+        from modelo_orm2 import TransicionInvalida
+        obra_id = self.azar.randint(1, self.obras)
+        try:
+            self.reintentar(lambda: self.Obra.get_by_id(obra_id).nuevo_proyecto())
+        except TransicionInvalida:
+            pass # La obra ya tenía etapa: el UPDATE corrió igual y la regla lo rechazó, no es un error
+
+    def carga(self):
+        import pandas as pd
+        filas = [{
+            'nombre': f'Obra cargada {self.rol}-{self.indice}-{self.cargadas + i}', 'etapa': self.azar.choice(ETAPAS),
+            'tipo': self.azar.choice(TIPOS), 'area_responsable': self.azar.choice(AREAS),
+            'comuna': self.azar.randint(1, 15), 'barrio': self.azar.choice(BARRIOS), 'direccion': None,
+            'lat': -34.6, 'lng': -58.4, 'fecha_inicio': '2024-01-01', 'fecha_fin_inicial': '2025-01-01',
+        } for i in range(self.filas_por_carga)]
+        self.cargadas += len(filas)
+        self.GestionarObra.cargar_datos(pd.DataFrame(filas), self.ruta_rechazos)
+
+    def indicadores(self):
+        self.GestionarObra.calcular_indicadores()
+
+    def listar(self):
+        self.GestionarObra.listar_obras(barrio=self.azar.choice(BARRIOS),
+                                        despues_de=self.azar.randint(0, self.obras), limite=50)
+
+    def obtener(self):
+        self.GestionarObra.obtener_obra(self.azar.randint(1, self.obras))
+
+    def _bloqueos_de_carga(self):
+        """cargar_datos() no lanza: las filas que fallan van al archivo de rechazos con su motivo."""
+        if not os.path.exists(self.ruta_rechazos):
+            return 0
+        with open(self.ruta_rechazos, encoding='utf-8') as archivo:
+            bloqueadas = sum(1 for linea in archivo if es_bloqueo(json.loads(linea)['_motivo']))
+        os.remove(self.ruta_rechazos)
+        return bloqueadas
+
+    def correr(self, duracion):
+        from modelo_orm2 import db, ConflictoConcurrencia
+        db.connect(reuse_if_open=True)
+        fin = time.perf_counter() + duracion
+        try:
+            while time.perf_counter() < fin:
+                nombre = self.azar.choices(self.nombres, self.pesos)[0]
+                medicion = self.mediciones[nombre]
+                inicio = time.perf_counter()
+                try:
+                    getattr(self, nombre)()
+                    resultado = 'ok'
+                except ConflictoConcurrencia:
+                    resultado = 'conflictos'
+                except Exception as e:
+                    resultado = 'bloqueos' if es_bloqueo(e) else 'errores'
+                medicion['latencias'].append(time.perf_counter() - inicio)
+                if nombre == 'carga' and resultado == 'ok' and self._bloqueos_de_carga():
+                    resultado = 'bloqueos'
+                medicion[resultado] += 1
+        finally:
+            if not db.is_closed():
+                db.close()
+        return {nombre: dict(medicion) for nombre, medicion in self.mediciones.items()}
+
+
+def _trabajar(rol, indice, opciones, listos, largada, resultados, en_proceso):
+    """Cuerpo de cada hilo o proceso: se prepara, avisa, espera la largada y corre."""
+    try:
+        if en_proceso:
+            sys.path.insert(0, DIRECTORIO)
+            sys.stdout = open(os.devnull, 'w') # Los métodos del ciclo de vida imprimen cada cambio
+            _inicializar_db(opciones['ruta_db'], opciones['pragmas'], opciones['timeout'])
+        mezcla = opciones['mezcla_escritura'] if rol == 'escritor' else opciones['mezcla_lectura']
+        trabajador = Trabajador(rol, indice, mezcla, opciones['obras'], opciones['filas_por_carga'],
+                                opciones['directorio'])
+        if 'carga' in mezcla:
+            import pandas # Se importa antes de la largada para no medir la importación
+        listos.put(indice)
+        largada.wait()
+        resultados.put((rol, trabajador.correr(opciones['duracion'])))
+    except Exception as e:
+        listos.put(indice)
+        resultados.put((rol, {'_fallo': f'{type(e).__name__}: {e}'}))
+
+
+def ejecutar(opciones, escritores, lectores, modo):
+    """Lanza los escritores y lectores, espera a que terminen y retorna {rol: [mediciones de cada uno]}."""
+    if modo == 'procesos':
+        contexto = multiprocessing.get_context('spawn')
+        listos, resultados, largada = contexto.Queue(), contexto.Queue(), contexto.Event()
+        crear = lambda *args: contexto.Process(target=_trabajar, args=args + (True,))
+    else:
+        listos, resultados, largada = queue.Queue(), queue.Queue(), threading.Event()
+        crear = lambda *args: threading.Thread(target=_trabajar, args=args + (False,))
+
+    trabajadores = [crear(rol, indice, opciones, listos, largada, resultados)
+                    for rol, cantidad in (('escritor', escritores), ('lector', lectores))
+                    for indice in range(cantidad)]
+    for trabajador in trabajadores:
+        trabajador.start()
+    for _ in trabajadores:
+        listos.get()
+    largada.set() # Todos arrancan juntos, ya con los módulos importados
+    por_rol = defaultdict(list)
+    for _ in trabajadores:
+        rol, mediciones = resultados.get()
+        por_rol[rol].append(mediciones)
+    for trabajador in trabajadores:
+        trabajador.join()
+    return por_rol
+
+
+def resumir(por_rol, duracion):
+    """Junta las mediciones de todos los trabajadores por operación y por rol."""
+    resumen = {'operaciones': {}, 'roles': {}, 'fallos': []}
+    for rol, lista in por_rol.items():
+        total_rol = {'latencias': [], 'ok': 0, 'bloqueos': 0, 'conflictos': 0, 'errores': 0}
+        por_operacion = defaultdict(lambda: {'latencias': [], 'ok': 0, 'bloqueos': 0, 'conflictos': 0, 'errores': 0})
+        for mediciones in lista:
+            if '_fallo' in mediciones:
+                resumen['fallos'].append(f"{rol}: {mediciones['_fallo']}")
+                continue
+            for nombre, medicion in mediciones.items():
+                for destino in (por_operacion[nombre], total_rol):
+                    destino['latencias'].extend(medicion['latencias'])
+                    for clave in ('ok', 'bloqueos', 'conflictos', 'errores'):
+                        destino[clave] += medicion[clave]
+        for nombre, medicion in por_operacion.items():
+            resumen['operaciones'][nombre] = dict(_estadisticas(medicion, duracion), rol=rol)
+        resumen['roles'][rol] = dict(_estadisticas(total_rol, duracion), trabajadores=len(lista))
+    return resumen
+
+
+def _estadisticas(medicion, duracion):
+    latencias = sorted(medicion['latencias'])
+    intentos = len(latencias)
+    en_ms = lambda valor: None if valor is None else round(valor * 1000, 2)
+    return {
+        'intentos': intentos,
+        'ok': medicion['ok'],
+        'por_segundo': round(medicion['ok'] / duracion, 1),
+        'p50_ms': en_ms(percentil(latencias, 50)),
+        'p99_ms': en_ms(percentil(latencias, 99)),
+        'bloqueos': medicion['bloqueos'],
+        'porcentaje_bloqueos': round(100 * medicion['bloqueos'] / intentos, 2) if intentos else 0.0,
+        'conflictos': medicion['conflictos'],
+        'errores': medicion['errores'],
+    }
+
+
+def mostrar(resumen, args):
+    print(f"Prueba de concurrencia: {args.escritores} escritor(es) y {args.lectores} lector(es) en {args.modo}, "
+          f"{args.duracion:g} s, pragmas {args.pragma or 'por defecto'}")
+    encabezado = f"{'operación':<14}{'rol':<10}{'ok':>8}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'% locked':>10}{'conflictos':>12}{'errores':>9}"
+    print(encabezado)
+    print('-' * len(encabezado))
+    filas = [(nombre, e['rol'], e) for nombre, e in sorted(resumen['operaciones'].items())]
+    filas += [('TOTAL', rol, e) for rol, e in sorted(resumen['roles'].items())]
+    for nombre, rol, e in filas:
+        p50 = '-' if e['p50_ms'] is None else f"{e['p50_ms']:.2f}"
+        p99 = '-' if e['p99_ms'] is None else f"{e['p99_ms']:.2f}"
+        print(f"{nombre:<14}{rol:<10}{e['ok']:>8}{e['por_segundo']:>10.1f}{p50:>10}{p99:>10}"
+              f"{e['porcentaje_bloqueos']:>10.2f}{e['conflictos']:>12}{e['errores']:>9}")
+    for fallo in resumen['fallos']:
+        print(f"ERROR: un trabajador no pudo correr ({fallo}).")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga con escritores y lectores concurrentes.")
+    parser.add_argument('--escritores', type=int, default=2)
+    parser.add_argument('--lectores', type=int, default=4)
+    parser.add_argument('--modo', choices=['hilos', 'procesos'], default='hilos')
+    parser.add_argument('--duracion', type=float, default=5.0, help="Segundos que corre cada trabajador.")
+    parser.add_argument('--obras', type=int, default=5000, help="Obras con las que se llena la base antes de empezar.")
+    parser.add_argument('--filas-por-carga', type=int, default=50, help="Obras por cada operación 'carga'.")
+    parser.add_argument('--mezcla-escritura', default=MEZCLA_ESCRITURA, help="Pesos de las operaciones de escritura.")
+    parser.add_argument('--mezcla-lectura', default=MEZCLA_LECTURA, help="Pesos de las operaciones de lectura.")
+    parser.add_argument('--pragma', action='append', default=[], metavar='CLAVE=VALOR',
+                        help="PRAGMA de SQLite para cada conexión (por ejemplo journal_mode=wal). Se puede repetir.")
+    parser.add_argument('--timeout', type=float, default=None,
+                        help="Segundos que una conexión espera un bloqueo antes de fallar (por defecto el de peewee).")
+    parser.add_argument('--json', default=None, metavar='RUTA', help="Guarda el resumen en formato JSON.")
+    parser.add_argument('--max-bloqueados', type=float, default=None, metavar='PORCENTAJE',
+                        help="Termina con código 1 si el porcentaje de intentos con 'database is locked' lo supera.")
+    args = parser.parse_args()
+
+    mezclas = {'escritura': interpretar_mezcla(args.mezcla_escritura), 'lectura': interpretar_mezcla(args.mezcla_lectura)}
+    for tipo, mezcla in mezclas.items():
+        desconocidas = [nombre for nombre in mezcla if not callable(getattr(Trabajador, nombre, None))
+                        or nombre.startswith('_') or nombre == 'correr']
+        if desconocidas:
+            parser.error(f"Operaciones de {tipo} desconocidas: {', '.join(desconocidas)}")
+
+    with tempfile.TemporaryDirectory() as directorio:
+        opciones = {
+            'ruta_db': os.path.join(directorio, 'obras_concurrencia.db'),
+            'pragmas': interpretar_pragmas(args.pragma),
+            'timeout': args.timeout,
+            'duracion': args.duracion,
+            'obras': args.obras,
+            'filas_por_carga': args.filas_por_carga,
+            'mezcla_escritura': mezclas['escritura'],
+            'mezcla_lectura': mezclas['lectura'],
+            'directorio': directorio,
+        }
+        # Los métodos de la aplicación imprimen cada operación: se descarta esa salida durante la prueba
+        with contextlib.redirect_stdout(open(os.devnull, 'w')):
+            preparar_base(opciones['ruta_db'], args.obras, opciones['pragmas'], args.timeout)
+            por_rol = ejecutar(opciones, args.escritores, args.lectores, args.modo)
+            from modelo_orm2 import db
+            db.close()
+
+    resumen = resumir(por_rol, args.duracion)
+    resumen['configuracion'] = {clave: valor for clave, valor in vars(args).items() if clave != 'json'}
+    mostrar(resumen, args)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as archivo:
+            json.dump(resumen, archivo, ensure_ascii=False, indent=2)
+        print(f"Resumen guardado en '{args.json}'.")
+
+    if resumen['fallos']:
+        return 1
+    if args.max_bloqueados is not None:
+        intentos = sum(e['intentos'] for e in resumen['roles'].values())
+        bloqueos = sum(e['bloqueos'] for e in resumen['roles'].values())
+        porcentaje = 100 * bloqueos / intentos if intentos else 0.0
+        if porcentaje > args.max_bloqueados:
+            print(f"ERROR: {porcentaje:.2f}% de los intentos falló con 'database is locked' "
+                  f"(máximo {args.max_bloqueados:g}%).")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+import argparse
+import contextlib
+import csv
+import importlib
+import json
+import os
+import random
+import sys
+import tempfile
+
+from instrumentacion import rss_actual, rss_pico, reiniciar_rss_pico
+
+# Chequeo de memoria de la carga del CSV (esquema de modelo_orm2), sin pasos interactivos.
+#
+# Genera un CSV de prueba con --filas obras (en latin-1 y con ';', como el del observatorio),
+# lo pasa por extraer_datos(), limpiar_datos() y cargar_datos() sobre una base temporal y mide
+# cuánto sube el pico de memoria residente (RSS) del proceso durante esas etapas.
+# Las bibliotecas (pandas, pyarrow) y los módulos de la aplicación se importan antes de
+# tomar la medida de base, así que lo que cuestan en memoria no cuenta contra el presupuesto.
+#
+# Termina con código 1 si el crecimiento supera --presupuesto MB por cada 100.000 filas,
+# así se puede usar como chequeo antes de publicar cambios:
+#
+#   python prueba_memoria.py [--filas 100000] [--presupuesto 250] [--json resultado.json]
+#
+# La carga tiene además un costo fijo (unos 40 MB: la base, los lectores, las cachés), que
+# con pocas filas pesa mucho en la cuenta por cada 100.000: el presupuesto por omisión está
+# pensado para las 100.000 filas por omisión.
+#
+# El pico se mide con VmHWM de Linux, que se reinicia después de las importaciones. En otros
+# sistemas no se puede reiniciar y el pico es el del proceso completo.
+
+PRESUPUESTO_MB = 250 # MB de RSS por cada 100.000 filas, sin contar las importaciones
+_MB = 1024 * 1024
+
+# Se importan antes de la medida de base; pyarrow es opcional (ver lectura_csv.py)
+IMPORTACIONES = ('pandas', 'pyarrow', 'pyarrow.csv', 'gestionar_obras2')
+
+BARRIOS = ['Palermo', 'Recoleta', 'Caballito', 'Flores', 'Boedo', 'Belgrano', 'Almagro', 'Liniers', 'Núñez']
+TIPOS = ['Escuelas', 'Espacio Público', 'Hidráulica e Infraestructura', 'Salud', 'Vivienda']
+AREAS = ['Ministerio de Educación', 'Ministerio de Espacio Público', 'Corporación Buenos Aires Sur']
+ETAPAS = ['En Ejecucion', 'Finalizada', 'En Proyecto', 'En Licitación', 'Sin Dato']
+COLUMNAS = ['nombre', 'etapa', 'tipo', 'area_responsable', 'descripcion', 'comuna', 'barrio', 'direccion',
+            'lat', 'lng', 'fecha_inicio', 'fecha_fin_inicial']
+
+
+def generar_csv(ruta, filas, semilla=0):
+    """Escribe un CSV de `filas` obras de prueba, fila por fila para no ocupar memoria al generarlo."""
+    azar = random.Random(semilla)
+    with open(ruta, 'w', encoding='latin-1', newline='') as archivo:
+        escritor = csv.writer(archivo, delimiter=';')
+        escritor.writerow(COLUMNAS)
+        for i in range(filas):
+            sin_coordenadas = azar.random() < 0.1
+            escritor.writerow([
+                f'Obra de prueba {i}', azar.choice(ETAPAS), azar.choice(TIPOS), azar.choice(AREAS),
+                f'Descripción de la obra {i}: ' + 'texto que no se carga ' * azar.randint(1, 8),
+                azar.randint(1, 15), azar.choice(BARRIOS), f'Calle {azar.randint(1, 500)} {azar.randint(1, 9000)}',
+                '' if sin_coordenadas else f'{-34.6 + azar.uniform(-0.1, 0.1):.6f}',
+                '' if sin_coordenadas else f'{-58.4 + azar.uniform(-0.1, 0.1):.6f}',
+                f'{azar.randint(2015, 2024)}-{azar.randint(1, 12):02d}-{azar.randint(1, 28):02d}',
+                'ND' if azar.random() < 0.05 else f'{azar.randint(2025, 2027)}-{azar.randint(1, 12):02d}-01',
+            ])
+
+
+def importar_dependencias():
+    for nombre in IMPORTACIONES:
+        try:
+            importlib.import_module(nombre)
+        except ImportError:
+            pass
+
+
+def medir_carga(ruta_csv, ruta_db, ruta_rechazos):
+    """
+    Corre extraer/limpiar/cargar sobre la base indicada. Retorna un diccionario con la
+    memoria (en bytes) antes de importar, después de importar y el pico durante la carga.
+    """
+    rss_arranque = rss_actual()
+    importar_dependencias()
+    from gestionar_obras2 import GestionarObra
+    from modelo_orm2 import db, limpiar_cache_diccionarios
+
+    db.init(ruta_db)
+    limpiar_cache_diccionarios()
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        GestionarObra.mapear_orm()
+
+        rss_base = rss_actual()
+        reiniciable = reiniciar_rss_pico()
+        df = GestionarObra.extraer_datos(ruta_csv)
+        if df is None:
+            raise RuntimeError(f"No se pudo leer el CSV de prueba '{ruta_csv}'.")
+        filas = len(df)
+        df = GestionarObra.limpiar_datos(df)
+        GestionarObra.cargar_datos(df, ruta_rechazos)
+        del df
+        pico = rss_pico()
+        db.close()
+
+    return {'filas': filas, 'rss_arranque': rss_arranque, 'rss_base': rss_base, 'rss_pico': pico,
+            'pico_reiniciado': reiniciable}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide la memoria de la carga del CSV contra un presupuesto.")
+    parser.add_argument('--filas', type=int, default=100_000, help="Obras del CSV de prueba.")
+    parser.add_argument('--presupuesto', type=float, default=PRESUPUESTO_MB, metavar='MB',
+                        help="Crecimiento máximo del pico de RSS por cada 100.000 filas, sin las importaciones.")
+    parser.add_argument('--json', default=None, metavar='RUTA', help="Guarda el resultado en formato JSON.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta_csv = os.path.join(directorio, 'obras_memoria.csv')
+        generar_csv(ruta_csv, args.filas)
+        tamanio = os.path.getsize(ruta_csv)
+        medicion = medir_carga(ruta_csv, os.path.join(directorio, 'obras_memoria.db'),
+                               os.path.join(directorio, 'filas_rechazadas.csv'))
+
+    if medicion['rss_base'] is None or medicion['rss_pico'] is None:
+        print("ERROR: este sistema no informa la memoria residente del proceso.")
+        return 1
+    importaciones = (medicion['rss_base'] - medicion['rss_arranque']) / _MB
+    crecimiento = (medicion['rss_pico'] - medicion['rss_base']) / _MB
+    por_100k = crecimiento / medicion['filas'] * 100_000 if medicion['filas'] else 0.0
+    excedido = por_100k > args.presupuesto
+
+    print(f"CSV de prueba: {medicion['filas']} filas, {tamanio / _MB:.1f} MB")
+    print(f"Importaciones: {importaciones:.1f} MB (no cuentan para el presupuesto)")
+    print(f"Carga: el pico de RSS subió {crecimiento:.1f} MB = {por_100k:.1f} MB por cada 100.000 filas "
+          f"(presupuesto {args.presupuesto:g} MB)")
+    if not medicion['pico_reiniciado']:
+        print("Aviso: el pico de RSS no se pudo reiniciar después de las importaciones; es el del proceso completo.")
+
+    if args.json:
+        resultado = {
+            'filas': medicion['filas'], 'csv_mb': round(tamanio / _MB, 1), 'importaciones_mb': round(importaciones, 1),
+            'crecimiento_mb': round(crecimiento, 1), 'mb_por_100k_filas': round(por_100k, 1),
+            'presupuesto_mb': args.presupuesto, 'excedido': excedido,
+        }
+        with open(args.json, 'w', encoding='utf-8') as archivo:
+            json.dump(resultado, archivo, ensure_ascii=False, indent=2)
+        print(f"Resultado guardado en '{args.json}'.")
+
+    if excedido:
+        print("ERROR: la carga supera el presupuesto de memoria.")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
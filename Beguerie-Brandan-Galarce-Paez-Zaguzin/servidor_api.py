@@ -0,0 +1,221 @@
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
+
+from gestionar_obras2 import GestionarObra, cache_consultas
+from modelo_orm2 import db, version_datos
+
+# API HTTP de solo lectura sobre la base de obras.
+#
+# Rutas:
+#   GET /indicadores                      -> GestionarObra.calcular_indicadores()
+#   GET /obras?etapa=&barrio=&comuna=&despues_de=&limite=
+#                                         -> listado paginado por clave sobre Obra.id
+#   GET /obras/<id>                       -> una obra
+#   GET /cache                            -> estadísticas de la caché de consultas (sin ETag)
+#
+# Todas las respuestas llevan un ETag armado con el contador de cambios de la tabla
+# (ver modelo_orm2.version_datos). Si el cliente manda If-None-Match con ese mismo
+# valor se responde 304 sin ejecutar la consulta, así un tablero que consulta
+# periódicamente no le cuesta casi nada a la base mientras los datos no cambien.
+
+LIMITE_POR_DEFECTO = 50
+LIMITE_MAXIMO = 500
+
+ESTADOS_HTTP = {
+    200: 'OK',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    500: 'Internal Server Error',
+}
+
+
+class ErrorHTTP(Exception):
+    """Error que se traduce directamente en una respuesta HTTP con el código indicado."""
+
+    def __init__(self, estado, mensaje):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.mensaje = mensaje
+
+
+def _en_conexion(funcion, *args, **kwargs):
+    """Ejecuta `funcion` con una conexión abierta en el hilo actual (peewee usa una conexión por hilo)."""
+    with db.connection_context():
+        return funcion(*args, **kwargs)
+
+
+def _parametro_entero(parametros, nombre, por_defecto=None):
+    valores = parametros.get(nombre)
+    if not valores or valores[0] == '':
+        return por_defecto
+    try:
+        return int(valores[0])
+    except ValueError:
+        raise ErrorHTTP(400, f"El parámetro '{nombre}' debe ser un número entero.")
+
+
+def _parametro_texto(parametros, nombre):
+    valores = parametros.get(nombre)
+    return valores[0] if valores else None
+
+
+def resolver_ruta(ruta, parametros):
+    """
+    Traduce una ruta y sus parámetros en la función de lectura a ejecutar.
+    Retorna una función sin argumentos que hace la consulta y devuelve un objeto serializable a JSON.
+    """
+    partes = [parte for parte in ruta.split('/') if parte]
+
+    if partes == ['indicadores']:
+        return GestionarObra.calcular_indicadores
+
+    if partes == ['cache']:
+        return cache_consultas.estadisticas
+
+    if partes == ['obras']:
+        limite = _parametro_entero(parametros, 'limite', LIMITE_POR_DEFECTO)
+        if not 1 <= limite <= LIMITE_MAXIMO:
+            raise ErrorHTTP(400, f"El parámetro 'limite' debe estar entre 1 y {LIMITE_MAXIMO}.")
+        filtros = {
+            'etapa': _parametro_texto(parametros, 'etapa'),
+            'barrio': _parametro_texto(parametros, 'barrio'),
+            'comuna': _parametro_entero(parametros, 'comuna'),
+            'despues_de': _parametro_entero(parametros, 'despues_de', 0),
+            'limite': limite,
+        }
+
+        def listar():
+            obras, siguiente = GestionarObra.listar_obras(**filtros)
+            return {'obras': obras, 'siguiente': siguiente}
+        return listar
+
+    if len(partes) == 2 and partes[0] == 'obras':
+        try:
+            obra_id = int(partes[1])
+        except ValueError:
+            raise ErrorHTTP(400, "El id de la obra debe ser un número entero.")
+
+        def obtener():
+            obra = GestionarObra.obtener_obra(obra_id)
+            if obra is None:
+                raise ErrorHTTP(404, f"No existe la obra con id {obra_id}.")
+            return obra
+        return obtener
+
+    raise ErrorHTTP(404, f"Ruta no encontrada: {ruta}")
+
+
+class ServidorObras:
+    """
+    Servidor HTTP asíncrono (asyncio) de solo lectura.
+    Las consultas a SQLite son bloqueantes, así que se ejecutan en un pool de hilos acotado
+    para no frenar el bucle de eventos ni abrir conexiones sin límite.
+    """
+
+    def __init__(self, host='127.0.0.1', puerto=8000, max_hilos=4):
+        self.host = host
+        self.puerto = puerto
+        self.executor = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix='obras-db')
+
+    async def _en_pool(self, funcion, *args):
+        bucle = asyncio.get_running_loop()
+        return await bucle.run_in_executor(self.executor, _en_conexion, funcion, *args)
+
+    async def atender(self, lector, escritor):
+        """Atiende una conexión; soporta keep-alive para que el polling reutilice el socket."""
+        try:
+            while True:
+                linea = await lector.readline()
+                if not linea:
+                    break
+                try:
+                    metodo, destino, _ = linea.decode('latin-1').split(' ', 2)
+                except ValueError:
+                    await self._responder(escritor, 400, {'error': 'Petición mal formada.'}, cerrar=True)
+                    break
+
+                encabezados = {}
+                while True:
+                    linea = await lector.readline()
+                    if linea in (b'\r\n', b'\n', b''):
+                        break
+                    nombre, _, valor = linea.decode('latin-1').partition(':')
+                    encabezados[nombre.strip().lower()] = valor.strip()
+
+                cerrar = encabezados.get('connection', '').lower() == 'close'
+                estado, cuerpo, etag = await self.procesar(metodo, destino, encabezados.get('if-none-match'))
+                await self._responder(escritor, estado, cuerpo, etag=etag, cerrar=cerrar)
+                if cerrar:
+                    break
+        except (ConnectionResetError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            escritor.close()
+
+    async def procesar(self, metodo, destino, if_none_match):
+        """Retorna (estado, cuerpo, etag) para una petición ya parseada."""
+        if metodo != 'GET':
+            return 405, {'error': 'Solo se admiten peticiones GET.'}, None
+
+        partes = urlsplit(destino)
+        try:
+            consulta = resolver_ruta(partes.path, parse_qs(partes.query))
+            if consulta == cache_consultas.estadisticas:
+                return 200, consulta(), None # Cambian con cada consulta: no llevan ETag
+            # El ETag solo depende del contador de cambios: si coincide, no hace falta consultar.
+            etag = f'"{await self._en_pool(version_datos)}"'
+            if if_none_match and etag in [valor.strip() for valor in if_none_match.split(',')]:
+                return 304, None, etag
+            return 200, await self._en_pool(consulta), etag
+        except ErrorHTTP as e:
+            return e.estado, {'error': e.mensaje}, None
+        except Exception as e:
+            print(f"Error al atender {destino}: {e}")
+            return 500, {'error': 'Error interno del servidor.'}, None
+
+    async def _responder(self, escritor, estado, cuerpo, etag=None, cerrar=False):
+        datos = b'' if cuerpo is None else json.dumps(cuerpo, ensure_ascii=False, default=str).encode('utf-8')
+        encabezados = [
+            f'HTTP/1.1 {estado} {ESTADOS_HTTP[estado]}',
+            'Content-Type: application/json; charset=utf-8',
+            f'Content-Length: {len(datos)}',
+            'Cache-Control: no-cache', # El cliente debe revalidar siempre con If-None-Match
+            f"Connection: {'close' if cerrar else 'keep-alive'}",
+        ]
+        if etag:
+            encabezados.append(f'ETag: {etag}')
+        escritor.write(('\r\n'.join(encabezados) + '\r\n\r\n').encode('latin-1') + datos)
+        await escritor.drain()
+
+    async def iniciar(self):
+        servidor = await asyncio.start_server(self.atender, self.host, self.puerto)
+        print(f"API de obras escuchando en http://{self.host}:{self.puerto}")
+        try:
+            async with servidor:
+                await servidor.serve_forever()
+        finally:
+            self.executor.shutdown(wait=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API HTTP de solo lectura sobre la base de obras.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--puerto', type=int, default=8000)
+    parser.add_argument('--hilos', type=int, default=4, help="Cantidad máxima de hilos para consultar la base.")
+    args = parser.parse_args()
+
+    # Nos aseguramos de que existan las tablas y el contador de cambios
+    GestionarObra.mapear_orm()
+    try:
+        asyncio.run(ServidorObras(args.host, args.puerto, args.hilos).iniciar())
+    except KeyboardInterrupt:
+        print("\nServidor detenido.")
+
+
+if __name__ == "__main__":
+    main()